@@ -0,0 +1,373 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Audio Engine
+--------------------------------------------------------------------------
+
+Real-time hum synthesis driven by the speaker_vol value that
+mpu6050.get_sensor_data() computes (0 - 100 from comb_accel_gyro, forced
+to 100 during a flash).
+
+The hum is read from two precomputed single-cycle wavetables:
+
+- HUM: a low fundamental (HUM_FREQUENCY) with a few harmonics
+- SWING: a brighter, slightly detuned version that is mixed in with motion
+
+speaker_vol sets three things per block: the level (IDLE_LEVEL at rest up
+to full), the swing mix and a pitch rise of up to PITCH_RANGE.  Changes
+are ramped linearly across a block, so there are no clicks when the
+motion jumps between IMU samples.
+
+Audio is produced in fixed-size blocks (block_size mono S16_LE samples)
+into two preallocated buffers used in turn: while a sink may still hold
+the previous block, the next one is rendered into the other buffer, so
+nothing is allocated per block.  The engine runs in its own thread and
+only reads plain attributes set by the IMU / LED side (no locks), so an
+audio underrun can never stall the LED loop; late blocks are counted in
+underruns.  Sinks that do not pace themselves (WAV file, pipe) are paced
+by the engine when realtime is True.
+
+With a sound font (soundfont.py), sounds are mixed on top of the hum by
+a voice mixer (mixer.py): play("clash") can be called from the IMU side
+and the sound starts in the next block.  update() plays "clash" when a
+flash starts, and set_on() plays "ignition" / "retraction" when the blade
+turns on / off, for the categories the font has.  All of these must be
+called from one thread (the runtime's event loop), since the mixer's
+trigger queue has a single producer.  Sounds are resampled to the engine
+rate through the font's LRU cache (cache_bytes): the PRELOAD categories
+(clash, ignition) when the engine is created, as far as they fit, so
+their play() does not process audio; any other sound when it is first
+played.
+
+With NumPy the blocks are computed with array operations; otherwise a
+pure Python loop over the tables is used.
+
+Software API:
+
+  AudioEngine(sink, sample_rate=22050, block_size=128, realtime=True,
+              use_numpy=None, font=None, voices=8)
+    start(), stop()             - Run in a background thread
+    set_on(on)                  - Blade lit (hum) or off (fade out)
+    set_speaker_vol(volume)     - 0 - 100
+    update(data)                - Take speaker_vol (and flash) from
+                                  get_sensor_data()
+    play(sound, gain=1.0)       - Play a font sound or category
+    render_block()              - Render the next block (memoryview)
+    blocks, underruns
+    mixer                       - mixer.VoiceMixer (None without a font)
+
+Running this file renders a few seconds of a swinging blade to a sink
+(default hum.wav) and prints the render cost per block; with --font it
+also clashes every second and prints the trigger-to-output latency.
+
+--------------------------------------------------------------------------
+"""
+
+import array
+import math
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from mixer import VoiceMixer, VOICES
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+SAMPLE_RATE = 22050
+BLOCK_SIZE = 128                    # Samples per block (5.8 ms at 22050 Hz),
+                                    # the worst case wait for a sound to start
+
+TABLE_SIZE = 2048                   # Must be a power of two
+TABLE_MASK = TABLE_SIZE - 1
+
+HUM_FREQUENCY = 90.0                # Hz
+HUM_HARMONICS = ((1, 1.0), (2, 0.45), (3, 0.3), (4, 0.12), (6, 0.06))
+SWING_HARMONICS = ((1, 1.0), (2, 0.6), (3, 0.5), (5, 0.35), (7, 0.2), (9, 0.1))
+SWING_DETUNE = 1.012                # Swing table runs slightly sharp (beating)
+
+IDLE_LEVEL = 0.35                   # Hum level with the blade at rest
+PITCH_RANGE = 0.2                   # Pitch rise at speaker_vol 100
+FULL_SCALE = 0.7 * 32767            # Peak sample value at full level
+
+PRELOAD = ("clash", "ignition")     # Resampled at startup, within the cache
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def make_wavetable(harmonics, size=TABLE_SIZE):
+    """Return one cycle of a sum of (harmonic, amplitude), peak 1.0."""
+    table = [sum(amplitude * math.sin(2.0 * math.pi * harmonic * i / size)
+                 for harmonic, amplitude in harmonics)
+             for i in range(size)]
+    peak = max(abs(value) for value in table)
+    return [value / peak for value in table]
+
+
+class AudioEngine(object):
+    """Wavetable hum synthesiser feeding a sink from its own thread."""
+
+    def __init__(self, sink, sample_rate=SAMPLE_RATE, block_size=BLOCK_SIZE,
+                 realtime=True, use_numpy=None, font=None, voices=VOICES):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.realtime = realtime
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ImportError("NumPy is not installed")
+
+        self.blocks = 0
+        self.underruns = 0
+
+        hum = make_wavetable(HUM_HARMONICS)
+        swing = make_wavetable(SWING_HARMONICS)
+        self._blocks = [bytearray(block_size * 2), bytearray(block_size * 2)]
+        self._index = 0
+
+        if self.use_numpy:
+            self._hum = np.array(hum, dtype=np.float32)
+            self._swing = np.array(swing, dtype=np.float32)
+            self._ramp = np.arange(block_size, dtype=np.float64) / block_size
+            self._views = [np.frombuffer(block, dtype="<i2") for block in self._blocks]
+        else:
+            self._hum = hum
+            self._swing = swing
+            self._out = [0.0] * block_size
+            self._samples = array.array("h", bytes(block_size * 2))
+
+        self.font = font
+        self.mixer = None
+        if font is not None:
+            self.mixer = VoiceMixer(block_size, voices, self.use_numpy)
+            self._preload()
+
+        # Set from other threads; plain float / bool assignments only
+        self._on = False
+        self._speaker_vol = 0.0
+        self._flash = False
+
+        # Audio thread state: current (ramped) parameters and phases
+        self._level = 0.0
+        self._motion = 0.0
+        self._hum_phase = 0.0
+        self._swing_phase = 0.0
+
+        self._thread = None
+        self._running = False
+
+    def _preload(self):
+        """Resample the PRELOAD categories while they fit in the font cache."""
+        budget = self.font.cache_bytes
+        for category in PRELOAD:
+            for name in self.font.categories.get(category, ()):
+                entry = self.font.info(name)
+                size = 2 * int(entry["frames"] * self.sample_rate / entry["rate"])
+                if size > budget:
+                    return
+                budget -= size
+                self.font.variant(name, self.sample_rate)
+
+    # -----------------------------------------------------
+    # Control (any thread)
+    # -----------------------------------------------------
+
+    def set_on(self, on):
+        on = bool(on)
+        if on != self._on:
+            self.play("ignition" if on else "retraction")
+        self._on = on
+
+    def set_speaker_vol(self, volume):
+        self._speaker_vol = min(100.0, max(0.0, float(volume)))
+
+    def update(self, data):
+        """Take speaker_vol from a get_sensor_data() dictionary."""
+        self.set_speaker_vol(data["speaker_vol"])
+        flash = bool(data.get("flash"))
+        if flash and not self._flash and self._on:
+            self.play("clash")
+        self._flash = flash
+
+    def play(self, sound, gain=1.0):
+        """Start a sound (name or category); return False if not played."""
+        if self.mixer is None:
+            return False
+        if sound in self.font.categories:
+            sound = self.font.choose(sound)
+        elif sound not in self.font.names:
+            return False
+        return self.mixer.trigger(self.font.variant(sound, self.sample_rate), gain)
+
+    # -----------------------------------------------------
+    # Rendering (audio thread)
+    # -----------------------------------------------------
+
+    def _targets(self):
+        motion = self._speaker_vol / 100.0
+        level = (IDLE_LEVEL + (1.0 - IDLE_LEVEL) * motion) if self._on else 0.0
+        return level, motion
+
+    def render_block(self):
+        """Render the next block into the other buffer; return a memoryview."""
+        level, motion = self._targets()
+        self._index ^= 1
+        if self.use_numpy:
+            self._render_numpy(level, motion)
+        else:
+            self._render_python(level, motion)
+        self._level, self._motion = level, motion
+        self.blocks += 1
+        return memoryview(self._blocks[self._index])
+
+    def _steps(self, motion):
+        step = TABLE_SIZE * HUM_FREQUENCY * (1.0 + PITCH_RANGE * motion) / self.sample_rate
+        return step, step * SWING_DETUNE
+
+    def _render_numpy(self, level, motion):
+        ramp = self._ramp
+        hum_step0, swing_step0 = self._steps(self._motion)
+        hum_step1, swing_step1 = self._steps(motion)
+
+        hum_phase = self._hum_phase + np.cumsum(hum_step0 + (hum_step1 - hum_step0) * ramp)
+        swing_phase = self._swing_phase + np.cumsum(
+            swing_step0 + (swing_step1 - swing_step0) * ramp)
+        self._hum_phase = float(hum_phase[-1]) % TABLE_SIZE
+        self._swing_phase = float(swing_phase[-1]) % TABLE_SIZE
+
+        mix = self._motion + (motion - self._motion) * ramp
+        gain = FULL_SCALE * (self._level + (level - self._level) * ramp)
+        hum = self._hum[hum_phase.astype(np.int64) & TABLE_MASK]
+        swing = self._swing[swing_phase.astype(np.int64) & TABLE_MASK]
+        out = (hum + (swing - hum) * mix) * gain
+        if self.mixer is not None:
+            self.mixer.mix(out)
+        self._views[self._index][:] = out
+
+    def _render_python(self, level, motion):
+        n = self.block_size
+        hum_table, swing_table = self._hum, self._swing
+        hum_step, swing_step = self._steps(self._motion)
+        hum_step1, swing_step1 = self._steps(motion)
+        hum_delta = (hum_step1 - hum_step) / n
+        swing_delta = (swing_step1 - swing_step) / n
+        mix, mix_delta = self._motion, (motion - self._motion) / n
+        gain = FULL_SCALE * self._level
+        gain_delta = FULL_SCALE * (level - self._level) / n
+        hum_phase, swing_phase = self._hum_phase, self._swing_phase
+        out = self._out
+
+        for i in range(n):
+            hum_phase += hum_step
+            swing_phase += swing_step
+            hum_step += hum_delta
+            swing_step += swing_delta
+            hum = hum_table[int(hum_phase) & TABLE_MASK]
+            swing = swing_table[int(swing_phase) & TABLE_MASK]
+            out[i] = (hum + (swing - hum) * mix) * gain
+            mix += mix_delta
+            gain += gain_delta
+
+        self._hum_phase = hum_phase % TABLE_SIZE
+        self._swing_phase = swing_phase % TABLE_SIZE
+        if self.mixer is not None:
+            self.mixer.mix(out)
+        samples = self._samples
+        for i in range(n):
+            samples[i] = int(out[i])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        self._blocks[self._index][:] = samples.tobytes()
+
+    # -----------------------------------------------------
+    # Thread
+    # -----------------------------------------------------
+
+    def start(self):
+        """Render and write blocks to the sink in a background thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="lightsaber-audio")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and close the sink."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sink.close()
+
+    def _run(self):
+        period = self.block_size / float(self.sample_rate)
+        pace = self.realtime and not self.sink.blocking
+        deadline = time.monotonic()
+        while self._running:
+            if not self.sink.write(self.render_block()):
+                self.underruns += 1
+            if self.mixer is not None:
+                self.mixer.delivered()
+            if pace:
+                deadline += period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.underruns += 1     # A device would have run dry
+                    deadline -= delay
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    from sinks import open_sink
+
+    parser = argparse.ArgumentParser(description="Render the lightsaber hum")
+    parser.add_argument("--sink", default="wav:hum.wav",
+                        help="wav:PATH, pipe:COMMAND, pipe:-, alsa[:DEVICE] or null")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--no-numpy", action="store_true")
+    parser.add_argument("--font", help="Sound font directory; clash every second")
+    args = parser.parse_args()
+
+    font = None
+    if args.font:
+        from soundfont import SoundFont
+        font = SoundFont(args.font)
+
+    sink = open_sink(args.sink, SAMPLE_RATE, BLOCK_SIZE)
+    engine = AudioEngine(sink, realtime=False,
+                         use_numpy=False if args.no_numpy else None, font=font)
+    engine.set_on(True)
+    clash_every = int(SAMPLE_RATE / BLOCK_SIZE)
+
+    blocks = int(args.seconds * SAMPLE_RATE / BLOCK_SIZE)
+    render_time = 0.0
+    for i in range(blocks):
+        t = i * BLOCK_SIZE / float(SAMPLE_RATE)
+        engine.set_speaker_vol(100.0 * abs(math.sin(t * 1.5)) ** 2)  # Swinging
+        if font is not None and i % clash_every == clash_every // 2:
+            engine.play("clash")
+        start = time.perf_counter()
+        block = engine.render_block()
+        render_time += time.perf_counter() - start
+        sink.write(block)
+        if engine.mixer is not None:
+            engine.mixer.delivered()
+    sink.close()
+
+    print("{0} blocks, {1:.1f} us per block ({2:.1%} of real time)".format(
+        blocks, render_time / blocks * 1e6,
+        render_time / (blocks * BLOCK_SIZE / float(SAMPLE_RATE))))
+    if engine.mixer is not None:
+        print("{0} sounds, trigger to output {1:.2f} ms max".format(
+            engine.mixer.triggers, engine.mixer.max_latency * 1e3))
@@ -0,0 +1,230 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Voice Mixer
+--------------------------------------------------------------------------
+
+Plays sound font samples (clash, ignition, ...) on top of the hum with
+low trigger latency.
+
+- A fixed pool of voices is preallocated; a trigger takes a free voice or
+  steals the oldest one, so nothing is allocated on the audio thread.
+- Triggers come from the IMU / detector thread through TriggerQueue, a
+  single-producer single-consumer ring of preallocated slots with
+  separate head and tail counters: the producer only writes the tail, the
+  consumer only the head, so neither side ever takes a lock or waits.
+- Per audio block, every active voice's next block_size samples are
+  scaled into one row of a preallocated (voices, block_size) array and
+  all rows are added to the hum with a single sum over the voice axis.
+- A peak limiter keeps the sum below CEILING: it pulls the gain down
+  within the block that would clip and lets it recover by RELEASE per
+  block.
+
+Trigger-to-output latency (trigger() until the block holding the start of
+the sound has been written to the sink) is kept in last_latency and
+max_latency, and recorded as "sound" in a latency.LatencyMonitor set as
+mixer.latency.  It is at most one block plus the render time.
+
+Software API:
+
+  TriggerQueue(capacity=16)
+    put(item), get(), dropped
+
+  VoiceMixer(block_size, voices=8, use_numpy=None)
+    trigger(samples, gain=1.0)  - Any thread; samples are int16 (memoryview)
+    mix(out)                    - Audio thread: add voices to the float
+                                  block out, limit, in place
+    delivered()                 - Audio thread: after the block was written
+    active, triggers, stolen, last_latency, max_latency
+    latency                     - Optional latency.LatencyMonitor
+
+--------------------------------------------------------------------------
+"""
+
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+VOICES = 8
+QUEUE_CAPACITY = 16
+
+CEILING = 32000.0                   # Peak sample value after the limiter
+RELEASE = 0.05                      # Limiter gain recovery per block
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class TriggerQueue(object):
+    """Lock-free single-producer single-consumer ring of items."""
+
+    def __init__(self, capacity=QUEUE_CAPACITY):
+        self.capacity = capacity
+        self.dropped = 0
+        self._slots = [None] * capacity
+        self._head = 0                  # Written by the consumer only
+        self._tail = 0                  # Written by the producer only
+
+    def put(self, item):
+        """Add item (producer); return False and drop it if the ring is full."""
+        tail = self._tail
+        if tail - self._head >= self.capacity:
+            self.dropped += 1
+            return False
+        self._slots[tail % self.capacity] = item
+        self._tail = tail + 1           # Publish after the slot is written
+        return True
+
+    def get(self):
+        """Return the oldest item (consumer), or None if the ring is empty."""
+        head = self._head
+        if head == self._tail:
+            return None
+        index = head % self.capacity
+        item = self._slots[index]
+        self._slots[index] = None
+        self._head = head + 1
+        return item
+
+
+class _Voice(object):
+    __slots__ = ("samples", "position", "gain", "trigger_time", "started")
+
+    def __init__(self):
+        self.samples = None
+        self.position = 0
+        self.gain = 1.0
+        self.trigger_time = 0.0
+        self.started = False
+
+
+class VoiceMixer(object):
+    """Fixed pool of sample voices mixed into audio blocks, with a limiter."""
+
+    def __init__(self, block_size, voices=VOICES, use_numpy=None):
+        self.block_size = block_size
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ImportError("NumPy is not installed")
+
+        self.queue = TriggerQueue()
+        self.triggers = 0
+        self.stolen = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.latency = None
+
+        self._voices = [_Voice() for _ in range(voices)]
+        self._gain = 1.0
+        if self.use_numpy:
+            self._rows = np.zeros((voices, block_size), dtype=np.float32)
+            self._ramp = np.arange(1, block_size + 1, dtype=np.float64) / block_size
+
+    @property
+    def active(self):
+        return sum(1 for voice in self._voices if voice.samples is not None)
+
+    def trigger(self, samples, gain=1.0):
+        """Start playing samples; safe to call from the detector thread."""
+        return self.queue.put((samples, gain, time.perf_counter()))
+
+    def _start_voices(self):
+        while True:
+            command = self.queue.get()
+            if command is None:
+                return
+            samples, gain, trigger_time = command
+            voice = None
+            for candidate in self._voices:
+                if candidate.samples is None:
+                    voice = candidate
+                    break
+            if voice is None:
+                voice = min(self._voices, key=lambda v: v.trigger_time)
+                self.stolen += 1
+            voice.samples = samples
+            voice.position = 0
+            voice.gain = gain
+            voice.trigger_time = trigger_time
+            voice.started = False
+            self.triggers += 1
+
+    def mix(self, out):
+        """Add every active voice to out (a block of floats) and limit it."""
+        self._start_voices()
+        if self.use_numpy:
+            self._mix_numpy(out)
+        else:
+            self._mix_python(out)
+
+    def _mix_numpy(self, out):
+        n = self.block_size
+        rows = 0
+        for voice in self._voices:
+            if voice.samples is None:
+                continue
+            chunk = np.frombuffer(voice.samples[voice.position:voice.position + n],
+                                  dtype="<i2")
+            row = self._rows[rows]
+            np.multiply(chunk, voice.gain, out=row[:len(chunk)], casting="unsafe")
+            row[len(chunk):] = 0.0
+            rows += 1
+            self._advance(voice, len(chunk))
+        if rows:
+            out += self._rows[:rows].sum(axis=0)
+
+        peak = float(np.abs(out).max()) if n else 0.0
+        gain = self._next_gain(peak)
+        if gain != 1.0 or self._gain != 1.0:
+            out *= self._gain + (gain - self._gain) * self._ramp
+        self._gain = gain
+        np.clip(out, -CEILING, CEILING, out=out)
+
+    def _mix_python(self, out):
+        n = self.block_size
+        for voice in self._voices:
+            if voice.samples is None:
+                continue
+            chunk = voice.samples[voice.position:voice.position + n]
+            gain = voice.gain
+            for i in range(len(chunk)):
+                out[i] += chunk[i] * gain
+            self._advance(voice, len(chunk))
+
+        peak = max(abs(value) for value in out) if n else 0.0
+        gain = self._next_gain(peak)
+        start, step = self._gain, (gain - self._gain) / n
+        for i in range(n):
+            start += step
+            out[i] = min(CEILING, max(-CEILING, out[i] * start))
+        self._gain = gain
+
+    def _advance(self, voice, count):
+        voice.position += count
+        if voice.position >= len(voice.samples):
+            voice.samples = None
+
+    def _next_gain(self, peak):
+        """Limiter gain at the end of this block."""
+        target = CEILING / peak if peak > CEILING else 1.0
+        return min(target, self._gain + RELEASE)
+
+    def delivered(self):
+        """Record trigger-to-output latency of sounds started in this block."""
+        now = None
+        for voice in self._voices:
+            if voice.started or voice.trigger_time == 0.0:
+                continue
+            voice.started = True
+            now = now or time.perf_counter()
+            latency = now - voice.trigger_time
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            if self.latency is not None:
+                self.latency.record("sound", latency)
@@ -0,0 +1,144 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Audio Sinks
+--------------------------------------------------------------------------
+
+Outputs for blocks of mono signed 16-bit little-endian PCM from the audio
+engine (engine.py).  Every sink has the same small interface:
+
+    write(block)    - Write one block (bytes-like, block_size * 2 bytes);
+                      return False if the device under-ran (xrun)
+    close()
+    blocking        - True if write() itself waits for the device, i.e.
+                      paces the engine in real time
+
+Sinks:
+
+    WavSink(path, sample_rate)          - WAV file, for headless testing
+    PipeSink(stream=None, command=None) - Raw PCM to a stream or to the
+                                          stdin of a command, e.g.
+                                          "aplay -q -f S16_LE -r 22050 -c 1"
+    AlsaSink(sample_rate, block_size, device="default")
+                                        - ALSA through pyalsaaudio, on the
+                                          board
+    NullSink()                          - Discards blocks (benchmarks)
+
+open_sink(spec, sample_rate, block_size) builds one from a string:
+"wav:/tmp/hum.wav", "pipe:aplay -q ...", "pipe:-" (stdout), "alsa" or
+"alsa:hw:0,0", and "null".
+
+--------------------------------------------------------------------------
+"""
+
+import subprocess
+import sys
+import wave
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+SAMPLE_WIDTH = 2                    # Bytes per sample (S16_LE)
+CHANNELS = 1
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class NullSink(object):
+    """Discards every block."""
+
+    blocking = False
+
+    def write(self, block):
+        return True
+
+    def close(self):
+        pass
+
+
+class WavSink(object):
+    """Writes blocks to a mono 16-bit WAV file."""
+
+    blocking = False
+
+    def __init__(self, path, sample_rate):
+        self._wav = wave.open(path, "wb")
+        self._wav.setnchannels(CHANNELS)
+        self._wav.setsampwidth(SAMPLE_WIDTH)
+        self._wav.setframerate(sample_rate)
+
+    def write(self, block):
+        self._wav.writeframesraw(block)
+        return True
+
+    def close(self):
+        self._wav.close()
+
+
+class PipeSink(object):
+    """Writes raw PCM to a binary stream or to a command's stdin."""
+
+    blocking = False
+
+    def __init__(self, stream=None, command=None):
+        self._process = None
+        if command is not None:
+            self._process = subprocess.Popen(command, shell=True,
+                                             stdin=subprocess.PIPE)
+            stream = self._process.stdin
+        self._stream = stream if stream is not None else sys.stdout.buffer
+
+    def write(self, block):
+        try:
+            self._stream.write(block)
+        except BrokenPipeError:
+            return False
+        return True
+
+    def close(self):
+        try:
+            self._stream.flush()
+        except BrokenPipeError:
+            pass
+        if self._process is not None:
+            self._stream.close()
+            self._process.wait()
+
+
+class AlsaSink(object):
+    """Plays blocks on an ALSA device; write() blocks at the device rate."""
+
+    blocking = True
+
+    def __init__(self, sample_rate, block_size, device="default"):
+        import alsaaudio
+
+        self._pcm = alsaaudio.PCM(alsaaudio.PCM_PLAYBACK, device=device)
+        self._pcm.setchannels(CHANNELS)
+        self._pcm.setrate(sample_rate)
+        self._pcm.setformat(alsaaudio.PCM_FORMAT_S16_LE)
+        self._pcm.setperiodsize(block_size)
+
+    def write(self, block):
+        # pyalsaaudio returns a negative value (-EPIPE) after an underrun
+        return self._pcm.write(block) >= 0
+
+    def close(self):
+        self._pcm.close()
+
+
+def open_sink(spec, sample_rate, block_size):
+    """Return the sink described by spec (see the module docstring)."""
+    kind, _, argument = spec.partition(":")
+    if kind == "wav":
+        return WavSink(argument, sample_rate)
+    if kind == "pipe":
+        if argument in ("", "-"):
+            return PipeSink()
+        return PipeSink(command=argument)
+    if kind == "alsa":
+        return AlsaSink(sample_rate, block_size, argument or "default")
+    if kind == "null":
+        return NullSink()
+    raise ValueError("Unknown audio sink {0!r}".format(spec))
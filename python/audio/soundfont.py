@@ -0,0 +1,326 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Sound Font
+--------------------------------------------------------------------------
+
+Loads a directory of WAV files (clash, ignition, retraction, swing, ...)
+without decoding them:
+
+- Indexing only reads each file's RIFF chunk headers to find the PCM data
+  (offset, length, rate, channels).  The index is saved to INDEX_FILE in
+  the directory, and later startups load it instead of scanning, as long
+  as the directory's modification time is unchanged (adding, removing or
+  renaming files changes it).  A file whose size or mtime no longer
+  matches its entry is re-indexed when it is opened.
+- PCM data is mmapped when first used, so samples(name) is a zero-copy
+  memoryview of 16-bit samples straight from the page cache.
+- Variants that need processing (resampled to the engine rate, downmixed
+  to mono or scaled in volume) are kept in a small LRU cache limited to
+  cache_bytes.
+
+Sounds are grouped into categories by file name without digits, e.g.
+clash1.wav, clash2.wav -> "clash"; choose(category) cycles through them.
+
+Only 16-bit PCM WAV files are supported; others are skipped with a
+warning when indexing.
+
+Software API:
+
+  SoundFont(directory, cache_bytes=4 MB, index_file=None)
+    names, categories
+    info(name)                  - Index entry (rate, channels, frames, ...)
+    samples(name)               - Zero-copy memoryview of int16 samples
+    variant(name, rate, gain=1.0)
+                                - Mono int16 samples at rate (memoryview
+                                  of the file or of a cached copy)
+    choose(category)            - Next name in a category
+    close()
+
+Running this file indexes a directory and prints the index and timings.
+
+--------------------------------------------------------------------------
+"""
+
+import array
+import collections
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+INDEX_FILE = ".soundfont_index.json"
+INDEX_VERSION = 1
+
+CACHE_BYTES = 4 * 1024 * 1024
+
+RIFF_HEADER = struct.Struct("<4sI4s")
+CHUNK_HEADER = struct.Struct("<4sI")
+FMT_CHUNK = struct.Struct("<HHIIHH")
+WAVE_FORMAT_PCM = 1
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def read_wav_header(path):
+    """Return the index entry of a 16-bit PCM WAV file from its headers."""
+    with open(path, "rb") as f:
+        riff, _, wave_id = RIFF_HEADER.unpack(f.read(RIFF_HEADER.size))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError("{0} is not a WAV file".format(path))
+        fmt = None
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                raise ValueError("{0} has no data chunk".format(path))
+            chunk_id, size = CHUNK_HEADER.unpack(header)
+            if chunk_id == b"fmt ":
+                fmt = FMT_CHUNK.unpack(f.read(FMT_CHUNK.size))
+                f.seek(size - FMT_CHUNK.size + (size & 1), os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)   # Chunks are word aligned
+
+    if fmt is None:
+        raise ValueError("{0} has no fmt chunk".format(path))
+    audio_format, channels, rate, _, block_align, bits = fmt
+    if audio_format != WAVE_FORMAT_PCM or bits != 16:
+        raise ValueError("{0} is not 16-bit PCM".format(path))
+    stat = os.stat(path)
+    size = min(size, stat.st_size - offset)
+    size -= size % block_align
+    return {"offset": offset, "length": size, "rate": rate, "channels": channels,
+            "frames": size // block_align, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+
+def category_of(name):
+    """Return the category of a sound name: the name without digits."""
+    return re.sub(r"[\d_\-\s]+", "", os.path.splitext(name)[0]).lower()
+
+
+def resample(samples, channels, rate, new_rate, gain=1.0):
+    """Return samples as mono int16 at new_rate, scaled by gain.
+
+    Uses linear interpolation; NumPy if available.
+    """
+    if np is not None:
+        data = np.frombuffer(samples, dtype="<i2").astype(np.float32)
+        if channels > 1:
+            data = data.reshape(-1, channels).mean(axis=1)
+        if new_rate != rate and len(data) > 1:
+            count = int(len(data) * new_rate / rate)
+            data = np.interp(np.arange(count) * (rate / float(new_rate)),
+                             np.arange(len(data)), data)
+        data = np.clip(data * gain, -32768, 32767).astype("<i2")
+        return memoryview(data.tobytes()).cast("h")
+
+    data = array.array("h")
+    data.frombytes(samples)
+    if sys.byteorder == "big":
+        data.byteswap()
+    if channels > 1:
+        data = [sum(data[i:i + channels]) / channels
+                for i in range(0, len(data), channels)]
+    count = int(len(data) * new_rate / rate) if new_rate != rate else len(data)
+    step = rate / float(new_rate)
+    out = array.array("h", bytes(count * 2))
+    last = len(data) - 1
+    for i in range(count):
+        position = i * step
+        j = int(position)
+        value = data[j] if j >= last else \
+            data[j] + (data[j + 1] - data[j]) * (position - j)
+        out[i] = int(min(32767, max(-32768, value * gain)))
+    if sys.byteorder == "big":
+        out.byteswap()
+    return memoryview(out.tobytes()).cast("h")
+
+
+class SoundFont(object):
+    """Directory of WAV sounds, indexed once and played from mmaps."""
+
+    def __init__(self, directory, cache_bytes=CACHE_BYTES, index_file=None):
+        self.directory = directory
+        self.cache_bytes = cache_bytes
+        self.index_file = index_file or os.path.join(directory, INDEX_FILE)
+        self.loaded_from_cache = False
+
+        self._maps = {}
+        self._cache = collections.OrderedDict()     # (name, rate, gain): samples
+        self._cached_bytes = 0
+        self._next = {}
+
+        self._index = self._load_index()
+        if self._index is None:
+            self._index = self._scan()
+            self._save_index()
+        else:
+            self.loaded_from_cache = True
+
+        self.names = sorted(self._index)
+        self.categories = collections.OrderedDict()
+        for name in self.names:
+            self.categories.setdefault(category_of(name), []).append(name)
+
+    # -----------------------------------------------------
+    # Index
+    # -----------------------------------------------------
+
+    def _directory_mtime(self):
+        return os.stat(self.directory).st_mtime_ns
+
+    def _load_index(self):
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get("version") != INDEX_VERSION or \
+                index.get("mtime_ns") != self._directory_mtime():
+            return None
+        return index["sounds"]
+
+    def _scan(self):
+        sounds = {}
+        for name in sorted(os.listdir(self.directory)):
+            if not name.lower().endswith(".wav"):
+                continue
+            try:
+                sounds[name] = read_wav_header(os.path.join(self.directory, name))
+            except (OSError, ValueError, struct.error) as error:
+                print("Warning: skipping sound {0}: {1}".format(name, error))
+        return sounds
+
+    def _save_index(self):
+        # Creating the index file changes the directory's mtime, so the
+        # mtime is read once the file exists and then written into it
+        try:
+            with open(self.index_file, "w") as f:
+                json.dump({"version": INDEX_VERSION, "mtime_ns": 0,
+                           "sounds": self._index}, f)
+            mtime = self._directory_mtime()
+            with open(self.index_file, "w") as f:
+                json.dump({"version": INDEX_VERSION, "mtime_ns": mtime,
+                           "sounds": self._index}, f, indent="\t", sort_keys=True)
+        except OSError as error:
+            print("Warning: could not write sound index: {0}".format(error))
+
+    def info(self, name):
+        """Return the index entry of a sound."""
+        return self._index[name]
+
+    # -----------------------------------------------------
+    # Samples
+    # -----------------------------------------------------
+
+    def _map(self, name):
+        mapped = self._maps.get(name)
+        if mapped is None:
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                entry = self._index[name]
+                if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime_ns"]:
+                    entry = self._index[name] = read_wav_header(path)
+                    self._save_index()
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = mapped
+        return mapped
+
+    def samples(self, name):
+        """Return the sound's interleaved int16 samples, zero-copy."""
+        entry = self._index[name]
+        data = memoryview(self._map(name))[entry["offset"]:entry["offset"] + entry["length"]]
+        return data.cast("h")
+
+    def variant(self, name, rate, gain=1.0):
+        """Return the sound as mono int16 samples at rate, scaled by gain.
+
+        The file's own samples are returned as is when nothing needs
+        changing; otherwise the processed copy comes from the LRU cache.
+        """
+        entry = self._index[name]
+        if entry["rate"] == rate and entry["channels"] == 1 and gain == 1.0 and \
+                sys.byteorder == "little":
+            return self.samples(name)
+
+        key = (name, rate, round(gain, 3))
+        samples = self._cache.get(key)
+        if samples is not None:
+            self._cache.move_to_end(key)
+            return samples
+
+        samples = resample(self.samples(name).cast("B"), entry["channels"],
+                           entry["rate"], rate, gain)
+        self._cache[key] = samples
+        self._cached_bytes += samples.nbytes
+        while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+        return samples
+
+    def choose(self, category):
+        """Return the next sound name of a category, cycling through them."""
+        names = self.categories[category]
+        index = self._next.get(category, 0)
+        self._next[category] = (index + 1) % len(names)
+        return names[index]
+
+    def close(self):
+        self._cache.clear()
+        self._cached_bytes = 0
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass                    # A voice still holds its samples
+        self._maps = {}
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Index a lightsaber sound font")
+    parser.add_argument("directory")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore the saved index")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        try:
+            os.remove(os.path.join(args.directory, INDEX_FILE))
+        except OSError:
+            pass
+
+    start = time.perf_counter()
+    font = SoundFont(args.directory)
+    elapsed = time.perf_counter() - start
+    for category, names in font.categories.items():
+        print(category)
+        for name in names:
+            entry = font.info(name)
+            print("  {0:24} {1:6d} Hz {2} ch {3:8.3f} s".format(
+                name, entry["rate"], entry["channels"],
+                entry["frames"] / float(entry["rate"])))
+    print("{0} sounds, {1} in {2:.1f} ms".format(
+        len(font.names), "index loaded" if font.loaded_from_cache else "scanned",
+        elapsed * 1e3))
@@ -0,0 +1,240 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber IMU Acquisition
+--------------------------------------------------------------------------
+
+Fault tolerant wrapper around mpu6050.get_sensor_data(), so an I2C error
+or a stuck bus degrades the blade instead of killing the main loop.
+
+Each read runs on the sensor's own worker thread (never the render or
+event loop thread) and is given TIMEOUT seconds:
+
+- OSError from the bus (EIO, EREMOTEIO, ETIMEDOUT, ...) is retried up to
+  RETRIES times straight away
+- if the retries fail, or the read times out, the bus is re-initialised:
+  reopened, given the kernel per-transaction timeout (I2C_TIMEOUT ioctl,
+  on real buses) and PWR_MGMT_1 rewritten to wake the sensor, which also
+  covers a sensor that was reset by a brown-out
+- failed re-initialisations are retried with exponential backoff
+  (REINIT_BACKOFF up to MAX_BACKOFF seconds), and reads return None
+  meanwhile without touching the bus
+- each re-initialisation closes the previous bus before opening a new
+  one, so a long outage does not leak file descriptors
+- a read that times out leaves its worker thread blocked in the driver,
+  so the worker is replaced, and the bus is not re-initialised until the
+  abandoned read has returned: it would otherwise go on through the new
+  bus and update mpu6050's clash detection state after the reset, which
+  can fire a false clash.  Meanwhile reads return None, and at most one
+  worker is ever stuck (the kernel adapter timeout bounds how long)
+
+A read that fails returns None.  runtime.Runtime passes that on to the
+renderer, which acts as a watchdog and runs the blade in a degraded
+no-motion mode (idle effect, no clash flashes or gestures, idle hum)
+until samples come back.
+
+Metrics (metrics(), summary()): faults, timeouts, retries, reinits,
+failed_reinits, recoveries, last / max recovery time (from the first
+failed read to the next good one), degraded time, and abandoned workers.
+
+Software API:
+
+  ResilientSensor(open_bus=None, timeout=0.1, retries=2, on_init=None)
+    - open_bus() returns an smbus2.SMBus-like bus (default: I2C_BUS)
+    - on_init() is called after each re-initialisation, e.g.
+      mpu6050.enable_motion_interrupt
+    __call__()          - get_sensor_data() dictionary, or None
+    healthy             - False while the sensor is failing
+    metrics(), summary()
+    close()
+
+--------------------------------------------------------------------------
+"""
+
+import concurrent.futures
+import fcntl
+import time
+
+import mpu6050
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+TIMEOUT = 0.1                       # Seconds for one whole sensor read
+RETRIES = 2
+REINIT_BACKOFF = 0.05               # Seconds before the first re-initialisation retry
+MAX_BACKOFF = 2.0
+
+I2C_TIMEOUT = 0x0702                # ioctl; argument in units of 10 ms
+I2C_RETRIES = 0x0701
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def set_adapter_timeout(bus, seconds, retries=0):
+    """Set the kernel I2C adapter timeout of an smbus2 bus, if it has one."""
+    fd = getattr(bus, "fd", None)
+    if not isinstance(fd, int):
+        return False                    # Not a real bus (e.g. VirtualMPU6050)
+    fcntl.ioctl(fd, I2C_TIMEOUT, max(1, int(round(seconds * 100))))
+    fcntl.ioctl(fd, I2C_RETRIES, retries)
+    return True
+
+
+class ResilientSensor(object):
+    """get_sensor_data() with timeouts, retries and bus re-initialisation."""
+
+    def __init__(self, open_bus=None, timeout=TIMEOUT, retries=RETRIES,
+                 on_init=None, clock=time.monotonic):
+        self.open_bus = open_bus
+        self.on_init = on_init
+        self.timeout = timeout
+        self.retries = retries
+        self._clock = clock
+
+        self.healthy = True
+        self.faults = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.reinits = 0
+        self.failed_reinits = 0
+        self.recoveries = 0
+        self.last_recovery_time = None
+        self.max_recovery_time = 0.0
+        self.degraded_time = 0.0
+        self.abandoned = 0
+        self.last_error = None
+        self._stuck = []                # Futures of abandoned reads
+
+        self._executor = self._new_executor()
+        self._needs_init = mpu6050.bus is None
+        self._fault_start = None
+        self._next_init = 0.0
+        self._backoff = REINIT_BACKOFF
+
+    def _new_executor(self):
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="lightsaber-imu")
+
+    def _run(self, function):
+        """Run function on the worker thread, waiting at most timeout."""
+        future = self._executor.submit(function)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            # The worker is stuck in the driver; leave it and start another
+            self.timeouts += 1
+            self.abandoned += 1
+            self._stuck.append(future)
+            self._executor.shutdown(wait=False)
+            self._executor = self._new_executor()
+            raise
+
+    def _stuck_workers(self):
+        self._stuck = [future for future in self._stuck if not future.done()]
+        return len(self._stuck)
+
+    def _init(self):
+        if mpu6050.bus is not None:
+            try:
+                mpu6050.bus.close()
+            except OSError:
+                pass
+            mpu6050.bus = None
+        bus = self.open_bus() if self.open_bus is not None else mpu6050.open_bus()
+        set_adapter_timeout(bus, self.timeout)
+        mpu6050.init_mpu6050(bus)
+        if self.on_init is not None:
+            self.on_init()
+        mpu6050.prev_tot_accel = None   # Do not read the gap as a clash
+
+    def _reinit(self, now):
+        if now < self._next_init or self._stuck_workers():
+            return False
+        self.reinits += 1
+        try:
+            self._run(self._init)
+        except (OSError, concurrent.futures.TimeoutError) as error:
+            self.failed_reinits += 1
+            self.last_error = str(error) or "timeout"
+            self._next_init = now + self._backoff
+            self._backoff = min(MAX_BACKOFF, self._backoff * 2)
+            return False
+        self._needs_init = False
+        self._backoff = REINIT_BACKOFF
+        return True
+
+    def __call__(self):
+        """Return a get_sensor_data() dictionary, or None if the sensor failed."""
+        now = self._clock()
+        if self._needs_init and not self._reinit(now):
+            return self._failed(now)
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+            try:
+                data = self._run(mpu6050.get_sensor_data)
+            except concurrent.futures.TimeoutError:
+                self.last_error = "timeout"
+                break
+            except OSError as error:
+                self.faults += 1
+                self.last_error = str(error)
+                continue
+            self._recovered(self._clock())
+            return data
+
+        self._needs_init = True
+        self._next_init = now            # First re-initialisation straight away
+        return self._failed(now)
+
+    def _failed(self, now):
+        if self._fault_start is None:
+            self._fault_start = now
+        self.healthy = False
+        return None
+
+    def _recovered(self, now):
+        if self._fault_start is not None:
+            recovery = now - self._fault_start
+            self.recoveries += 1
+            self.last_recovery_time = recovery
+            self.max_recovery_time = max(self.max_recovery_time, recovery)
+            self.degraded_time += recovery
+            self._fault_start = None
+        self.healthy = True
+
+    def metrics(self):
+        """Return the fault and recovery counters as a dictionary."""
+        degraded = self.degraded_time
+        if self._fault_start is not None:
+            degraded += self._clock() - self._fault_start
+        return {
+            "healthy": self.healthy,
+            "faults": self.faults,
+            "timeouts": self.timeouts,
+            "retries": self.retried,
+            "reinits": self.reinits,
+            "failed_reinits": self.failed_reinits,
+            "recoveries": self.recoveries,
+            "last_recovery_time": self.last_recovery_time,
+            "max_recovery_time": self.max_recovery_time,
+            "degraded_time": degraded,
+            "abandoned": self.abandoned,
+            "last_error": self.last_error,
+        }
+
+    def summary(self):
+        """Return the metrics as one line (times in ms)."""
+        m = self.metrics()
+        return ("imu: {0} | faults {1} timeouts {2} retries {3} reinits {4} "
+                "({5} failed) | recoveries {6}, max {7:.0f} ms | degraded {8:.0f} ms"
+                .format("ok" if m["healthy"] else "DOWN", m["faults"], m["timeouts"],
+                        m["retries"], m["reinits"], m["failed_reinits"],
+                        m["recoveries"], m["max_recovery_time"] * 1e3,
+                        m["degraded_time"] * 1e3))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,383 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Gesture Recognition
+--------------------------------------------------------------------------
+
+Streaming recognizer for stab, twirl and thrust (force push) gestures
+from the samples of mpu6050.get_sensor_data() (or telemetry records, which
+have the same accel_*_signed / gyro_* fields).  The recognizer needs the
+signed accel axes: accel_x/y/z are abs() values, which fold back when an
+axis crosses zero (a stab down a vertical blade, a thrust along gravity)
+and break the gravity subtraction.
+
+Each sample costs a fixed number of operations.  The recognizer keeps the
+last WINDOW seconds of samples in preallocated rings and maintains the
+window features incrementally, adding the new sample and subtracting the
+one it replaces:
+
+- dynamic acceleration per axis: accel minus a slow moving average of
+  accel (the gravity estimate), in g
+- energy: mean squared dynamic acceleration over the window
+- dominant axis: axis with the largest mean |dynamic acceleration|
+- rotation rate: mean |gyro| per axis (degrees / s), and the mean signed
+  gyro about the blade axis (spin), which is large only for a rotation
+  that keeps its direction
+
+The running sums are recomputed from the rings once per window length so
+that floating point error cannot build up.
+
+Gestures, checked on every sample:
+
+    stab    - sharp dynamic acceleration along the blade (BLADE_AXIS) in
+              this sample, with little rotation in the window
+    twirl   - fast rotation about the blade axis in one direction, held
+              for the whole window
+    thrust  - dynamic acceleration across the blade held for the whole
+              window with little rotation (a force push)
+
+A gesture is emitted once when its condition starts to hold, not again
+for every sample it keeps holding, and no gesture is emitted within
+GESTURE_GAP seconds of the previous one.
+
+mpu6050.get_sensor_data() raises flash for a clash on the sample after
+the jolt, so a stab is only emitted on the first sample after its jolt,
+and dropped if that sample is flagged.  After a flagged sample nothing is
+classified for a whole window, until the clash has left the window.
+
+Recognized gestures are Gesture(kind, time, strength) events, returned by
+update() and passed to every subscriber (e.g. the blade renderer and the
+audio engine in lightsaber.py).  strength is how far past its threshold
+the gesture was (1.0 = just recognized).
+
+BLADE_AXIS depends on how the MPU6050 is mounted in the hilt.
+
+Software API:
+
+  GestureRecognizer(sample_rate=60, window=0.25, blade_axis=BLADE_AXIS)
+    update(data, now)       - Add a sample; return the gestures recognized
+    subscribe(callback, kinds=None)
+                            - callback(gesture) for every (or some) kinds
+    features()              - Current window features (dictionary)
+
+  Gesture                   - kind, time, strength
+
+Running this file replays a telemetry recording (--trace FILE) or a
+built-in synthetic session (--vertical: with the blade pointing up) and
+prints the recognized gestures.  It exits with status 1 unless exactly the
+expected gestures are recognized: the scripted ones for the synthetic
+session, or those listed in the JSON file next to a recording
+(traces/session.bin and traces/session.json):
+
+    python3 gesture.py --trace traces/session.bin
+
+--------------------------------------------------------------------------
+"""
+
+import collections
+import math
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+GESTURES = ("stab", "twirl", "thrust")
+
+SAMPLE_RATE = 60
+WINDOW = 0.25                       # Seconds of samples in the window
+BLADE_AXIS = 1                      # 0 x, 1 y, 2 z: accel / gyro axis along the blade
+GRAVITY_SMOOTHING = 0.02            # Weight of each sample in the gravity estimate
+
+STAB_ACCEL = 1.2                    # g along the blade in one sample
+TWIRL_RATE = 180.0                  # Mean degrees / s about the blade axis
+                                    # (the gyro reads at most 250)
+TWIRL_STEADINESS = 0.8              # Spin / mean |rate|: one direction only
+THRUST_ACCEL = 0.5                  # Mean g across the blade over the window
+MAX_ROTATION = 120.0                # Mean degrees / s allowed for stab / thrust
+GESTURE_GAP = 0.4                   # Seconds between gestures
+FLASH_SAMPLES = 6                   # Samples mpu6050 keeps flash raised
+
+Gesture = collections.namedtuple("Gesture", "kind time strength")
+
+AXES = ("x", "y", "z")
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class GestureRecognizer(object):
+    """Sliding-window IMU features and stab / twirl / thrust detection."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, window=WINDOW, blade_axis=BLADE_AXIS):
+        self.size = max(2, int(round(window * sample_rate)))
+        self.blade_axis = blade_axis
+        self.samples = 0
+
+        # Rings of the last size samples
+        self._dynamic = [[0.0] * self.size for _ in AXES]   # |dynamic accel|
+        self._gyro = [[0.0] * self.size for _ in AXES]      # signed gyro
+        self._energy = [0.0] * self.size
+        self._index = 0
+
+        # Running window sums
+        self._dynamic_sum = [0.0, 0.0, 0.0]
+        self._gyro_sum = [0.0, 0.0, 0.0]
+        self._gyro_abs_sum = [0.0, 0.0, 0.0]
+        self._energy_sum = 0.0
+
+        self._gravity = None
+        self._pending = None            # Stab waiting for the end of its jolt
+        self._quiet = 0                 # Samples left to skip after a clash
+        self._last_gesture = None
+        self._holding = None            # Kind whose condition still holds
+        self._subscribers = []
+
+    def subscribe(self, callback, kinds=None):
+        """Call callback(gesture) for each recognized gesture of kinds (all if None)."""
+        self._subscribers.append((callback, None if kinds is None else frozenset(kinds)))
+
+    # -----------------------------------------------------
+    # Features
+    # -----------------------------------------------------
+
+    def _add(self, dynamic, gyro):
+        i = self._index
+        energy = 0.0
+        for axis in range(3):
+            value = abs(dynamic[axis])
+            self._dynamic_sum[axis] += value - self._dynamic[axis][i]
+            self._dynamic[axis][i] = value
+            rate = gyro[axis]
+            old = self._gyro[axis][i]
+            self._gyro_sum[axis] += rate - old
+            self._gyro_abs_sum[axis] += abs(rate) - abs(old)
+            self._gyro[axis][i] = rate
+            energy += dynamic[axis] * dynamic[axis]
+        self._energy_sum += energy - self._energy[i]
+        self._energy[i] = energy
+
+        self._index = (i + 1) % self.size
+        if self._index == 0:
+            self._resync()
+
+    def _resync(self):
+        for axis in range(3):
+            self._dynamic_sum[axis] = sum(self._dynamic[axis])
+            self._gyro_sum[axis] = sum(self._gyro[axis])
+            self._gyro_abs_sum[axis] = sum(abs(rate) for rate in self._gyro[axis])
+        self._energy_sum = sum(self._energy)
+
+    def features(self):
+        """Return the current window features."""
+        n = float(self.size)
+        dynamic = [total / n for total in self._dynamic_sum]
+        rates = [total / n for total in self._gyro_abs_sum]
+        return {
+            "energy": self._energy_sum / n,
+            "dominant_axis": AXES[dynamic.index(max(dynamic))],
+            "dynamic": dynamic,
+            "rotation": rates,
+            "rotation_rate": math.sqrt(sum(rate * rate for rate in rates)),
+            "spin": self._gyro_sum[self.blade_axis] / n,
+        }
+
+    # -----------------------------------------------------
+    # Recognition
+    # -----------------------------------------------------
+
+    def update(self, data, now):
+        """Add a sample; return a tuple of the gestures recognized in it."""
+        accel = (data["accel_x_signed"], data["accel_y_signed"], data["accel_z_signed"])
+        gyro = (data["gyro_x"], data["gyro_y"], data["gyro_z"])
+        if self._gravity is None:
+            self._gravity = list(accel)
+        gravity = self._gravity
+        dynamic = (accel[0] - gravity[0], accel[1] - gravity[1], accel[2] - gravity[2])
+        for axis in range(3):
+            gravity[axis] += GRAVITY_SMOOTHING * dynamic[axis]
+
+        self._add(dynamic, gyro)
+        self.samples += 1
+        if data.get("flash"):
+            # mpu6050 flags a clash on the sample after the jolt: drop the
+            # stab waiting on the jolt, and skip the window the jolt is in
+            self._pending = None
+            self._quiet = self.size
+            return ()
+        if self._quiet:
+            self._quiet -= 1
+            return ()
+        if self.samples < self.size:
+            return ()
+
+        gesture = self._classify(dynamic, now)
+        kind = gesture.kind if gesture is not None else None
+        ready = []
+        if self._pending is not None and kind != "stab":
+            ready.append(self._pending)         # The jolt is over and was no clash
+            self._pending = None
+        if kind != self._holding:
+            self._holding = kind
+            if kind == "stab":
+                self._pending = gesture         # Emitted once the jolt is over
+            elif gesture is not None:
+                ready.append(gesture)
+        return tuple(gesture for gesture in ready if self._emit(gesture))
+
+    def _emit(self, gesture):
+        if self._last_gesture is not None and \
+                gesture.time - self._last_gesture < GESTURE_GAP:
+            return False
+        self._last_gesture = gesture.time
+        for callback, kinds in self._subscribers:
+            if kinds is None or gesture.kind in kinds:
+                callback(gesture)
+        return True
+
+    def _classify(self, dynamic, now):
+        n = float(self.size)
+        blade = self.blade_axis
+        rates = self._gyro_abs_sum
+        rotation = math.sqrt(sum(rate * rate for rate in rates)) / n
+
+        # Twirl: fast, steady rotation about the blade axis
+        rate = rates[blade] / n
+        spin = abs(self._gyro_sum[blade]) / n
+        if rate >= TWIRL_RATE and spin >= TWIRL_STEADINESS * rate and \
+                rates[blade] == max(rates):
+            return Gesture("twirl", now, spin / TWIRL_RATE)
+
+        if rotation > MAX_ROTATION:
+            return None
+
+        # Stab: a sharp jolt along the blade in this sample
+        along = abs(dynamic[blade])
+        if along >= STAB_ACCEL and along == max(abs(value) for value in dynamic):
+            return Gesture("stab", now, along / STAB_ACCEL)
+
+        # Thrust: acceleration across the blade, held for the whole window
+        across = max(self._dynamic_sum[axis] for axis in range(3) if axis != blade) / n
+        if across >= THRUST_ACCEL and across > self._dynamic_sum[blade] / n:
+            return Gesture("thrust", now, across / THRUST_ACCEL)
+        return None
+
+
+def clash_flags(samples):
+    """Set "flash" in each sample's data as mpu6050.get_sensor_data() would.
+
+    A drop of the total acceleration by 1 g or more from one sample to the
+    next raises flash for FLASH_SAMPLES samples, starting with the later
+    sample.
+    """
+    previous = None
+    counter = 0
+    for _, data in samples:
+        total = abs(math.sqrt(data["accel_x"] ** 2 + data["accel_y"] ** 2 +
+                              data["accel_z"] ** 2) - 1)
+        if previous is not None and previous - total >= 1:
+            counter = FLASH_SAMPLES
+        elif counter > 0:
+            counter -= 1
+        previous = total
+        data["flash"] = counter > 0
+    return samples
+
+
+def synthetic_session(sample_rate=SAMPLE_RATE, blade_axis=BLADE_AXIS, vertical=False):
+    """Return ([(time, data)], [(time, kind)]) for a scripted session.
+
+    The blade rests, is stabbed at 0.9 - 1.1 s, twirled from 2 s, thrust at 4 s
+    and clashed at 5.5 s (a one-sample jolt along the blade, which must not
+    be recognized as a gesture).  flash is set by clash_flags().
+
+    The stab is towards the floor.  With vertical the blade points up, so
+    gravity is along the blade and the stab takes that axis through zero;
+    otherwise the thrust is down and takes the gravity axis through zero.
+    """
+    gravity = blade_axis if vertical else (2 if blade_axis != 2 else 0)
+    thrust = (blade_axis + 1) % 3 if vertical else gravity
+    samples = []
+    for i in range(int(7 * sample_rate)):
+        t = i / float(sample_rate)
+        accel = [0.0, 0.0, 0.0]
+        accel[gravity] = 1.0
+        gyro = [3.0, -2.0, 1.0]                             # Small drift
+        if 0.9 <= t < 1.1:
+            # Rises and falls over 0.1 s, too smoothly to be a clash
+            accel[blade_axis] -= 1.6 * max(0.0, 1.0 - abs(t - 1.0) / 0.1)
+        elif 2.0 <= t < 2.6:
+            gyro[blade_axis] = 240.0
+        elif 4.0 <= t < 4.4:
+            accel[thrust] -= 1.6
+        elif i == int(5.5 * sample_rate):
+            accel[blade_axis] += 1.8
+        data = {"gyro_x": gyro[0], "gyro_y": gyro[1], "gyro_z": gyro[2]}
+        for axis, name in enumerate(AXES):
+            data["accel_" + name + "_signed"] = accel[axis]
+            data["accel_" + name] = abs(accel[axis])
+        samples.append((t, data))
+    return clash_flags(samples), [(0.9, "stab"), (2.0, "twirl"), (4.0, "thrust")]
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Recognize lightsaber gestures")
+    parser.add_argument("--trace", help="Telemetry recording (default: synthetic)")
+    parser.add_argument("--sample-rate", type=float, default=SAMPLE_RATE)
+    parser.add_argument("--blade-axis", type=int, default=BLADE_AXIS)
+    parser.add_argument("--vertical", action="store_true",
+                        help="Synthetic session with the blade pointing up")
+    args = parser.parse_args()
+
+    expected = None
+    if args.trace:
+        # Telemetry lives with the other lightsaber modules in ../led_strip
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "..", "led_strip"))
+        from telemetry import read_records
+        records = [record for record in read_records(args.trace)
+                   if record["kind"] == "sample"]
+        start = records[0]["time"] if records else 0.0
+        samples = [(record["time"] - start, record) for record in records]
+
+        # Expected gestures of a recorded trace, e.g. traces/session.json
+        expect = os.path.splitext(args.trace)[0] + ".json"
+        if os.path.exists(expect):
+            with open(expect) as f:
+                settings = json.load(f)
+            args.sample_rate = settings.get("sampleRate", args.sample_rate)
+            args.blade_axis = settings.get("bladeAxis", args.blade_axis)
+            expected = [tuple(gesture) for gesture in settings["gestures"]]
+    else:
+        samples, expected = synthetic_session(int(args.sample_rate), args.blade_axis,
+                                              args.vertical)
+
+    recognizer = GestureRecognizer(args.sample_rate, blade_axis=args.blade_axis)
+    gestures = []
+    begin = time.perf_counter()
+    for t, data in samples:
+        gestures.extend(recognizer.update(data, t))
+    elapsed = time.perf_counter() - begin
+
+    for gesture in gestures:
+        print("{0:8.3f} s  {1:6}  strength {2:.2f}".format(
+            gesture.time, gesture.kind, gesture.strength))
+    print("{0} samples, {1} gestures, {2:.1f} us per sample".format(
+        len(samples), len(gestures), elapsed / max(1, len(samples)) * 1e6))
+
+    if expected is not None:
+        found = [gesture.kind for gesture in gestures]
+        wanted = [kind for _, kind in expected]
+        late = [gesture for gesture, (t, _) in zip(gestures, expected)
+                if not t <= gesture.time < t + 2 * WINDOW + 0.1]
+        if found != wanted or late:
+            print("Expected {0}, recognized {1}".format(wanted, found))
+            sys.exit(1)
@@ -1,6 +1,7 @@
-import smbus2
 import time
 import math
+import os
+import sys
 
 # MPU6050 Registers and Addresses
 MPU6050_ADDR = 0x68
@@ -17,29 +18,77 @@ GYRO_YOUT_H = 0x45
 GYRO_YOUT_L = 0x46
 GYRO_ZOUT_H = 0x47
 GYRO_ZOUT_L = 0x48
+ACCEL_CONFIG = 0x1C
+MOT_THR = 0x1F
+MOT_DUR = 0x20
+INT_PIN_CFG = 0x37
+INT_ENABLE = 0x38
+ACCEL_HPF_5HZ = 0x01  # Motion detection needs the accelerometer high-pass filter
+MOT_EN = 0x40
 
 prev_tot_accel = None
 flash_counter = 0 
 
+# Optional latency.LatencyMonitor; a trace is started for each sample
+latency = None
 
-# Initialize I2C bus
-bus = smbus2.SMBus(2)  # Use I2C bus 2, corresponding to P1_28 and P1_26 on PocketBeagle
+# Optional profiling.Profiler; spans for register reads and the math
+profiler = None
+
+# Binary telemetry file written by main(); decode with led_strip/telemetry.py
+TELEMETRY_SINK = "/tmp/mpu6050_telemetry.bin"
+
+
+# I2C bus, opened on first use so the module imports without smbus2
+I2C_BUS = 2  # Use I2C bus 2, corresponding to P1_28 and P1_26 on PocketBeagle
+bus = None
+
+# Use i2c (any smbus2.SMBus-like object, e.g. hal.VirtualMPU6050) or open I2C_BUS
+def open_bus(i2c=None):
+    global bus
+    if i2c is None:
+        import smbus2
+        i2c = smbus2.SMBus(I2C_BUS)
+    bus = i2c
+    return bus
 
 # Initialize MPU6050
-def init_mpu6050():
+def init_mpu6050(i2c=None):
+    if i2c is not None or bus is None:
+        open_bus(i2c)
     bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_1, 0)  # Wake up MPU6050
 
+# Pulse the INT pin (active high) when acceleration passes threshold_mg for
+# duration_ms; wire INT to a GPIO to wake the idle governor (governor.py)
+def enable_motion_interrupt(threshold_mg=40, duration_ms=1):
+    if bus is None:
+        open_bus()
+    bus.write_byte_data(MPU6050_ADDR, ACCEL_CONFIG, ACCEL_HPF_5HZ)
+    bus.write_byte_data(MPU6050_ADDR, MOT_THR, min(255, threshold_mg // 2))  # 2 mg per LSB
+    bus.write_byte_data(MPU6050_ADDR, MOT_DUR, min(255, duration_ms))
+    bus.write_byte_data(MPU6050_ADDR, INT_PIN_CFG, 0)  # Active high, push-pull, 50 us pulse
+    bus.write_byte_data(MPU6050_ADDR, INT_ENABLE, MOT_EN)
+
 # Read raw data from two bytes and convert to signed integer
 def read_raw_data(addr):
+    if profiler is not None:
+        start = profiler.begin()
+    if bus is None:
+        open_bus()
     high = bus.read_byte_data(MPU6050_ADDR, addr)
     low = bus.read_byte_data(MPU6050_ADDR, addr + 1)
     value = (high << 8) | low
     if value > 32768:
         value -= 65536
+    if profiler is not None:
+        profiler.end("imu.read_raw_data", start)
     return value
 
 # Fetch and display accelerometer and gyroscope data
 def get_sensor_data():
+    if latency is not None:
+        latency.begin()
+
     # Read accelerometer data
     accel_x = read_raw_data(ACCEL_XOUT_H) -0.07
     accel_y = read_raw_data(ACCEL_YOUT_H) +0.02
@@ -50,10 +99,18 @@ def get_sensor_data():
     gyro_y = read_raw_data(GYRO_YOUT_H)
     gyro_z = read_raw_data(GYRO_ZOUT_H)
 
+    if latency is not None:
+        latency.stamp("i2c")
+    if profiler is not None:
+        math_start = profiler.begin()
+
     # Convert raw data to "g" and degrees per second
-    accel_x_scaled = abs((accel_x / 16384.0)) # Scale for accelerometer
-    accel_y_scaled = abs((accel_y / 16384.0))
-    accel_z_scaled = abs((accel_z / 16384.0))
+    accel_x_signed = accel_x / 16384.0 # Scale for accelerometer
+    accel_y_signed = accel_y / 16384.0
+    accel_z_signed = accel_z / 16384.0
+    accel_x_scaled = abs(accel_x_signed)
+    accel_y_scaled = abs(accel_y_signed)
+    accel_z_scaled = abs(accel_z_signed)
 
     gyro_x_scaled = (gyro_x / 131.0) -3  # Scale for gyroscope
     gyro_y_scaled = (gyro_y / 131.0) +0.2
@@ -84,11 +141,19 @@ def get_sensor_data():
         speaker_vol = 100  # Set to maximum volume during a flash
     else:
         speaker_vol = min(comb_accel_gyro * 10, 100)
+
+    if latency is not None:
+        latency.stamp("detect")
+    if profiler is not None:
+        profiler.end("imu.sensor_math", math_start)
     
     return {
         "accel_x": accel_x_scaled,
         "accel_y": accel_y_scaled,
         "accel_z": accel_z_scaled,
+        "accel_x_signed": accel_x_signed,  # Direction kept, e.g. for gesture.py
+        "accel_y_signed": accel_y_signed,
+        "accel_z_signed": accel_z_signed,
         "gyro_x": gyro_x_scaled,
         "gyro_y": gyro_y_scaled,
         "gyro_z": gyro_z_scaled,
@@ -100,23 +165,25 @@ def get_sensor_data():
         "flash": flash,
     }
 
-# Main function to fetch and display sensor data at 60Hz
+# Main function to fetch sensor data at 60Hz and summarise it
 def main():
+    # Telemetry lives with the other lightsaber modules in ../led_strip
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "..", "led_strip"))
+    from telemetry import Telemetry
+
+    telemetry = Telemetry(TELEMETRY_SINK, summary_interval=1.0)
     init_mpu6050()
     print("MPU6050 Initialized. Reading data at 60Hz...\n")
+    telemetry.start()
     try:
         while True:
             data = get_sensor_data()
-            print(
-                f"Accel: X={data['accel_x']:.2f}, Y={data['accel_y']:.2f}, Z={data['accel_z']:.2f} | "
-                f"Gyro: X={data['gyro_x']:.2f}, Y={data['gyro_y']:.2f}, Z={data['gyro_z']:.2f} | "
-                f"Totals: Accel={data['tot_accel']:.2f}, Gyro={data['tot_gyro']:.2f}, Comb={data['comb_accel_gyro']:.2f} | "
-                f"Difference: {data['difference']:.2f}, Peripherals: Volume={data['speaker_vol']:.2f} | "
-                f"Contact={'True' if data['difference'] >= 1 else 'False'}, Flash={'True' if data['flash'] else 'False'}"
-            )
+            telemetry.sample(data)  # Summarised once a second
             time.sleep(1 / 60.0)  # Wait to achieve 60 Hz updates
     except KeyboardInterrupt:
         print("\nExiting program.")
+    telemetry.stop()
 
 if __name__ == "__main__":
     main()
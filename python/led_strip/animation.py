@@ -0,0 +1,403 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Animation Files
+--------------------------------------------------------------------------
+
+Compact on-disk format for prerendered LED animations (ignition styles,
+demo sequences, ...), played back from a memory-mapped file.
+
+File layout (all integers little endian):
+
+    Header (16 bytes)
+        4s  magic "LSAN"
+        B   version (1)
+        B   flags (reserved, 0)
+        H   LED count
+        H   frames per second
+        I   frame count
+        H   reserved
+
+    Frame records, one after another
+        B   type: FRAME_RAW or FRAME_DELTA
+        I   payload size in bytes
+        ... payload
+
+    FRAME_RAW payload is the full frame: LED count * 3 bytes of r, g, b.
+    FRAME_DELTA payload is a list of changed spans relative to the previous
+    frame, each span being:
+        H   first LED
+        H   number of LEDs
+        ... number of LEDs * 3 bytes of r, g, b
+
+The player maps the file with mmap and hands memoryview slices of raw
+frames straight to opc.Client.put_frame(), so playback uses constant memory
+and does no rendering.  Delta frames are applied to a single working frame
+buffer.
+
+Any render loop can be captured by handing it a CaptureClient in place of
+its opc.Client.
+
+Software API:
+
+  AnimationWriter(path, led_count, fps, keyframe_interval=60)
+    write_frame(frame)
+      - frame is a bytes-like object or a list of (r, g, b) tuples
+    close()
+
+  AnimationPlayer(path)
+    - ValueError if the file has no frames or a frame rate of 0;
+      frames() raises ValueError at a record cut off by the end of the file
+    led_count, fps, frame_count
+    frames()
+      - Yield each frame as a bytes-like object (valid until the next one)
+    play(client, channel=0, loop=False)
+      - Send the frames to an opc.Client at the file's frame rate
+    close()
+
+  CaptureClient(writer, client=None, channel=0)
+    - Stands in for opc.Client; records every frame sent on channel to
+      writer and forwards it to client (if given)
+
+Command line:
+
+    python3 animation.py info FILE
+    python3 animation.py play FILE [--address localhost:7890] [--loop]
+    python3 animation.py ignition FILE [--color 255,0,0]
+
+--------------------------------------------------------------------------
+"""
+
+import mmap
+import os
+import struct
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+MAGIC = b"LSAN"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBBHHIH")
+RECORD = struct.Struct("<BI")
+SPAN = struct.Struct("<HH")
+
+FRAME_RAW = 0
+FRAME_DELTA = 1
+
+# Unchanged LEDs shorter than this between two changed spans are sent
+# again rather than starting a new span (a span header is 4 bytes)
+SPAN_MERGE_GAP = 2
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def encode_pixels(pixels):
+    """Pack a list of (r, g, b) tuples into bytes, clamping to 0 - 255."""
+    return bytes(min(255, max(0, int(c))) for pixel in pixels for c in pixel)
+
+
+def changed_spans(previous, frame, led_count):
+    """Return a list of (first_led, led_count) spans where frame differs."""
+    spans = []
+    start = None
+    gap = 0
+    for i in range(led_count):
+        j = i * 3
+        if frame[j:j + 3] != previous[j:j + 3]:
+            if start is None:
+                start = i
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap > SPAN_MERGE_GAP:
+                spans.append((start, i - gap + 1 - start))
+                start = None
+    if start is not None:
+        spans.append((start, led_count - gap - start))
+    return spans
+
+
+class AnimationWriter(object):
+    """Write frames to an animation file, delta encoding when smaller."""
+
+    def __init__(self, path, led_count, fps, keyframe_interval=60):
+        if fps <= 0:
+            raise ValueError("fps must be positive, got {0}".format(fps))
+        self.led_count = led_count
+        self.fps = fps
+        self.keyframe_interval = keyframe_interval
+        self.frame_count = 0
+
+        self._frame_size = led_count * 3
+        self._previous = None
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, led_count, fps, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_frame(self, frame):
+        """Append a frame (bytes-like, or a list of (r, g, b) tuples)."""
+        if isinstance(frame, list):
+            frame = encode_pixels(frame)
+        else:
+            frame = bytes(memoryview(frame).cast("B"))
+        if len(frame) != self._frame_size:
+            raise ValueError("Frame has {0} bytes, expected {1}".format(
+                len(frame), self._frame_size))
+
+        payload = None
+        keyframe = (self.frame_count % self.keyframe_interval) == 0
+        if self._previous is not None and not keyframe:
+            spans = changed_spans(self._previous, frame, self.led_count)
+            pieces = []
+            for first, count in spans:
+                pieces.append(SPAN.pack(first, count))
+                pieces.append(frame[first * 3:(first + count) * 3])
+            delta = b"".join(pieces)
+            if len(delta) < self._frame_size:
+                payload = delta
+
+        if payload is None:
+            self._file.write(RECORD.pack(FRAME_RAW, self._frame_size))
+            self._file.write(frame)
+        else:
+            self._file.write(RECORD.pack(FRAME_DELTA, len(payload)))
+            self._file.write(payload)
+
+        self._previous = frame
+        self.frame_count += 1
+
+    def close(self):
+        """Write the frame count into the header and close the file."""
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, self.led_count,
+                                     self.fps, self.frame_count, 0))
+        self._file.close()
+        self._file = None
+
+
+class AnimationPlayer(object):
+    """Play an animation file from a read-only memory map."""
+
+    def __init__(self, path):
+        self._map = None
+        self._file = open(path, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size <= HEADER.size:
+                raise ValueError("{0} has no frames".format(path))
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+
+            magic, version, _, self.led_count, self.fps, self.frame_count, _ = \
+                HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError("{0} is not an animation file".format(path))
+            if version != VERSION:
+                raise ValueError("Unsupported animation version {0}".format(version))
+            if self.fps <= 0:
+                raise ValueError("{0} has an invalid frame rate ({1} fps)".format(
+                    path, self.fps))
+        except Exception:
+            self.close()
+            raise
+
+        self._frame_size = self.led_count * 3
+        self._work = bytearray(self._frame_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def frames(self):
+        """Yield every frame in order.
+
+        Raw frames are memoryview slices of the mapped file; delta frames
+        are the player's working buffer.  Either is only valid until the
+        next frame is requested.
+        """
+        view = self._view
+        work = self._work
+        end = len(view)
+        offset = HEADER.size
+
+        while offset < end:
+            if offset + RECORD.size > end:
+                raise ValueError("Frame record cut off at byte {0}".format(offset))
+            kind, size = RECORD.unpack_from(view, offset)
+            if offset + RECORD.size + size > end:
+                raise ValueError("Frame record cut off at byte {0}".format(offset))
+            offset += RECORD.size
+            payload = view[offset:offset + size]
+            offset += size
+
+            if kind == FRAME_RAW:
+                # Only copy into the working buffer if a delta follows
+                if offset < end and view[offset] == FRAME_DELTA:
+                    work[:] = payload
+                yield payload
+            elif kind == FRAME_DELTA:
+                pos = 0
+                while pos < size:
+                    first, count = SPAN.unpack_from(payload, pos)
+                    pos += SPAN.size
+                    length = count * 3
+                    work[first * 3:first * 3 + length] = payload[pos:pos + length]
+                    pos += length
+                yield work
+            else:
+                raise ValueError("Unknown frame type {0} at byte {1}".format(
+                    kind, offset - size - RECORD.size))
+            payload.release()
+
+    def play(self, client, channel=0, loop=False):
+        """Send the frames to client at the file's frame rate.
+
+        Frames are scheduled against absolute deadlines so timing errors do
+        not accumulate; if sending falls behind, the player does not sleep
+        until it has caught up.
+        """
+        period = 1.0 / self.fps
+        deadline = time.perf_counter()
+        while True:
+            for frame in self.frames():
+                client.put_frame(frame, channel)
+                deadline += period
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    deadline -= delay
+            if not loop:
+                break
+
+    def close(self):
+        """Release the memory map and the file."""
+        if self._file is None:
+            return
+        if self._map is not None:
+            self._view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                # A frame from frames() is still referenced; the map is
+                # unmapped when the last reference goes away
+                pass
+            self._map = None
+        self._file.close()
+        self._file = None
+
+
+class CaptureClient(object):
+    """Record the frames sent by a render loop into an AnimationWriter.
+
+    Has the same put_pixels / put_frame interface as opc.Client.  Frames on
+    other channels than the captured one are only forwarded.
+    """
+
+    def __init__(self, writer, client=None, channel=0):
+        self.writer = writer
+        self.client = client
+        self.channel = channel
+
+    def can_connect(self):
+        return self.client.can_connect() if self.client is not None else True
+
+    def disconnect(self):
+        if self.client is not None:
+            self.client.disconnect()
+
+    def put_pixels(self, pixels, channel=0):
+        if channel == self.channel:
+            self.writer.write_frame(encode_pixels(pixels))
+        if self.client is not None:
+            return self.client.put_pixels(pixels, channel)
+        return True
+
+    def put_frame(self, frame, channel=0):
+        if channel == self.channel:
+            self.writer.write_frame(frame)
+        if self.client is not None:
+            return self.client.put_frame(frame, channel)
+        return True
+
+
+def render_ignition(client, color, led_count=60):
+    """Render the two-strip ignition and retraction of lightsaber_lights.py.
+
+    The first half of the LEDs lights from the hilt up, the second half
+    (mounted in reverse) from the end down, so both meet at the tip.
+    """
+    half = led_count // 2
+    leds = [(0, 0, 0)] * led_count
+    for i in range(half):
+        leds[i] = color
+        leds[led_count - 1 - i] = color
+        client.put_pixels(leds)
+    for i in range(half):
+        leds[half - 1 - i] = (0, 0, 0)
+        leds[half + i] = (0, 0, 0)
+        client.put_pixels(leds)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lightsaber animation files")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    info = commands.add_parser("info", help="Print an animation's header")
+    info.add_argument("path")
+
+    play = commands.add_parser("play", help="Play an animation to an OPC server")
+    play.add_argument("path")
+    play.add_argument("--address", default="localhost:7890")
+    play.add_argument("--channel", type=int, default=0)
+    play.add_argument("--loop", action="store_true")
+
+    ignition = commands.add_parser("ignition", help="Record the ignition animation")
+    ignition.add_argument("path")
+    ignition.add_argument("--color", default="255,0,0")
+    ignition.add_argument("--leds", type=int, default=60)
+    ignition.add_argument("--fps", type=int, default=100)
+
+    args = parser.parse_args()
+
+    if args.command == "info":
+        with AnimationPlayer(args.path) as player:
+            print("{0}: {1} LEDs, {2} frames at {3} fps ({4:.2f} s)".format(
+                args.path, player.led_count, player.frame_count, player.fps,
+                player.frame_count / float(player.fps)))
+
+    elif args.command == "play":
+        from opc import Client
+
+        client = Client(args.address)
+        if not client.can_connect():
+            print("WARNING: could not connect to %s" % args.address)
+        with AnimationPlayer(args.path) as player:
+            try:
+                player.play(client, args.channel, args.loop)
+            except KeyboardInterrupt:
+                pass
+
+    elif args.command == "ignition":
+        color = tuple(int(c) for c in args.color.split(","))
+        with AnimationWriter(args.path, args.leds, args.fps) as writer:
+            render_ignition(CaptureClient(writer), color, args.leds)
+        print("Wrote {0} frames to {1}".format(writer.frame_count, args.path))
@@ -0,0 +1,410 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Benchmarks
+--------------------------------------------------------------------------
+
+Reproducible benchmark suite for the lightsaber code paths, with
+machine-readable results and regression checks against a stored baseline.
+(The *_test.py files are manual hardware checks, not benchmarks.)
+
+    python3 benchmark.py                        - Run all, compare to baseline
+    python3 benchmark.py --only encode,loop     - Run some groups
+    python3 benchmark.py --save-baseline        - Store results as baseline
+    python3 benchmark.py --trace imu.bin        - Detect on a recorded trace
+
+Groups:
+
+    encode    - opc.Client.put_pixels and put_frame throughput for 60 to
+                5000 LEDs, sending to a local OPCServer (opc_server.py)
+                running in a child process
+    detect    - mpu6050.get_sensor_data() clash detection over an IMU trace,
+                replayed through a VirtualMPU6050 (hal.py)
+    ignition  - Cost of one ignition frame: BladeRenderer and the scripted
+                put_pixels loop of lightsaber_lights.py
+    render    - EffectEngine flicker frames for the 60 LED blade
+    loop      - Full loop (sensor, BladeRenderer, put_frame) to a local
+                OPCServer, frames per second
+
+IMU traces are telemetry recordings (telemetry.py; e.g. the file written by
+mpu6050.py's main()).  Without --trace a synthetic 60 s swinging trace with
+a clash every 3 s is used.
+
+Every benchmark is scaled to take at least MIN_RUN_TIME, then timed repeat
+times with the garbage collector off, and the best run is reported, so
+numbers vary little between runs on the same machine.  Results are JSON:
+
+    {"version": 1, "host": {...},
+     "results": {"encode.put_pixels.60": {"value": 41000.0,
+                 "unit": "frames/s", "better": "higher"}, ...}}
+
+With a baseline file (default benchmark_baseline.json, written by
+--save-baseline), each result is compared to it and changes worse than
+--threshold (default 10%) are flagged; the exit status is 1 if any are.
+Baselines are per machine, so record one on the board itself.
+
+--------------------------------------------------------------------------
+"""
+
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+import hal
+from effects import EffectEngine
+from opc import Client
+from opc_server import OPCServer
+from runtime import BladeRenderer, OFF, ON
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+VERSION = 1
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "benchmark_baseline.json")
+IMU_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "imu")
+
+GROUPS = ("encode", "detect", "ignition", "render", "loop")
+
+ENCODE_LED_COUNTS = (60, 300, 1000, 5000)
+LED_COUNT = 60
+TRACE_SECONDS = 60
+TRACE_RATE = 60
+MIN_RUN_TIME = 0.2                  # Seconds per timed run
+
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+
+RED = (255, 0, 0)
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def time_per_op(run, repeat):
+    """Return the best seconds per operation of run(count).
+
+    run(count) performs count operations.  count is first doubled until one
+    call takes at least MIN_RUN_TIME, then the call is timed repeat times.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        count = 1
+        while True:
+            start = time.perf_counter()
+            run(count)
+            if time.perf_counter() - start >= MIN_RUN_TIME:
+                break
+            count *= 2
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(count)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        if enabled:
+            gc.enable()
+    return best / count
+
+
+def result(value, unit, better="higher"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def synthetic_trace(seconds=TRACE_SECONDS, rate=TRACE_RATE):
+    """Return [(accel, gyro)] samples of a swinging blade with clashes."""
+    clashes = [t + 0.25 for t in range(3, seconds, 3)]
+    motion = hal.swing_motion(clashes)
+    return [motion(i / float(rate)) for i in range(seconds * rate)]
+
+
+def load_trace(path):
+    """Return [(accel, gyro)] samples from a telemetry recording."""
+    from telemetry import read_records
+
+    trace = []
+    for record in read_records(path):
+        if record["kind"] == "sample":
+            trace.append(((record["accel_x_signed"], record["accel_y_signed"],
+                           record["accel_z_signed"]),
+                          (record["gyro_x"], record["gyro_y"], record["gyro_z"])))
+    if not trace:
+        raise ValueError("{0} has no IMU samples".format(path))
+    return trace
+
+
+class ServerProcess(object):
+    """OPCServer in a child process, so its receive threads do not compete
+    with the benchmark for the interpreter lock (the real opc-server is a
+    separate process too)."""
+
+    def __init__(self):
+        self._connection, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=self._serve, args=(child,),
+                                                name="benchmark-opc-server")
+        self._process.daemon = True
+        self._process.start()
+        self.address = self._connection.recv()
+
+    @staticmethod
+    def _serve(connection):
+        server = OPCServer("localhost:0").start()
+        connection.send(server.address)
+        connection.recv()               # Until stop()
+        server.stop()
+
+    def stop(self):
+        self._connection.send(None)
+        self._process.join(timeout=2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def _mpu6050(device):
+    """Return the mpu6050 module, reset and reading from device."""
+    sys.path.append(IMU_DIR)
+    import mpu6050
+
+    mpu6050.prev_tot_accel = None
+    mpu6050.flash_counter = 0
+    mpu6050.init_mpu6050(device)
+    return mpu6050
+
+
+def bench_encode(server, repeat, **options):
+    results = {}
+    client = Client(server.address)
+    client.can_connect()
+    for led_count in ENCODE_LED_COUNTS:
+        pixels = [RED] * led_count
+        frame = bytes(RED) * led_count
+
+        def put_pixels(count):
+            for _ in range(count):
+                client.put_pixels(pixels)
+
+        def put_frame(count):
+            for _ in range(count):
+                client.put_frame(frame)
+
+        for name, run in (("put_pixels", put_pixels), ("put_frame", put_frame)):
+            seconds = time_per_op(run, repeat)
+            results["encode.{0}.{1}".format(name, led_count)] = \
+                result(1.0 / seconds, "frames/s")
+    client.disconnect()
+    return results
+
+
+def bench_detect(server, repeat, trace=None, **options):
+    device = hal.VirtualMPU6050()
+    mpu6050 = _mpu6050(device)
+    flashes = [0]
+
+    def run(count):
+        for _ in range(count):
+            mpu6050.prev_tot_accel = None
+            mpu6050.flash_counter = 0
+            flashes[0] = 0
+            for accel, gyro in trace:
+                device.set_motion(accel, gyro)
+                if mpu6050.get_sensor_data()["flash"]:
+                    flashes[0] += 1
+
+    seconds = time_per_op(run, repeat)
+    return {
+        "detect.samples": result(len(trace) / seconds, "samples/s"),
+        "detect.flash_samples": result(flashes[0], "samples", "equal"),
+    }
+
+
+def bench_ignition(server, repeat, **options):
+    renderer = BladeRenderer(LED_COUNT)
+    frames = [0]
+
+    def blade(count):
+        for _ in range(count):
+            frames[0] = 0
+            renderer.state = OFF
+            renderer.press(0.0)
+            now = 0.0
+            while renderer.state != ON:
+                renderer.render(now)
+                now += 0.001
+                frames[0] += 1
+
+    seconds = time_per_op(blade, repeat)
+    results = {"ignition.blade_renderer": result(seconds / frames[0] * 1e6,
+                                                 "us/frame", "lower")}
+
+    from animation import render_ignition
+    client = Client(server.address)
+    client.can_connect()
+
+    def scripted(count):
+        for _ in range(count):
+            render_ignition(client, RED, LED_COUNT)
+
+    seconds = time_per_op(scripted, repeat)
+    client.disconnect()
+    results["ignition.scripted"] = result(seconds / LED_COUNT * 1e6,
+                                          "us/frame", "lower")
+    return results
+
+
+def bench_render(server, repeat, **options):
+    engine = EffectEngine(LED_COUNT, RED, "flicker")
+
+    def run(count):
+        for i in range(count):
+            engine.render(i / 60.0)
+
+    seconds = time_per_op(run, repeat)
+    return {"render.flicker": result(1.0 / seconds, "frames/s")}
+
+
+def bench_loop(server, repeat, trace=None, **options):
+    device = hal.VirtualMPU6050()
+    mpu6050 = _mpu6050(device)
+    renderer = BladeRenderer(LED_COUNT, effect="flicker")
+    client = Client(server.address)
+    client.can_connect()
+
+    def run(count):
+        renderer.state = ON
+        for i in range(count):
+            now = i / 60.0
+            device.set_motion(*trace[i % len(trace)])
+            renderer.sample(mpu6050.get_sensor_data(), now)
+            frame, changed = renderer.render(now)
+            client.put_frame(frame)
+
+    seconds = time_per_op(run, repeat)
+    client.disconnect()
+    return {"loop.fps": result(1.0 / seconds, "frames/s")}
+
+
+BENCHMARKS = {
+    "encode": bench_encode,
+    "detect": bench_detect,
+    "ignition": bench_ignition,
+    "render": bench_render,
+    "loop": bench_loop,
+}
+
+
+def run_benchmarks(groups=GROUPS, repeat=DEFAULT_REPEAT, trace=None):
+    """Run the benchmark groups; return the results document."""
+    if trace is None:
+        trace = synthetic_trace()
+    server = ServerProcess()
+    results = {}
+    try:
+        for group in groups:
+            results.update(BENCHMARKS[group](server, repeat, trace=trace))
+    finally:
+        server.stop()
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "version": VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "node": platform.node(), "numpy": numpy_version},
+        "results": results,
+    }
+
+
+def compare(document, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare results to a baseline document.
+
+    Returns [(name, baseline value, value, relative change, regressed)].
+    The relative change is positive when the result got better.
+    "equal" results (counts that check behaviour) regress on any change.
+    """
+    rows = []
+    base_results = baseline["results"]
+    for name, current in sorted(document["results"].items()):
+        if name not in base_results:
+            continue
+        base = base_results[name]["value"]
+        value = current["value"]
+        if current["better"] == "equal":
+            change = 0.0 if value == base else float("nan")
+            regressed = value != base
+        else:
+            change = (value - base) / base if base else 0.0
+            if current["better"] == "lower":
+                change = -change
+            regressed = change < -threshold
+        rows.append((name, base, value, change, regressed))
+    return rows
+
+
+def print_results(document, rows=None):
+    """Print results, with baseline changes when rows (compare()) is given."""
+    changes = dict((row[0], row) for row in rows or ())
+    for name, current in sorted(document["results"].items()):
+        line = "  {0:28} {1:>12.1f} {2:10}".format(name, current["value"],
+                                                  current["unit"])
+        if name in changes:
+            _, base, _, change, regressed = changes[name]
+            line += " {0:>+7.1%} vs {1:.1f}".format(change, base)
+            if regressed:
+                line += "  REGRESSION"
+        print(line)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lightsaber benchmarks")
+    parser.add_argument("--only", help="Comma separated groups: " + ",".join(GROUPS))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--trace", help="Telemetry recording to use as IMU trace")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    groups = args.only.split(",") if args.only else GROUPS
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error("unknown groups: " + ", ".join(sorted(unknown)))
+
+    trace = load_trace(args.trace) if args.trace else None
+    document = run_benchmarks(groups, args.repeat, trace)
+
+    rows = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            rows = compare(document, json.load(f), args.threshold)
+    print_results(document, rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent="\t", sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent="\t", sort_keys=True)
+        print("Baseline written to {0}".format(args.baseline))
+
+    if rows and any(row[4] for row in rows):
+        sys.exit(1)
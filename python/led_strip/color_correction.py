@@ -0,0 +1,220 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Color Correction
+--------------------------------------------------------------------------
+
+Gamma, white-balance and global brightness correction for encoded frames.
+
+The three corrections are folded into one 256-entry lookup table per color
+channel:
+
+    out = round(255 * brightness * white_balance[c] * (value / 255) ** gamma)
+
+The tables are built once and only rebuilt when a parameter actually
+changes, so correcting a frame costs one table lookup per byte:
+
+- bytes / bytearray frames use bytes.translate() (once for the whole frame
+  when all channels share a table, otherwise once per channel on a
+  stride-3 slice)
+- NumPy uint8 frames of shape (led_count, 3) use a single take() on a
+  combined 768-entry table
+
+Note: the opc-server applies its own table when "enableLookupTable" is true
+in config.json.  When this stage is used, set "enableLookupTable" to false
+so the correction is not applied twice; from_config() reads the same
+"lumCurvePower" and "whitePoint" keys so the values stay in one place.
+
+Software API:
+
+  ColorCorrection(gamma=2.0, white_balance=(1.0, 1.0, 1.0), brightness=1.0)
+
+    set_gamma(gamma)
+    set_white_balance(white_balance)
+    set_brightness(brightness)
+      - Tables are rebuilt lazily, only if the value changed
+
+    tables()
+      - Return the (red, green, blue) 256-byte tables
+
+    apply(frame)
+      - Return the corrected frame, of the same kind as the input
+
+    apply_pixels(pixels)
+      - Encode a list of (r, g, b) tuples and correct it; returns bytes
+
+  ColorCorrection.from_config(path)
+    - Build from the opc-server config.json
+
+--------------------------------------------------------------------------
+"""
+
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+DEFAULT_GAMMA = 2.0
+DEFAULT_WHITE_BALANCE = (1.0, 1.0, 1.0)
+DEFAULT_BRIGHTNESS = 1.0
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def build_table(gamma, scale):
+    """Return a 256-byte table for value -> 255 * scale * (value/255)**gamma."""
+    scale = min(1.0, max(0.0, scale))
+    return bytes(int(round(255 * scale * (v / 255.0) ** gamma))
+                 for v in range(256))
+
+
+class ColorCorrection(object):
+    """Per-channel lookup-table color correction stage."""
+
+    def __init__(self, gamma=DEFAULT_GAMMA, white_balance=DEFAULT_WHITE_BALANCE,
+                 brightness=DEFAULT_BRIGHTNESS):
+        self.gamma = None
+        self.white_balance = None
+        self.brightness = None
+        self._tables = None
+        self._shared_table = None
+        self._np_lut = None
+
+        self.set_gamma(gamma)
+        self.set_white_balance(white_balance)
+        self.set_brightness(brightness)
+
+    @classmethod
+    def from_config(cls, path, brightness=DEFAULT_BRIGHTNESS):
+        """Create a stage from the "lumCurvePower" and "whitePoint" keys of
+        an opc-server config file."""
+        with open(path) as f:
+            config = json.load(f)
+        white = config.get("whitePoint", {})
+        return cls(gamma=config.get("lumCurvePower", DEFAULT_GAMMA),
+                   white_balance=(white.get("red", 1.0),
+                                  white.get("green", 1.0),
+                                  white.get("blue", 1.0)),
+                   brightness=brightness)
+
+    # -----------------------------------------------------
+    # Parameters
+    # -----------------------------------------------------
+
+    def set_gamma(self, gamma):
+        """Set the gamma exponent (1.0 is linear)."""
+        gamma = float(gamma)
+        if gamma <= 0:
+            raise ValueError("gamma must be positive, got {0}".format(gamma))
+        if gamma != self.gamma:
+            self.gamma = gamma
+            self._tables = None
+
+    def set_white_balance(self, white_balance):
+        """Set the (red, green, blue) channel scale factors, each 0.0 - 1.0."""
+        white_balance = tuple(float(w) for w in white_balance)
+        if len(white_balance) != 3:
+            raise ValueError("white_balance needs 3 values, got {0}".format(
+                len(white_balance)))
+        if white_balance != self.white_balance:
+            self.white_balance = white_balance
+            self._tables = None
+
+    def set_brightness(self, brightness):
+        """Set the global brightness, 0.0 - 1.0."""
+        brightness = min(1.0, max(0.0, float(brightness)))
+        if brightness != self.brightness:
+            self.brightness = brightness
+            self._tables = None
+
+    # -----------------------------------------------------
+    # Tables
+    # -----------------------------------------------------
+
+    def tables(self):
+        """Return the (red, green, blue) tables, rebuilding them if needed."""
+        if self._tables is None:
+            self._rebuild()
+        return self._tables
+
+    def _rebuild(self):
+        cache = {}
+        tables = []
+        for w in self.white_balance:
+            scale = self.brightness * w
+            if scale not in cache:
+                cache[scale] = build_table(self.gamma, scale)
+            tables.append(cache[scale])
+        self._tables = tuple(tables)
+        self._shared_table = tables[0] if len(cache) == 1 else None
+
+        if np is not None:
+            self._np_lut = np.frombuffer(b"".join(tables), dtype=np.uint8)
+            self._np_offsets = np.array([0, 256, 512], dtype=np.uint16)
+
+    # -----------------------------------------------------
+    # Apply
+    # -----------------------------------------------------
+
+    def apply(self, frame):
+        """Return the corrected frame.
+
+        NumPy arrays of shape (led_count, 3) give a new uint8 array; bytes
+        and bytearray give the same type back; other bytes-like objects
+        (e.g. memoryview) give a bytearray.
+        """
+        tables = self.tables()
+
+        if np is not None and isinstance(frame, np.ndarray):
+            return self._np_lut.take(frame + self._np_offsets)
+
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = bytearray(memoryview(frame).cast("B"))
+
+        if self._shared_table is not None:
+            return frame.translate(self._shared_table)
+
+        out = bytearray(frame)
+        out[0::3] = frame[0::3].translate(tables[0])
+        out[1::3] = frame[1::3].translate(tables[1])
+        out[2::3] = frame[2::3].translate(tables[2])
+        return bytes(out) if isinstance(frame, bytes) else out
+
+    def apply_pixels(self, pixels):
+        """Encode a list of (r, g, b) tuples and return the corrected bytes."""
+        frame = bytes(min(255, max(0, int(c))) for pixel in pixels for c in pixel)
+        return self.apply(frame)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "config.json"
+    correction = ColorCorrection.from_config(path)
+    print("Color correction from {0}: gamma={1}, white balance={2}".format(
+        path, correction.gamma, correction.white_balance))
+
+    red, green, blue = correction.tables()
+    for v in (0, 16, 32, 64, 128, 192, 255):
+        print("  {0:>3} -> R {1:>3}  G {2:>3}  B {3:>3}".format(
+            v, red[v], green[v], blue[v]))
+
+    # Per-frame cost for a 60 LED blade
+    frame = bytes(range(180))
+    count = 20000
+    start = time.perf_counter()
+    for _ in range(count):
+        correction.apply(frame)
+    elapsed = time.perf_counter() - start
+    print("\napply() on a 60 LED frame: {0:.2f} us".format(elapsed / count * 1e6))
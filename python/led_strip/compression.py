@@ -0,0 +1,216 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber OPC Frame Compression
+--------------------------------------------------------------------------
+
+Compressed framing for OPC links to a server on another host (e.g. over
+Wi-Fi), carried in OPC system-exclusive messages so that plain servers
+simply ignore it.  Blade frames are long runs of one color that change
+only at the ignition front or a clash, so they shrink to a few bytes.
+
+Message (OPC command 255, length = payload length):
+
+    >H   SYSTEM_ID ("LS")
+    B    kind: KIND_RAW, KIND_RLE or KIND_DELTA
+    B    sequence number of this frame (per channel, wraps at 256)
+    >H   LED count
+
+    KIND_RAW:    led_count * 3 pixel bytes
+    KIND_RLE:    runs of (B count, r, g, b)
+    KIND_DELTA:  B base sequence number, then spans of
+                 (>H first LED, >H LED count, count * 3 pixel bytes)
+                 against the frame with the base sequence number
+
+RAW and RLE frames are keyframes.  FrameEncoder sends whichever of the
+three is smallest, but forces a keyframe every keyframe_interval frames,
+when the LED count changes and after reset() (call it on reconnect).
+FrameDecoder keeps the last frame per channel and drops a delta whose base
+is not that frame (a lost or reordered message), until the next keyframe.
+
+Decoding is done by opc_server.py; the opc-server binary does not
+understand these messages, so only enable compression (opc.Client(...,
+compress=True)) with a server that does.
+
+Software API:
+
+  FrameEncoder(keyframe_interval=60)
+    encode(channel, frame)      - Return the OPC message (bytes)
+    reset()
+    bytes_in, bytes_out         - Raw frame and message bytes so far
+
+  FrameDecoder()
+    decode(channel, payload)    - Return the frame (bytes), or None if the
+                                  message was dropped
+    dropped
+
+  encode_rle(frame), decode_rle(data, led_count)
+
+--------------------------------------------------------------------------
+"""
+
+import struct
+
+from animation import changed_spans
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HEADER = struct.Struct(">BBH")
+SYSTEM_EXCLUSIVE = 255
+
+SYSTEM_ID = 0x4C53                  # "LS"
+PREFIX = struct.Struct(">HBBH")     # System ID, kind, sequence, LED count
+SPAN = struct.Struct(">HH")
+
+KIND_RAW = 0
+KIND_RLE = 1
+KIND_DELTA = 2
+
+MAX_RUN = 255
+MAX_PAYLOAD = 0xFFFF
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def encode_rle(frame):
+    """Return frame as runs of (count, r, g, b)."""
+    out = bytearray()
+    end = len(frame)
+    i = 0
+    while i < end:
+        pixel = frame[i:i + 3]
+        j = i + 3
+        limit = min(end, i + MAX_RUN * 3)
+        while j < limit and frame[j:j + 3] == pixel:
+            j += 3
+        out.append((j - i) // 3)
+        out += pixel
+        i = j
+    return bytes(out)
+
+
+def decode_rle(data, led_count):
+    """Return the frame of RLE data, checking it has led_count LEDs."""
+    out = bytearray()
+    for i in range(0, len(data) - 3, 4):
+        out += data[i + 1:i + 4] * data[i]
+    if len(out) != led_count * 3:
+        raise ValueError("RLE data has {0} LEDs, expected {1}".format(
+            len(out) // 3, led_count))
+    return bytes(out)
+
+
+def _message(channel, payload):
+    return HEADER.pack(channel, SYSTEM_EXCLUSIVE, len(payload)) + payload
+
+
+class FrameEncoder(object):
+    """Turns frames into the smallest RAW, RLE or DELTA sysex message."""
+
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reset()
+
+    def reset(self):
+        """Forget previous frames; the next frame on each channel is a key."""
+        self._previous = {}             # channel: (sequence, frame)
+        self._since_key = {}
+
+    def encode(self, channel, frame):
+        """Return the OPC message carrying frame (bytes-like) on channel."""
+        frame = bytes(memoryview(frame).cast("B"))
+        led_count = len(frame) // 3
+        previous = self._previous.get(channel)
+        sequence = 0 if previous is None else (previous[0] + 1) & 0xFF
+        since_key = self._since_key.get(channel, 0) + 1
+
+        rle = encode_rle(frame)
+        if len(rle) < len(frame):
+            kind, body = KIND_RLE, rle
+        else:
+            kind, body = KIND_RAW, frame
+
+        if previous is not None and len(previous[1]) == len(frame) and \
+                since_key < self.keyframe_interval:
+            delta = bytearray((previous[0],))
+            for start, count in changed_spans(previous[1], frame, led_count):
+                delta += SPAN.pack(start, count)
+                delta += frame[start * 3:(start + count) * 3]
+            if len(delta) < len(body):
+                kind, body = KIND_DELTA, bytes(delta)
+
+        if PREFIX.size + len(body) > MAX_PAYLOAD:
+            raise ValueError("Frame too large for one OPC message")
+
+        self._previous[channel] = (sequence, frame)
+        self._since_key[channel] = since_key if kind == KIND_DELTA else 0
+        message = _message(channel, PREFIX.pack(SYSTEM_ID, kind, sequence,
+                                                led_count) + body)
+        self.bytes_in += HEADER.size + len(frame)
+        self.bytes_out += len(message)
+        return message
+
+
+class FrameDecoder(object):
+    """Rebuilds frames from FrameEncoder messages, per channel."""
+
+    def __init__(self):
+        self.dropped = 0
+        self._previous = {}             # channel: (sequence, frame)
+
+    def decode(self, channel, payload):
+        """Return the frame of a sysex payload, or None if it was dropped.
+
+        Payloads with another system ID return None without counting as
+        dropped, as they are meant for other servers.  Malformed payloads
+        (a RAW body of the wrong length, bad RLE runs, a delta span that
+        is cut off or past the LED count) are dropped.
+        """
+        if len(payload) < PREFIX.size:
+            return None
+        system_id, kind, sequence, led_count = PREFIX.unpack_from(payload, 0)
+        if system_id != SYSTEM_ID:
+            return None
+        body = payload[PREFIX.size:]
+
+        if kind == KIND_RAW:
+            if len(body) != led_count * 3:
+                self.dropped += 1
+                return None
+            frame = bytes(body)
+        elif kind == KIND_RLE:
+            try:
+                frame = decode_rle(body, led_count)
+            except ValueError:
+                self.dropped += 1
+                return None
+        elif kind == KIND_DELTA:
+            previous = self._previous.get(channel)
+            if len(body) < 1 or previous is None or previous[0] != body[0] or \
+                    len(previous[1]) != led_count * 3:
+                self.dropped += 1
+                return None
+            frame = bytearray(previous[1])
+            offset = 1
+            while offset < len(body):
+                if offset + SPAN.size > len(body):
+                    self.dropped += 1
+                    return None
+                start, count = SPAN.unpack_from(body, offset)
+                offset += SPAN.size
+                if start + count > led_count or offset + count * 3 > len(body):
+                    self.dropped += 1
+                    return None
+                frame[start * 3:(start + count) * 3] = body[offset:offset + count * 3]
+                offset += count * 3
+            frame = bytes(frame)
+        else:
+            self.dropped += 1
+            return None
+
+        self._previous[channel] = (sequence, frame)
+        return frame
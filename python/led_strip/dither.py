@@ -0,0 +1,241 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Temporal Dithering
+--------------------------------------------------------------------------
+
+Render-side temporal dithering, so slow fades at the low end do not band
+on 8-bit LEDs.
+
+The brightness ramp in led_strip_test.py steps 0 - 255 once every 0.1 s;
+near black each step is a large relative jump (1 -> 2 is double the
+light), and a dimmed blade has only a few levels left at all.  Here the
+framebuffer holds 16-bit values (8.8 fixed point, 0 - 0xFF00) and every
+output frame is
+
+    out = (value + threshold[phase][channel]) >> 8
+
+so a channel at 3.25 shows 3 on three frames out of four and 4 on the
+fourth, and averages to 3.25 over the PERIOD frames of one cycle.
+
+The fractional part is kept to BITS bits and the thresholds of one cycle
+are the bit-reversed sequence (0, 8, 4, 12, 2, ...) scaled to a byte, so
+the extra frames of each level are spread evenly over the cycle rather
+than bunched together.  Each LED starts the cycle at a different phase
+(PHASE_STEP), so the error is spread across the blade too, instead of the
+whole blade stepping at once.  The whole (PERIOD, 3 * led_count)
+threshold table is built once; a frame is one NumPy add into a reused
+buffer whose high bytes are the output (a zip over the channels without
+NumPy).
+
+The effects still render 8-bit frames at render_rate; set_frame() scales
+them by the master brightness in 16 bits, and fade() blends two frames in
+16 bits.  Ignition, retraction and palette color fades are rendered in
+8.8 fixed point as well (BladeRenderer.frame16, Palette.ramp16()) and
+given to set_frame16(), so the leading LED of an ignition ramps up and a
+fade between dim colors does not step.  runtime.Runtime then sends
+render() at the higher dither rate only while some channel has a
+fractional part, so smoother fades cost no extra effect computation, and
+a static frame is not resent.  At brightness 1.0 a steady effect frame
+has no fractional part and is sent as it is.
+
+The opc-server's own "enableDithering" (config.json) stays off; it would
+dither the already 8-bit frames again.
+
+Software API:
+
+  TemporalDither(led_count, brightness=1.0, use_numpy=None)
+    set_frame(frame)            - 8-bit frame, scaled by brightness
+    set_frame16(values)         - 16-bit values (0 - 0xFF00 is 0.0 - 255.0),
+                                  scaled by brightness
+    fade(frame_a, frame_b, t)   - 16-bit blend of two 8-bit frames
+    brightness                  - Master brightness 0.0 - 1.0
+    dithering                   - True if render() output changes per frame
+    render()                    - Next 8-bit frame of the cycle
+
+--------------------------------------------------------------------------
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+BITS = 4                            # Fractional bits that are dithered
+PERIOD = 1 << BITS                  # Frames per dither cycle
+PHASE_STEP = 5                      # Phase offset between neighbouring LEDs
+MAX_VALUE = 0xFF00                  # 255.0 in 8.8 fixed point
+DITHER_RATE = 240                   # Default frames per second while dithering
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _bit_reverse(value, bits):
+    result = 0
+    for _ in range(bits):
+        result = (result << 1) | (value & 1)
+        value >>= 1
+    return result
+
+
+def thresholds(led_count):
+    """Return the threshold table: PERIOD rows of 3 * led_count values."""
+    step = 256 // PERIOD
+    sequence = [_bit_reverse(k, BITS) * step + step // 2 for k in range(PERIOD)]
+    return [[sequence[(k + (i // 3) * PHASE_STEP) % PERIOD]
+             for i in range(3 * led_count)] for k in range(PERIOD)]
+
+
+class TemporalDither(object):
+    """16-bit framebuffer shown as a cycle of dithered 8-bit frames."""
+
+    def __init__(self, led_count, brightness=1.0, use_numpy=None):
+        self.led_count = led_count
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ImportError("use_numpy requires numpy")
+        self.brightness = brightness
+        self.dithering = False
+        self._phase = 0
+
+        table = thresholds(led_count)
+        if self.use_numpy:
+            self._table = np.array(table, dtype=np.uint16)
+            self._values = np.zeros(3 * led_count, dtype=np.uint16)
+            self._sum = np.zeros(3 * led_count, dtype=np.uint16)
+            self._high = self._sum.view(np.uint8)[1::2] if np.little_endian \
+                else self._sum.view(np.uint8)[0::2]
+        else:
+            self._table = table
+            self._values = [0] * (3 * led_count)
+
+    @property
+    def brightness(self):
+        return self._gain / 256.0
+
+    @brightness.setter
+    def brightness(self, value):
+        self._gain = int(round(256 * min(1.0, max(0.0, value))))
+
+    def _quantize(self, values):
+        """Round values to BITS fractional bits and store them."""
+        mask = 0xFFFF & ~(256 // PERIOD - 1)
+        half = 128 // PERIOD
+        if self.use_numpy:
+            values = np.minimum(values + half, MAX_VALUE) & mask
+            self._values[:] = values
+            self.dithering = bool((self._values & 0xFF).any())
+        else:
+            self._values = [min(v + half, MAX_VALUE) & mask for v in values]
+            self.dithering = any(v & 0xFF for v in self._values)
+
+    def _channels(self, frame):
+        if self.use_numpy:
+            if not isinstance(frame, np.ndarray):
+                frame = np.frombuffer(memoryview(frame).cast("B"), dtype=np.uint8)
+            return frame.reshape(-1).astype(np.uint32)
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = memoryview(frame).cast("B")
+        return frame
+
+    def set_frame(self, frame):
+        """Set an 8-bit frame, scaled by brightness in 16 bits."""
+        channels = self._channels(frame)
+        if self.use_numpy:
+            self._quantize(channels * self._gain)
+        else:
+            self._quantize([c * self._gain for c in channels])
+
+    def set_frame16(self, values):
+        """Set 16-bit values (0xFF00 is 255.0), scaled by brightness."""
+        if self.use_numpy:
+            values = np.asarray(values, dtype=np.uint32).reshape(-1)
+            self._quantize(values * self._gain >> 8)
+        else:
+            gain = self._gain
+            self._quantize([int(v) * gain >> 8 for v in values])
+
+    def fade(self, frame_a, frame_b, t):
+        """Set the blend of two 8-bit frames (t 0.0 - 1.0), scaled by brightness."""
+        weight = int(round(256 * min(1.0, max(0.0, t))))
+        a = self._channels(frame_a)
+        b = self._channels(frame_b)
+        if self.use_numpy:
+            self._quantize((a * (256 - weight) + b * weight) * self._gain >> 8)
+        else:
+            gain = self._gain
+            self._quantize([(x * (256 - weight) + y * weight) * gain >> 8
+                            for x, y in zip(a, b)])
+
+    def render(self):
+        """Return the next 8-bit frame of the dither cycle."""
+        table = self._table[self._phase]
+        self._phase = (self._phase + 1) % PERIOD
+        if self.use_numpy:
+            np.add(self._values, table, out=self._sum)
+            return self._high.tobytes()
+        return bytes((v + t) >> 8 for v, t in zip(self._values, table))
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Low-end fade with and without temporal dithering")
+    parser.add_argument("--leds", type=int, default=60)
+    parser.add_argument("--top", type=float, default=8.0,
+                        help="Fade from 0 up to this 8-bit level")
+    parser.add_argument("--seconds", type=float, default=4.0)
+    parser.add_argument("--rate", type=int, default=DITHER_RATE, help="Frames per second")
+    parser.add_argument("--no-dither", action="store_true")
+    parser.add_argument("--address", help="Show the fade on an OPC server")
+    args = parser.parse_args()
+
+    dither = TemporalDither(args.leds)
+    frames = int(args.seconds * args.rate)
+
+    # Cost per frame
+    dither.set_frame16([0x0340] * (3 * args.leds))
+    start = time.perf_counter()
+    for _ in range(1000):
+        dither.render()
+    print("render: {0:.1f} us per frame ({1})".format(
+        (time.perf_counter() - start) * 1e3, "numpy" if dither.use_numpy else "python"))
+
+    # Distinct average levels seen over the fade, one per dither cycle
+    plain, dithered = set(), set()
+    for start in range(0, frames - PERIOD + 1, PERIOD):
+        value = int(args.top * 256 * start / frames)
+        plain.add(value >> 8)
+        dither.set_frame16([value] * (3 * args.leds))
+        dithered.add(sum(dither.render()[0] for _ in range(PERIOD)))
+    print("fade 0 - {0}: {1} levels plain, {2} levels dithered".format(
+        args.top, len(plain), len(dithered)))
+
+    if args.address:
+        from opc import Client
+        client = Client(args.address)
+        if not client.can_connect():
+            print("WARNING: could not connect to %s" % args.address)
+        period = 1.0 / args.rate
+        deadline = time.monotonic()
+        for i in range(frames):
+            value = int(args.top * 256 * i / frames)
+            if args.no_dither:
+                frame = bytes([value >> 8]) * (3 * args.leds)
+            else:
+                dither.set_frame16([value] * (3 * args.leds))
+                frame = dither.render()
+            client.put_frame(frame)
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
+        client.put_frame(bytes(3 * args.leds))
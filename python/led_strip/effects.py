@@ -0,0 +1,308 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Blade Effects
+--------------------------------------------------------------------------
+
+Procedural effect engine that computes a whole blade frame at a time
+instead of looping over (r, g, b) tuples per LED.
+
+Every effect is built from two precomputed pieces:
+
+- a noise table of NOISE_SIZE smooth brightness levels (0 - LEVEL_MAX),
+  generated once from a seed
+- per-LED phase arrays, i.e. fixed offsets into the noise table, so each
+  LED reads its own part of the table without any per-LED random calls
+
+A frame is then just "look up a level per LED and scale the blade color by
+it".  With NumPy that is a handful of array operations on uint8 / uint16
+arrays; without NumPy the levels index into precomputed 3-byte color
+strings that are joined into a bytearray.
+
+Frames are returned as a NumPy uint8 array of shape (led_count, 3) or as a
+bytearray of led_count * 3 bytes.  Both can be sent as is with
+opc.Client.put_frame().
+
+Software API:
+
+  EffectEngine(led_count, color=(255, 0, 0), effect="steady", seed=0,
+               use_numpy=None)
+    - use_numpy=None uses NumPy if it can be imported
+
+    set_color(color)
+      - Set the blade color; rebuilds the fallback color tables
+
+    set_effect(name)
+      - One of EFFECTS: "steady", "flicker", "shimmer", "unstable"
+
+    render(t)
+      - Return the frame for time t (seconds)
+
+  benchmark(led_counts, effects, duration)
+    - Return a list of (effect, led_count, fps) tuples
+
+Running this file prints frames per second versus LED count for every
+effect (60 - 5,000 LEDs), for NumPy (if present) and the fallback.
+
+--------------------------------------------------------------------------
+"""
+
+import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+EFFECTS = ("steady", "flicker", "shimmer", "unstable")
+
+NOISE_SIZE = 1024                   # Must be a power of two
+NOISE_MASK = NOISE_SIZE - 1
+NOISE_KNOT_SPACING = 16             # Table entries between random knots
+
+LEVEL_MAX = 256                     # Level that maps to full brightness
+
+# Effect tuning: (table steps per second, minimum level, LED phase step)
+FLICKER_RATE = 240
+FLICKER_MIN_LEVEL = 176
+SHIMMER_RATE = 180
+SHIMMER_MIN_LEVEL = 150
+SHIMMER_LED_STEP = 5                # Neighbouring LEDs are close in the table
+UNSTABLE_RATE = 900
+UNSTABLE_MIN_LEVEL = 96
+UNSTABLE_SPARK_RATE = 1500
+UNSTABLE_SPARK_THRESHOLD = 224      # Spark when the spark noise is above this
+
+BENCHMARK_LED_COUNTS = (60, 120, 300, 600, 1200, 2500, 5000)
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def make_noise_table(seed, min_level, size=NOISE_SIZE, spacing=NOISE_KNOT_SPACING):
+    """Return a smooth, wrapping list of size levels in [min_level, LEVEL_MAX].
+
+    Random knots every spacing entries are joined with cosine interpolation,
+    which gives a soft flicker rather than white noise.
+    """
+    rng = random.Random(seed)
+    knots = [rng.random() for _ in range(size // spacing)]
+    table = []
+    for i in range(size):
+        k, frac = divmod(i, spacing)
+        a = knots[k]
+        b = knots[(k + 1) % len(knots)]
+        mix = (1 - math.cos(math.pi * frac / spacing)) / 2
+        value = a + (b - a) * mix
+        table.append(int(min_level + value * (LEVEL_MAX - min_level)))
+    return table
+
+
+def make_spark_table(seed, size=NOISE_SIZE):
+    """Return a list of size values in [0, 255] of unsmoothed noise."""
+    rng = random.Random(seed)
+    return [rng.randrange(256) for _ in range(size)]
+
+
+class EffectEngine(object):
+    """Whole-blade effect renderer."""
+
+    def __init__(self, led_count, color=(255, 0, 0), effect="steady", seed=0,
+                 use_numpy=None):
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ValueError("NumPy requested but it is not installed")
+
+        self.led_count = led_count
+        self.use_numpy = use_numpy
+        self.effect = None
+        self.color = None
+
+        # Precomputed noise tables
+        self._tables = {
+            "flicker": make_noise_table(seed, FLICKER_MIN_LEVEL),
+            "shimmer": make_noise_table(seed + 1, SHIMMER_MIN_LEVEL),
+            "unstable": make_noise_table(seed + 2, UNSTABLE_MIN_LEVEL,
+                                         spacing=2),
+        }
+        self._spark = make_spark_table(seed + 3)
+
+        # Per-LED phase arrays
+        rng = random.Random(seed + 4)
+        jitter = [rng.randrange(8) for _ in range(led_count)]
+        self._phases = {
+            "flicker": jitter,
+            "shimmer": [(i * SHIMMER_LED_STEP) & NOISE_MASK
+                        for i in range(led_count)],
+            "unstable": [rng.randrange(NOISE_SIZE) for _ in range(led_count)],
+            "spark": [rng.randrange(NOISE_SIZE) for _ in range(led_count)],
+        }
+
+        if use_numpy:
+            self._np_tables = dict((name, np.array(table, dtype=np.uint16))
+                                   for name, table in self._tables.items())
+            self._np_spark = np.array(self._spark, dtype=np.uint8)
+            self._np_phases = dict((name, np.array(phase, dtype=np.intp))
+                                   for name, phase in self._phases.items())
+            self._np_frame = np.zeros((led_count, 3), dtype=np.uint8)
+
+        self.set_color(color)
+        self.set_effect(effect)
+
+    def set_color(self, color):
+        """Set the blade color and rebuild the color lookup tables."""
+        color = tuple(min(255, max(0, int(c))) for c in color)
+        if color == self.color:
+            return
+        self.color = color
+
+        # Color scaled by each level, for the pure Python path
+        self._level_bytes = [bytes((c * level) >> 8 for c in color)
+                             for level in range(LEVEL_MAX + 1)]
+        spark_color = tuple((c + 255) // 2 for c in color)
+        self._spark_bytes = [bytes((c * level) >> 8 for c in spark_color)
+                             for level in range(LEVEL_MAX + 1)]
+        self._steady_frame = bytearray(self._level_bytes[LEVEL_MAX] * self.led_count)
+
+        if self.use_numpy:
+            self._np_color = np.array(color, dtype=np.uint16)
+            self._np_spark_color = np.array(spark_color, dtype=np.uint16)
+            self._np_steady = np.tile(np.array(color, dtype=np.uint8),
+                                      (self.led_count, 1))
+
+    def set_effect(self, name):
+        """Select the effect used by render()."""
+        if name not in EFFECTS:
+            raise ValueError("Unknown effect {0!r}; expected one of {1}".format(
+                name, ", ".join(EFFECTS)))
+        self.effect = name
+
+    def render(self, t):
+        """Return the frame for time t (in seconds).
+
+        The returned frame is owned by the engine and may be overwritten by
+        the next call; copy it if it needs to be kept.
+        """
+        if self.use_numpy:
+            return self._render_numpy(t)
+        return self._render_python(t)
+
+    # -----------------------------------------------------
+    # NumPy path
+    # -----------------------------------------------------
+
+    def _np_levels(self, name, rate, t):
+        offset = int(t * rate)
+        index = (self._np_phases[name] + offset) & NOISE_MASK
+        return self._np_tables[name][index]
+
+    def _scale(self, color, levels):
+        return (color[np.newaxis, :] * levels[:, np.newaxis]) >> 8
+
+    def _render_numpy(self, t):
+        effect = self.effect
+        if effect == "steady":
+            return self._np_steady
+
+        frame = self._np_frame
+        if effect == "flicker":
+            levels = self._np_levels("flicker", FLICKER_RATE, t)
+            frame[:] = self._scale(self._np_color, levels)
+        elif effect == "shimmer":
+            levels = self._np_levels("shimmer", SHIMMER_RATE, t)
+            frame[:] = self._scale(self._np_color, levels)
+        else:
+            levels = self._np_levels("unstable", UNSTABLE_RATE, t)
+            spark_index = (self._np_phases["spark"] +
+                           int(t * UNSTABLE_SPARK_RATE)) & NOISE_MASK
+            sparks = self._np_spark[spark_index] > UNSTABLE_SPARK_THRESHOLD
+            base = self._scale(self._np_color, levels)
+            lit = self._scale(self._np_spark_color, levels)
+            frame[:] = np.where(sparks[:, np.newaxis], lit, base)
+        return frame
+
+    # -----------------------------------------------------
+    # Pure Python path
+    # -----------------------------------------------------
+
+    def _py_levels(self, name, rate, t):
+        offset = int(t * rate)
+        table = self._tables[name]
+        return [table[(p + offset) & NOISE_MASK] for p in self._phases[name]]
+
+    def _render_python(self, t):
+        effect = self.effect
+        if effect == "steady":
+            return self._steady_frame
+
+        if effect in ("flicker", "shimmer"):
+            rate = FLICKER_RATE if effect == "flicker" else SHIMMER_RATE
+            level_bytes = self._level_bytes
+            return bytearray(b"".join(
+                [level_bytes[level] for level in self._py_levels(effect, rate, t)]))
+
+        levels = self._py_levels("unstable", UNSTABLE_RATE, t)
+        offset = int(t * UNSTABLE_SPARK_RATE)
+        spark = self._spark
+        choices = (self._level_bytes, self._spark_bytes)
+        return bytearray(b"".join([
+            choices[spark[(p + offset) & NOISE_MASK] > UNSTABLE_SPARK_THRESHOLD][level]
+            for p, level in zip(self._phases["spark"], levels)]))
+
+
+def benchmark(led_counts=BENCHMARK_LED_COUNTS, effects=EFFECTS, duration=0.25,
+              use_numpy=None):
+    """Render each effect for about duration seconds per LED count.
+
+    Returns a list of (effect, led_count, frames_per_second) tuples.
+    """
+    results = []
+    for led_count in led_counts:
+        engine = EffectEngine(led_count, use_numpy=use_numpy)
+        for effect in effects:
+            engine.set_effect(effect)
+            frames = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while elapsed < duration:
+                engine.render(frames / 60.0)
+                frames += 1
+                elapsed = time.perf_counter() - start
+            results.append((effect, led_count, frames / elapsed))
+    return results
+
+
+def print_benchmark(results, title):
+    """Print benchmark() results as a table of FPS per effect."""
+    led_counts = sorted(set(r[1] for r in results))
+    effects = [e for e in EFFECTS if any(r[0] == e for r in results)]
+    fps = dict(((e, n), f) for e, n, f in results)
+
+    print(title)
+    print("  {0:>6} ".format("LEDs") +
+          "".join("{0:>12}".format(e) for e in effects))
+    for n in led_counts:
+        print("  {0:>6} ".format(n) +
+              "".join("{0:>12.0f}".format(fps[(e, n)]) for e in effects))
+    print("")
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    print("Effect engine benchmark (frames per second)\n")
+
+    if np is not None:
+        print_benchmark(benchmark(use_numpy=True), "NumPy")
+    else:
+        print("NumPy not installed; skipping the NumPy benchmark.\n")
+
+    print_benchmark(benchmark(use_numpy=False), "Pure Python fallback")
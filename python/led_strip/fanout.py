@@ -0,0 +1,244 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Fan-out Output
+--------------------------------------------------------------------------
+
+Sends one logical frame to several OPC servers and channels, for props
+that drive more than one blade or strip from a single controller.
+
+The logical frame is every LED of every blade in sequence.  Segments map
+LED ranges of it to a (server, channel) pair:
+
+    "outputs": [
+        {"start": 0,  "count": 60, "address": "localhost:7890", "channel": 1},
+        {"start": 60, "count": 60, "address": "localhost:7890", "channel": 2},
+        {"start": 0,  "count": 60, "address": "10.0.0.12:7890", "channel": 0}
+    ]
+
+(a segment may repeat LEDs of another, e.g. to mirror a blade).  Addresses
+take every form opc.Client accepts, including "unix:" and "udp://".
+
+Each server has one persistent connection.  Per frame, the messages for
+all of a server's channels are gathered into one sendmsg() call, with the
+headers and memoryview slices of the frame as separate buffers, so there
+is one system call and no copy per server.  Servers are sent to
+concurrently from a thread pool, so a slow or unreachable server does not
+hold up the others; an unreachable server is retried at most every
+RECONNECT_INTERVAL seconds.
+
+FanOut has the put_frame() / put_pixels() interface of opc.Client, so it
+can replace the client in runtime.Runtime (lightsaber.py does this when
+lightsaber.json has "outputs").
+
+Software API:
+
+  Segment(start, count, address, channel=0)
+
+  FanOut(segments, timeout=1.0)
+    put_frame(frame, channel=0), put_pixels(pixels, channel=0)
+                        - Send the segments of a whole logical frame
+    can_connect(), disconnect()
+    health()            - Per server state, counters and send time
+    led_count           - LEDs in the logical frame
+
+  FanOut.from_config(outputs)
+
+--------------------------------------------------------------------------
+"""
+
+import collections
+import concurrent.futures
+import socket
+import struct
+import time
+
+from opc import open_socket, parse_address
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HEADER = struct.Struct(">BBH")
+SET_PIXEL_COLOURS = 0
+
+RECONNECT_INTERVAL = 1.0            # Seconds between connection attempts
+SEND_TIME_SMOOTHING = 0.1           # Weight of the newest send in send_time
+
+Segment = collections.namedtuple("Segment", "start count address channel")
+Segment.__new__.__defaults__ = (0,)
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class _Server(object):
+    """Persistent connection and counters for one OPC server."""
+
+    def __init__(self, address, segments, timeout):
+        self.address = address
+        self.segments = segments
+        self.timeout = timeout
+        self._socket = None
+        self._next_attempt = 0.0
+
+        # One header per segment, built once; lengths never change
+        self._headers = [HEADER.pack(segment.channel, SET_PIXEL_COLOURS,
+                                     segment.count * 3) for segment in segments]
+
+        self.frames = 0
+        self.failures = 0
+        self.connects = 0
+        self.skipped = 0
+        self.send_time = None
+        self.last_error = None
+
+    def connect(self):
+        if self._socket is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + RECONNECT_INTERVAL
+        transport, target = parse_address(self.address)
+        try:
+            sock = open_socket(transport, target, self.timeout)
+            if transport == "tcp":
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as error:
+            self.last_error = str(error)
+            return False
+        self._socket = sock
+        self.connects += 1
+        return True
+
+    def disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = None
+
+    def send(self, frame):
+        """Send this server's segments of frame in one sendmsg() call."""
+        if not self.connect():
+            self.skipped += 1
+            return False
+
+        buffers = []
+        for header, segment in zip(self._headers, self.segments):
+            buffers.append(header)
+            buffers.append(frame[segment.start * 3:(segment.start + segment.count) * 3])
+        total = sum(len(buffer) for buffer in buffers)
+
+        start = time.perf_counter()
+        try:
+            sent = self._socket.sendmsg(buffers)
+            if sent < total:
+                # Rare short write on a stream; send the rest in one piece
+                self._socket.sendall(b"".join(bytes(b) for b in buffers)[sent:])
+        except BlockingIOError:
+            self.skipped += 1           # UDP send buffer full; drop this frame
+            return False
+        except OSError as error:
+            self.failures += 1
+            self.last_error = str(error)
+            self.disconnect()
+            return False
+        elapsed = time.perf_counter() - start
+
+        self.frames += 1
+        if self.send_time is None:
+            self.send_time = elapsed
+        else:
+            self.send_time += SEND_TIME_SMOOTHING * (elapsed - self.send_time)
+        return True
+
+    def health(self):
+        return {
+            "connected": self._socket is not None,
+            "channels": [segment.channel for segment in self.segments],
+            "frames": self.frames,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "connects": self.connects,
+            "send_time": self.send_time,
+            "last_error": self.last_error,
+        }
+
+
+class FanOut(object):
+    """Sends segments of a logical frame to several OPC servers at once."""
+
+    def __init__(self, segments, timeout=1.0):
+        if not segments:
+            raise ValueError("FanOut needs at least one segment")
+        self.segments = list(segments)
+        self.led_count = max(s.start + s.count for s in self.segments)
+
+        by_address = collections.OrderedDict()
+        for segment in self.segments:
+            by_address.setdefault(segment.address, []).append(segment)
+        self._servers = [_Server(address, segments, timeout)
+                         for address, segments in by_address.items()]
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self._servers), thread_name_prefix="lightsaber-fanout")
+
+        # Optional latency / profiler hooks, as on opc.Client
+        self.latency = None
+        self.profiler = None
+
+    @classmethod
+    def from_config(cls, outputs, timeout=1.0):
+        """Build a FanOut from the "outputs" list of lightsaber.json."""
+        return cls([Segment(output["start"], output["count"], output["address"],
+                            output.get("channel", 0)) for output in outputs],
+                   timeout)
+
+    def can_connect(self):
+        """Connect to every server; return True if all are reachable."""
+        return all(list(self._executor.map(lambda server: server.connect(),
+                                           self._servers)))
+
+    def disconnect(self):
+        for server in self._servers:
+            server.disconnect()
+
+    def close(self):
+        self.disconnect()
+        self._executor.shutdown(wait=True)
+
+    def put_frame(self, frame, channel=0):
+        """Send each segment of frame to its server and channel.
+
+        frame is the whole logical frame (led_count * 3 bytes); channel is
+        ignored, since the segments decide the channels.  Return True if
+        every server was sent its segments.
+        """
+        frame = memoryview(frame).cast("B")
+        if len(frame) < self.led_count * 3:
+            raise ValueError("Frame has {0} LEDs, segments need {1}".format(
+                len(frame) // 3, self.led_count))
+        if self.latency is not None:
+            self.latency.stamp("encode")
+        if self.profiler is not None:
+            start = self.profiler.begin()
+
+        if len(self._servers) == 1:
+            ok = self._servers[0].send(frame)
+        else:
+            ok = all(list(self._executor.map(lambda server: server.send(frame),
+                                             self._servers)))
+
+        if self.profiler is not None:
+            self.profiler.end("fanout.send", start)
+        if self.latency is not None:
+            self.latency.stamp("send")
+        return ok
+
+    def put_pixels(self, pixels, channel=0):
+        """Send a whole logical frame given as a list of (r, g, b)."""
+        return self.put_frame(bytes(min(255, max(0, int(c)))
+                                    for pixel in pixels for c in pixel), channel)
+
+    def health(self):
+        """Return {address: state and counters} for every server."""
+        return collections.OrderedDict((server.address, server.health())
+                                       for server in self._servers)
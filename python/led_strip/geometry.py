@@ -0,0 +1,201 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Blade Geometry
+--------------------------------------------------------------------------
+
+Positions of the LEDs along the blade, and effects placed at a position
+(localized clash flashes, blaster marks) instead of over the whole blade.
+
+The blade is two strips of led_count / 2 LEDs in sequence, the second one
+mounted in reverse (map_reverse_led in the scripts): index 0 and index
+led_count - 1 are both at the hilt, and the two strips meet at the tip in
+the middle of the index range.  BladeGeometry precomputes each LED's
+position once, from 0.0 (hilt) to 1.0 (tip), so both strips light up
+together around a point.
+
+A Mark is an effect at a position: a falloff mask (level 0 - LEVEL_MAX per
+LED, a smooth bump of the given width around the position) is computed
+once when the event happens, along with the list of LEDs it touches.
+Every frame then only blends the mark's color into those LEDs by mask
+times the mark's fade, which is one array operation with NumPy.
+
+The impact position is estimated from the IMU by ImpactEstimator.  The
+flash is detected on the sample after the jolt, so the estimator keeps
+the previous sample.  The estimate is a heuristic: a fast swing (high
+angular velocity) hits with the fast-moving outer part of the blade, and
+a hard jolt with little rotation is a hit near the hilt:
+
+    tip_speed = |angular velocity| * BLADE_LENGTH        (m/s)
+    position  = tip_speed / (tip_speed + |jolt| * JOLT_SPEED)
+
+Software API:
+
+  BladeGeometry(led_count, use_numpy=None)
+    positions           - Position of every LED, 0.0 - 1.0
+    mask(center, width) - Falloff levels (0 - LEVEL_MAX) per LED
+    mark(center, width, color, start, duration, fade=True)
+                        - Mark at a position
+    apply(frame, marks, now)
+                        - Frame with the active marks blended in
+
+  Mark                  - leds, levels, color, start, duration, fade
+    active(now), strength(now)
+
+  ImpactEstimator(length=BLADE_LENGTH)
+    update(data)        - Return the impact position when a flash starts,
+                          else None
+
+--------------------------------------------------------------------------
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+LEVEL_MAX = 256                     # Mask level of a fully covered LED
+
+BLADE_LENGTH = 0.8                  # Metres, hilt to tip
+JOLT_SPEED = 2.0                    # m/s of tip speed that weighs as much
+                                    # as a 1 g jolt in the position estimate
+CENTER = 0.5                        # Position when there is no motion at all
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class Mark(object):
+    """A colored spot on the blade with a precomputed falloff mask."""
+
+    def __init__(self, leds, levels, color, start, duration, fade=True):
+        self.leds = leds
+        self.levels = levels
+        self.color = tuple(color)
+        self.start = start
+        self.duration = duration
+        self.fade = fade
+
+    def active(self, now):
+        return now < self.start + self.duration
+
+    def strength(self, now):
+        """Blend strength 0 - LEVEL_MAX at time now (fades out if fade)."""
+        if not self.fade:
+            return LEVEL_MAX
+        remaining = 1.0 - (now - self.start) / self.duration
+        return int(LEVEL_MAX * min(1.0, max(0.0, remaining)))
+
+
+class BladeGeometry(object):
+    """Position of every LED along the blade."""
+
+    def __init__(self, led_count, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy and np is None:
+            raise ValueError("NumPy requested but it is not installed")
+        self.led_count = led_count
+        self.use_numpy = use_numpy
+
+        half = led_count // 2
+        positions = []
+        for i in range(led_count):
+            if i < half:
+                positions.append((i + 0.5) / half)
+            elif i >= led_count - half:
+                positions.append((led_count - 1 - i + 0.5) / half)
+            else:
+                positions.append(1.0)   # Odd LED between the strips, at the tip
+        self.positions = positions
+
+        if use_numpy:
+            self._np_positions = np.array(positions, dtype=np.float64)
+            self._np_frame = np.zeros((led_count, 3), dtype=np.uint8)
+
+    def mask(self, center, width):
+        """Return falloff levels per LED: a smooth bump of half-width width."""
+        if self.use_numpy:
+            d = np.minimum(np.abs(self._np_positions - center) / width, 1.0)
+            return (LEVEL_MAX * (1.0 - d * d) ** 2).astype(np.int32)
+        levels = []
+        for position in self.positions:
+            d = min(abs(position - center) / width, 1.0)
+            levels.append(int(LEVEL_MAX * (1.0 - d * d) ** 2))
+        return levels
+
+    def mark(self, center, width, color, start, duration, fade=True):
+        """Return a Mark at center; its mask only keeps the LEDs it lights."""
+        center = min(1.0, max(0.0, center))
+        levels = self.mask(center, width)
+        if self.use_numpy:
+            leds = np.flatnonzero(levels)
+            return Mark(leds, levels[leds, np.newaxis], color, start, duration, fade)
+        leds = [i for i, level in enumerate(levels) if level]
+        return Mark(leds, [levels[i] for i in leds], color, start, duration, fade)
+
+    def apply(self, frame, marks, now):
+        """Return frame with the active marks blended in.
+
+        frame is any bytes-like frame or (led_count, 3) uint8 array; the
+        result is a buffer owned by the geometry, reused by the next call.
+        """
+        if self.use_numpy:
+            out = self._np_frame
+            out[:] = np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3) \
+                if not isinstance(frame, np.ndarray) else frame
+            for mark in marks:
+                strength = mark.strength(now)
+                if strength == 0 or len(mark.leds) == 0:
+                    continue
+                base = out[mark.leds].astype(np.int32)
+                color = np.array(mark.color, dtype=np.int32)
+                level = (mark.levels * strength) >> 8
+                out[mark.leds] = base + (((color - base) * level) >> 8)
+            return out
+
+        out = bytearray(frame)
+        for mark in marks:
+            strength = mark.strength(now)
+            if strength == 0:
+                continue
+            for led, mask_level in zip(mark.leds, mark.levels):
+                level = (mask_level * strength) >> 8
+                j = led * 3
+                for c in range(3):
+                    out[j + c] += ((mark.color[c] - out[j + c]) * level) >> 8
+        return out
+
+
+class ImpactEstimator(object):
+    """Estimates where along the blade a detected clash hit."""
+
+    def __init__(self, length=BLADE_LENGTH):
+        self.length = length
+        self._previous = None
+        self._flash = False
+
+    def update(self, data):
+        """Take a get_sensor_data() sample; return a position when a flash starts."""
+        previous = self._previous if self._previous is not None else data
+        self._previous = data
+        flash = bool(data.get("flash"))
+        started = flash and not self._flash
+        self._flash = flash
+        if not started:
+            return None
+        return self.estimate(previous)
+
+    def estimate(self, data):
+        """Return the impact position (0.0 hilt - 1.0 tip) of a jolt sample."""
+        dps = math.sqrt(data["gyro_x"] ** 2 + data["gyro_y"] ** 2 + data["gyro_z"] ** 2)
+        tip_speed = math.radians(dps) * self.length
+        jolt = data["tot_accel"] * JOLT_SPEED
+        if tip_speed + jolt <= 0.0:
+            return CENTER
+        return tip_speed / (tip_speed + jolt)
@@ -0,0 +1,176 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Idle Governor
+--------------------------------------------------------------------------
+
+Lowers the IMU sample rate, the render rate and the OPC keepalive rate
+while nothing is happening, to save battery and keep the board cool.
+
+Modes:
+
+    active  - Within still_time of a button edge, a motion interrupt or
+              an IMU sample above motion_threshold: full rates
+    still   - Blade on but motionless: the IMU is sampled at
+              STILL_SAMPLE_RATE and unchanged frames are only resent
+              every IDLE_KEEPALIVE seconds
+    off     - Blade off: the IMU is sampled at OFF_SAMPLE_RATE
+
+In still and off, the render rate drops to IDLE_RENDER_RATE as long as
+rendered frames do not change (an animated effect or a fade keeps the
+full rate).
+
+runtime.Runtime asks the governor for each stage's interval after every
+step.  A button edge, a motion interrupt from the MPU6050's INT pin or a
+sample with motion calls wake(); if that leaves still or off, the Runtime
+cuts every stage's current sleep short, so full rate is back within one
+frame.  Further wakes while active only extend the active time.
+
+For each mode the governor measures wall time, process CPU time and
+wakeups (stage steps, counted with tick()); summary() reports CPU use and
+wakeups per second per mode.
+
+Software API:
+
+  IdleGovernor(sample_rate=60, render_rate=60, keepalive_interval=1.0,
+               still_time=2.0, motion_threshold=0.3)
+    mode
+    sample_interval(), render_interval(), keepalive_interval()
+    sample(data, now)       - Return True if the sample shows motion (wakes)
+    rendered(is_on, changed, now)
+    wake(now)               - Button edge / motion interrupt; return True
+                              if it left still or off
+    tick()                  - Count a wakeup
+    stats()                 - {mode: {"seconds", "cpu", "wakeups"}}
+    summary()
+
+--------------------------------------------------------------------------
+"""
+
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+ACTIVE = "active"
+STILL = "still"
+OFF = "off"
+MODES = (ACTIVE, STILL, OFF)
+
+STILL_TIME = 2.0                    # Seconds without activity before idling
+MOTION_THRESHOLD = 0.3              # comb_accel_gyro of a moving blade
+STILL_SAMPLE_RATE = 20
+OFF_SAMPLE_RATE = 5
+IDLE_RENDER_RATE = 5
+IDLE_KEEPALIVE = 5.0                # Seconds between resends of a static frame
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class IdleGovernor(object):
+    """Chooses stage rates from blade state and activity."""
+
+    def __init__(self, sample_rate=60, render_rate=60, keepalive_interval=1.0,
+                 still_time=STILL_TIME, motion_threshold=MOTION_THRESHOLD,
+                 clock=time.monotonic, cpu_clock=time.process_time):
+        self.sample_rate = sample_rate
+        self.render_rate = render_rate
+        self.base_keepalive = keepalive_interval
+        self.still_time = still_time
+        self.motion_threshold = motion_threshold
+        self._clock = clock
+        self._cpu_clock = cpu_clock
+
+        self.mode = ACTIVE
+        self._is_on = False
+        self._changing = True
+        self._last_activity = clock()
+
+        self._stats = dict((mode, {"seconds": 0.0, "cpu": 0.0, "wakeups": 0})
+                           for mode in MODES)
+        self._mode_start = self._last_activity
+        self._cpu_start = cpu_clock()
+
+    # -----------------------------------------------------
+    # Input
+    # -----------------------------------------------------
+
+    def wake(self, now=None):
+        """Note activity; full rates for the next still_time seconds.
+
+        Return True if this left still or off (the stages should wake).
+        """
+        woke = self.mode != ACTIVE
+        self._last_activity = self._clock() if now is None else now
+        self._update(self._last_activity)
+        return woke
+
+    def sample(self, data, now):
+        """Check an IMU sample for motion; return True if it woke the governor."""
+        if data.get("flash") or data.get("comb_accel_gyro", 0.0) >= self.motion_threshold:
+            return self.wake(now)
+        return False
+
+    def rendered(self, is_on, changed, now):
+        """Note the blade state and whether the rendered frame changed."""
+        self._is_on = is_on
+        self._changing = changed
+        self._update(now)
+
+    def tick(self):
+        self._stats[self.mode]["wakeups"] += 1
+
+    def _update(self, now):
+        if now - self._last_activity < self.still_time:
+            mode = ACTIVE
+        else:
+            mode = STILL if self._is_on else OFF
+        if mode != self.mode:
+            self._account(now)
+            self.mode = mode
+
+    def _account(self, now):
+        cpu = self._cpu_clock()
+        stats = self._stats[self.mode]
+        stats["seconds"] += now - self._mode_start
+        stats["cpu"] += cpu - self._cpu_start
+        self._mode_start = now
+        self._cpu_start = cpu
+
+    # -----------------------------------------------------
+    # Rates
+    # -----------------------------------------------------
+
+    def sample_interval(self):
+        if self.mode == ACTIVE:
+            return 1.0 / self.sample_rate
+        return 1.0 / (STILL_SAMPLE_RATE if self.mode == STILL else OFF_SAMPLE_RATE)
+
+    def render_interval(self):
+        if self.mode == ACTIVE or self._changing:
+            return 1.0 / self.render_rate
+        return 1.0 / IDLE_RENDER_RATE
+
+    def keepalive_interval(self):
+        return self.base_keepalive if self.mode == ACTIVE else IDLE_KEEPALIVE
+
+    # -----------------------------------------------------
+    # Report
+    # -----------------------------------------------------
+
+    def stats(self):
+        """Return {mode: {"seconds", "cpu", "wakeups"}}, including the current mode."""
+        self._account(self._clock())
+        return dict((mode, dict(stats)) for mode, stats in self._stats.items())
+
+    def summary(self):
+        """Return one line with CPU use and wakeups per second in each mode."""
+        fields = []
+        for mode, stats in sorted(self.stats().items(), key=lambda item: MODES.index(item[0])):
+            if stats["seconds"] <= 0.0:
+                continue
+            fields.append("{0} {1:.1f} s cpu {2:.1%} {3:.1f} wakeups/s".format(
+                mode, stats["seconds"], stats["cpu"] / stats["seconds"],
+                stats["wakeups"] / stats["seconds"]))
+        return "governor: " + " | ".join(fields)
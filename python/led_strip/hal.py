@@ -0,0 +1,374 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Hardware Abstraction
+--------------------------------------------------------------------------
+
+Backends for the three pieces of hardware the lightsaber talks to, so the
+code can run (and be benchmarked) off the PocketBeagle:
+
+    GPIO    - the Adafruit_BBIO.GPIO interface: setup(), input(),
+              add_event_detect(), remove_event_detect(), cleanup()
+    I2C     - the smbus2.SMBus interface: read_byte_data(),
+              write_byte_data(), read_i2c_block_data()
+    Pixels  - the opc.Client interface: put_pixels(), put_frame(),
+              can_connect(), disconnect()
+
+The real backends are the libraries themselves, imported only when opened.
+The simulated backends are deterministic and run on a SimulatedClock, so a
+run with the same script always produces the same frames:
+
+    SimulatedGPIO     - scripted pin edges; callbacks fire from update()
+    VirtualMPU6050    - MPU6050 register file on a virtual I2C bus, filled
+                        from a motion function of time
+    PixelSink         - in-memory pixel output with a running CRC of every
+                        frame, for regression checks
+
+headless.py runs the full lightsaber loop on these backends.
+
+Software API:
+
+  open_gpio(), open_i2c(bus_number=2), open_pixels(address)
+                        - Real backends
+
+  SimulatedClock(start=0.0)
+    now, advance(seconds), call to read the time
+
+  SimulatedGPIO(clock)
+    press(pin, at, duration)    - Script a button press
+    update()                    - Apply edges due by clock time
+
+  VirtualMPU6050(motion=None, clock=None)
+    set_motion(accel, gyro)     - Accel in g, gyro in degrees / s
+    fail(count=1, error=EIO, until_init=False)
+                                - Fail the next transactions with OSError
+    hang(seconds)               - Block the next transaction (a stuck bus)
+
+  swing_motion(clashes=(), period=2.0)
+                        - Motion function: swinging blade with clashes
+
+  PixelSink(keep=0)
+    frames, lit_frames, last, checksum, history
+
+--------------------------------------------------------------------------
+"""
+
+import collections
+import errno
+import math
+import os
+import struct
+import time
+import zlib
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+I2C_BUS = 2                         # P1_28 / P1_26 on PocketBeagle
+
+# Adafruit_BBIO.GPIO constants
+LOW = 0
+HIGH = 1
+IN = 1
+OUT = 0
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+RISING = 1
+FALLING = 2
+BOTH = 3
+
+# MPU6050 registers (see imu/mpu6050.py)
+MPU6050_ADDR = 0x68
+ACCEL_XOUT_H = 0x3B
+GYRO_XOUT_H = 0x43
+PWR_MGMT_1 = 0x6B
+WHO_AM_I = 0x75
+REGISTER_COUNT = 0x76
+SLEEP_BIT = 0x40
+
+ACCEL_SCALE = 16384.0               # LSB per g at +-2 g
+GYRO_SCALE = 131.0                  # LSB per degree / s at +-250 dps
+
+CLASH_ACCEL = (1.5, 1.5, 1.5)       # g; each axis saturates at +-2 g
+CLASH_LENGTH = 0.02                 # Seconds
+
+# ------------------------------------------------------------------------
+# Real backends
+# ------------------------------------------------------------------------
+
+def open_gpio():
+    """Return the Adafruit_BBIO.GPIO module."""
+    import Adafruit_BBIO.GPIO as GPIO
+    return GPIO
+
+
+def open_i2c(bus_number=I2C_BUS):
+    """Return an smbus2.SMBus for bus_number."""
+    import smbus2
+    return smbus2.SMBus(bus_number)
+
+
+def open_pixels(address):
+    """Return an opc.Client for address."""
+    from opc import Client
+    return Client(address)
+
+# ------------------------------------------------------------------------
+# Simulated backends
+# ------------------------------------------------------------------------
+
+class SimulatedClock(object):
+    """Virtual time in seconds, advanced explicitly."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def advance(self, seconds):
+        self.now += seconds
+        return self.now
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedGPIO(object):
+    """Adafruit_BBIO.GPIO stand-in with scripted pin edges.
+
+    Edges are (time, pin, level) and take effect when update() is called
+    with the clock at or past their time; matching event callbacks run
+    synchronously inside update(), honouring bouncetime.
+    """
+
+    LOW, HIGH, IN, OUT = LOW, HIGH, IN, OUT
+    PUD_OFF, PUD_DOWN, PUD_UP = PUD_OFF, PUD_DOWN, PUD_UP
+    RISING, FALLING, BOTH = RISING, FALLING, BOTH
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._levels = {}
+        self._edges = []
+        self._detect = {}
+        self._last_event = {}
+
+    def setup(self, pin, direction, pull_up_down=PUD_OFF):
+        if pin not in self._levels:
+            self._levels[pin] = HIGH if pull_up_down == PUD_UP else LOW
+
+    def input(self, pin):
+        self.update()
+        return self._levels.get(pin, LOW)
+
+    def output(self, pin, level):
+        self._levels[pin] = level
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=0):
+        self._detect[pin] = (edge, callback, bouncetime / 1000.0)
+
+    def remove_event_detect(self, pin):
+        self._detect.pop(pin, None)
+
+    def cleanup(self):
+        self._detect.clear()
+
+    def schedule(self, at, pin, level):
+        """Set pin to level at clock time at."""
+        self._edges.append((at, pin, level))
+        self._edges.sort(key=lambda edge: edge[0])
+
+    def press(self, pin, at, duration=0.1):
+        """Script a press of a pulled-up button: low at at, high after duration."""
+        self.schedule(at, pin, LOW)
+        self.schedule(at + duration, pin, HIGH)
+
+    def update(self):
+        """Apply every scripted edge due by now and fire event callbacks."""
+        now = self.clock()
+        while self._edges and self._edges[0][0] <= now:
+            at, pin, level = self._edges.pop(0)
+            previous = self._levels.get(pin, HIGH)
+            self._levels[pin] = level
+            if level == previous or pin not in self._detect:
+                continue
+            edge, callback, bouncetime = self._detect[pin]
+            if edge != BOTH and edge != (RISING if level == HIGH else FALLING):
+                continue
+            last = self._last_event.get(pin)
+            if last is not None and at - last < bouncetime:
+                continue
+            self._last_event[pin] = at
+            if callback is not None:
+                callback(pin)
+
+
+def _int16(value):
+    return max(-32768, min(32767, int(round(value))))
+
+
+class VirtualMPU6050(object):
+    """smbus2.SMBus stand-in holding an MPU6050's register file.
+
+    The sensor powers up asleep, as the real one does: data registers read
+    zero until PWR_MGMT_1 is cleared (init_mpu6050()).  With a motion
+    function and a clock the data registers are refreshed from
+    motion(clock()) whenever the clock has moved.
+    """
+
+    def __init__(self, motion=None, clock=None, address=MPU6050_ADDR):
+        self.address = address
+        self.motion = motion
+        self.clock = clock
+        self.registers = bytearray(REGISTER_COUNT)
+        self.registers[PWR_MGMT_1] = SLEEP_BIT
+        self.registers[WHO_AM_I] = MPU6050_ADDR
+        self.reads = 0
+        self.writes = 0
+        self._motion_time = None
+        self._accel = (0.0, 0.0, 1.0)
+        self._gyro = (0.0, 0.0, 0.0)
+        self._failures = 0
+        self._error = errno.EIO
+        self._until_init = False
+        self._hang = 0.0
+
+    @property
+    def asleep(self):
+        return bool(self.registers[PWR_MGMT_1] & SLEEP_BIT)
+
+    def set_motion(self, accel, gyro):
+        """Set the measured accel (g) and gyro (degrees / s) for x, y, z."""
+        self._accel = tuple(accel)
+        self._gyro = tuple(gyro)
+        self._latch()
+
+    def _latch(self):
+        if self.asleep:
+            return
+        struct.pack_into(">3h", self.registers, ACCEL_XOUT_H,
+                         *[_int16(g * ACCEL_SCALE) for g in self._accel])
+        struct.pack_into(">3h", self.registers, GYRO_XOUT_H,
+                         *[_int16(d * GYRO_SCALE) for d in self._gyro])
+
+    def _refresh(self):
+        if self.motion is None or self.clock is None:
+            return
+        now = self.clock()
+        if now != self._motion_time:
+            self._motion_time = now
+            self.set_motion(*self.motion(now))
+
+    def fail(self, count=1, error=errno.EIO, until_init=False):
+        """Fail the next count transactions with OSError(error).
+
+        With until_init, every transaction fails until PWR_MGMT_1 is written
+        again, like a sensor that browned out.
+        """
+        self._failures = count
+        self._error = error
+        self._until_init = until_init
+
+    def hang(self, seconds):
+        """Block the next transaction for seconds of real time."""
+        self._hang = seconds
+
+    def _fault(self, register=None):
+        if self._hang:
+            seconds, self._hang = self._hang, 0.0
+            time.sleep(seconds)
+        if self._until_init and register == PWR_MGMT_1:
+            self._until_init = False
+            self._failures = 0
+            return
+        if self._until_init or self._failures > 0:
+            self._failures -= 1
+            raise OSError(self._error, os.strerror(self._error))
+
+    def _check(self, address, register, length=1):
+        self._fault(register)
+        if address != self.address:
+            raise OSError(errno.EREMOTEIO, "No device at 0x{0:02x}".format(address))
+        if register < 0 or register + length > REGISTER_COUNT:
+            raise OSError(errno.EIO, "Bad register 0x{0:02x}".format(register))
+
+    def read_byte_data(self, address, register):
+        self._check(address, register)
+        self._refresh()
+        self.reads += 1
+        return self.registers[register]
+
+    def read_i2c_block_data(self, address, register, length):
+        self._check(address, register, length)
+        self._refresh()
+        self.reads += 1
+        return list(self.registers[register:register + length])
+
+    def write_byte_data(self, address, register, value):
+        self._check(address, register)
+        self.writes += 1
+        self.registers[register] = value & 0xFF
+        if register == PWR_MGMT_1:
+            self._latch()
+
+    def close(self):
+        pass
+
+
+def swing_motion(clashes=(), period=2.0, amplitude=200.0):
+    """Return motion(t) for a blade swinging back and forth.
+
+    The gyro x axis swings with the given period and amplitude (degrees / s);
+    at each time in clashes the acceleration jumps to CLASH_ACCEL (2.6 g) for
+    CLASH_LENGTH seconds, which mpu6050.get_sensor_data() detects as a flash
+    on the following sample.
+    """
+    clashes = sorted(clashes)
+
+    def motion(t):
+        swing = math.sin(2.0 * math.pi * t / period)
+        gyro = (amplitude * swing, 0.0, 0.0)
+        for clash in clashes:
+            if clash <= t < clash + CLASH_LENGTH:
+                return CLASH_ACCEL, gyro
+            if clash > t:
+                break
+        return (0.0, 0.0, 1.0), gyro
+    return motion
+
+
+class PixelSink(object):
+    """opc.Client stand-in that keeps frames in memory.
+
+    checksum is a CRC32 over every frame sent, in order, so two runs of
+    the same script can be compared with one number.  keep > 0 also keeps
+    the last keep frames in history.
+    """
+
+    def __init__(self, keep=0):
+        self.frames = 0
+        self.lit_frames = 0
+        self.last = None
+        self.checksum = 0
+        self.history = collections.deque(maxlen=keep) if keep else None
+        self.latency = None
+        self.profiler = None
+
+    def can_connect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def put_pixels(self, pixels, channel=0):
+        return self.put_frame(bytes(int(min(255, max(0, c))) for pixel in pixels
+                                    for c in pixel), channel)
+
+    def put_frame(self, frame, channel=0):
+        data = bytes(memoryview(frame).cast("B"))
+        self.frames += 1
+        if any(data):
+            self.lit_frames += 1
+        self.last = data
+        self.checksum = zlib.crc32(data, self.checksum)
+        if self.history is not None:
+            self.history.append(data)
+        return True
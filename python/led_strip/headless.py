@@ -0,0 +1,278 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Headless Runner
+--------------------------------------------------------------------------
+
+Runs the lightsaber's own runtime.Runtime on the simulated backends in
+hal.py, faster than real time, for performance regression testing off
+the board:
+
+    SimulatedGPIO  --edges-->  Runtime button task  --press / hold-->
+    VirtualMPU6050 --I2C-->    Runtime imu task (mpu6050.get_sensor_data())
+                               Runtime render task (BladeRenderer)
+                               Runtime output task  --frame-->  PixelSink
+
+The stages are the real asyncio tasks; only time and I/O are simulated:
+
+- the event loop's clock is a SimulatedClock; when every task is waiting,
+  the loop's selector jumps the clock straight to the next timer instead
+  of sleeping (and applies the GPIO edges that are due), so a minute of
+  blade time takes as long as the work itself
+- the blocking calls the Runtime hands to its executor run inline, so
+  the order of events does not depend on thread scheduling
+
+Runs are deterministic; the PixelSink checksum of two runs with the same
+script and code matches, so a changed checksum means changed output.
+
+    python3 headless.py [--duration 60] [--effect flicker] [--leds 60]
+                        [--governor]
+
+Software API:
+
+  SimulatedEventLoop(clock, on_advance=None)
+    - asyncio event loop on clock; on_advance() runs after each jump
+
+  HeadlessRunner(renderer, gpio, sensor, sink, clock, button_pin="P2_4",
+                 sample_rate=60, render_rate=60, **runtime_options)
+    - runtime_options are passed to Runtime (e.g. governor, gestures)
+    run(duration)       - Run the Runtime until clock time duration;
+                          return stats()
+    stats()
+
+  default_script(duration, pin="P2_4")
+                        - Ignite, change color, clash, then retract
+  build(duration, led_count=60, effect="steady", ...)
+                        - HeadlessRunner on mpu6050.py with the script
+
+--------------------------------------------------------------------------
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import selectors
+import sys
+import time
+
+import hal
+from runtime import BladeRenderer, Runtime, HOLD_TIME, KEEPALIVE_INTERVAL, BUTTON_PIN
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+IMU_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "imu")
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class _SimulatedSelector(selectors.DefaultSelector):
+    """Selector that advances the clock instead of waiting."""
+
+    def __init__(self, clock, on_advance=None):
+        super(_SimulatedSelector, self).__init__()
+        self._clock = clock
+        self._on_advance = on_advance
+
+    def select(self, timeout=None):
+        events = super(_SimulatedSelector, self).select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            raise RuntimeError("Headless run is stuck: no task has a timer")
+        self._clock.advance(timeout)
+        if self._on_advance is not None:
+            self._on_advance()
+        return events
+
+
+class SimulatedEventLoop(asyncio.SelectorEventLoop):
+    """asyncio event loop whose time is a SimulatedClock."""
+
+    def __init__(self, clock, on_advance=None):
+        super(SimulatedEventLoop, self).__init__(_SimulatedSelector(clock, on_advance))
+        self.simulated_clock = clock
+
+    def time(self):
+        return self.simulated_clock()
+
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """Executor that runs each call straight away on the calling thread."""
+
+    def submit(self, function, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+class _CountingRenderer(object):
+    """Wraps the BladeRenderer to count the Runtime's calls into it."""
+
+    def __init__(self, renderer):
+        self._renderer = renderer
+        self.presses = 0
+        self.holds = 0
+        self.renders = 0
+
+    def press(self, now):
+        self.presses += 1
+        self._renderer.press(now)
+
+    def hold(self, now):
+        self.holds += 1
+        self._renderer.hold(now)
+
+    def render(self, now):
+        self.renders += 1
+        return self._renderer.render(now)
+
+    def __getattr__(self, name):
+        return getattr(self._renderer, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_") or name in ("presses", "holds", "renders"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._renderer, name, value)
+
+
+class HeadlessRunner(object):
+    """Runs runtime.Runtime on a simulated clock and simulated hardware."""
+
+    def __init__(self, renderer, gpio, sensor, sink, clock, button_pin=BUTTON_PIN,
+                 sample_rate=60, render_rate=60,
+                 keepalive_interval=KEEPALIVE_INTERVAL, **runtime_options):
+        self.renderer = _CountingRenderer(renderer)
+        self.gpio = gpio
+        self.sensor = sensor
+        self.sink = sink
+        self.clock = clock
+        self.button_pin = button_pin
+        self.sample_rate = sample_rate
+        self.render_rate = render_rate
+        self.keepalive_interval = keepalive_interval
+        self.runtime_options = runtime_options
+
+        self.samples = 0
+        self.flashes = 0
+        self.wall_time = 0.0
+
+    def _sample(self):
+        data = self.sensor()
+        self.samples += 1
+        if data is not None and data["flash"]:
+            self.flashes += 1
+        return data
+
+    def run(self, duration):
+        """Run the Runtime until the clock reaches duration; return stats()."""
+        loop = SimulatedEventLoop(
+            self.clock, self.gpio.update if self.gpio is not None else None)
+        runtime = Runtime(self.renderer, self.sink, gpio=self.gpio,
+                          button_pin=self.button_pin,
+                          sensor=self._sample if self.sensor is not None else None,
+                          sample_rate=self.sample_rate,
+                          render_rate=self.render_rate,
+                          keepalive_interval=self.keepalive_interval,
+                          executor=_InlineExecutor(), **self.runtime_options)
+        start = time.perf_counter()
+        try:
+            loop.call_at(duration, runtime.stop)
+            loop.run_until_complete(runtime.run())
+        finally:
+            loop.close()
+        self.wall_time += time.perf_counter() - start
+        return self.stats()
+
+    def stats(self):
+        """Return counters, timing and the output checksum."""
+        simulated = self.clock()
+        return {
+            "simulated_s": simulated,
+            "wall_s": self.wall_time,
+            "speedup": simulated / self.wall_time if self.wall_time else None,
+            "samples": self.samples,
+            "renders": self.renderer.renders,
+            "frames_sent": self.sink.frames,
+            "lit_frames": self.sink.lit_frames,
+            "presses": self.renderer.presses,
+            "holds": self.renderer.holds,
+            "flash_samples": self.flashes,
+            "checksum": "{0:08x}".format(self.sink.checksum),
+        }
+
+
+def default_script(duration, pin=BUTTON_PIN):
+    """Return (gpio edges, clash times) for a standard session.
+
+    Ignite at 0.5 s, change color every 5 s, clash every 3 s and hold the
+    button to retract 2 s before the end.
+    """
+    edges = [(0.5, 0.1)]
+    edges += [(t, 0.1) for t in range(5, int(duration) - 3, 5)]
+    if duration > 4:
+        edges.append((duration - 2.0 - HOLD_TIME, HOLD_TIME + 0.2))
+    clashes = [t + 0.25 for t in range(3, int(duration) - 3, 3)]
+    return edges, clashes
+
+
+def build(duration, led_count=60, effect="steady", sample_rate=60,
+          render_rate=60, script=None, keep=0, governor=False):
+    """Return a HeadlessRunner on mpu6050.py, the virtual sensor and script.
+
+    With governor, the Runtime gets a governor.IdleGovernor on the
+    simulated clock.
+    """
+    sys.path.append(IMU_DIR)
+    import mpu6050
+
+    edges, clashes = script if script is not None else default_script(duration)
+
+    clock = hal.SimulatedClock()
+    gpio = hal.SimulatedGPIO(clock)
+    for at, length in edges:
+        gpio.press(BUTTON_PIN, at, length)
+
+    # Fresh detector state, so every run starts the same
+    mpu6050.prev_tot_accel = None
+    mpu6050.flash_counter = 0
+    mpu6050.init_mpu6050(hal.VirtualMPU6050(hal.swing_motion(clashes), clock))
+
+    options = {}
+    if governor:
+        from governor import IdleGovernor
+        options["governor"] = IdleGovernor(sample_rate, render_rate, clock=clock)
+
+    renderer = BladeRenderer(led_count, effect=effect)
+    return HeadlessRunner(renderer, gpio, mpu6050.get_sensor_data,
+                          hal.PixelSink(keep), clock, sample_rate=sample_rate,
+                          render_rate=render_rate, **options)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the lightsaber headless")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="Simulated seconds (default: 60)")
+    parser.add_argument("--leds", type=int, default=60)
+    parser.add_argument("--effect", default="steady")
+    parser.add_argument("--sample-rate", type=float, default=60.0)
+    parser.add_argument("--render-rate", type=float, default=60.0)
+    parser.add_argument("--governor", action="store_true",
+                        help="Run with the idle governor (governor.py)")
+    args = parser.parse_args()
+
+    runner = build(args.duration, args.leds, args.effect, args.sample_rate,
+                   args.render_rate, governor=args.governor)
+    for name, value in runner.run(args.duration).items():
+        print("{0:14} {1}".format(name, value))
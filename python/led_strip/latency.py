@@ -0,0 +1,216 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Latency Instrumentation
+--------------------------------------------------------------------------
+
+Motion-to-photon latency measurement for the sensor -> LED pipeline.
+
+Each pass through the pipeline is one trace.  The trace is started when the
+IMU read starts and stamped at the end of each stage:
+
+    i2c     - raw register reads in get_sensor_data()
+    detect  - scaling and clash detection in get_sensor_data()
+    render  - building the frame
+    encode  - packing the OPC message in opc.Client
+    send    - socket send in opc.Client
+
+Every stage duration goes into a fixed-memory histogram, as does the total
+of the trace.  Traces marked with clash() (the frame that answers a
+detected clash) also go into the "clash" histogram, which is the physical
+hit -> white LEDs number.
+
+Durations measured elsewhere are added with record(); the audio mixer
+(audio/mixer.py) records the clash trigger -> audio block written to the
+sink time as "sound".
+
+Histograms use log-linear buckets (16 per power of two of microseconds,
+up to a few minutes), so recording is a few integer operations, memory is
+fixed, and percentiles are accurate to about 6%.
+
+The modules are instrumented through hooks that default to None (no cost
+beyond an attribute check):
+
+    mpu6050.latency = monitor
+    opc_client.latency = monitor
+
+Stamps are only taken on the thread that called begin(), so other threads
+sharing the OPC client (e.g. the button handler) do not pollute traces.
+
+Software API:
+
+  Histogram()
+    record(seconds), percentile(p), count, max, reset()
+
+  LatencyMonitor(report_interval=5.0)
+    begin()           - Start a trace
+    stamp(stage)      - End a stage of the current trace
+    clash()           - Mark the current trace as answering a clash
+    finish()          - Record the trace total
+    record(name, seconds)
+                      - Record a duration measured on any thread
+    snapshot()        - {stage: {"count", "p50", "p95", "p99", "max"}} in ms
+    summary()         - One line summary string
+    maybe_report()    - Print summary() every report_interval seconds
+
+--------------------------------------------------------------------------
+"""
+
+import threading
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+STAGES = ("i2c", "detect", "render", "encode", "send")
+TOTALS = ("total", "clash", "sound")
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_EXPONENT = 24                   # Buckets up to 2**28 us, about 4.5 min
+BUCKET_COUNT = (MAX_EXPONENT + 1) * SUB_BUCKETS
+
+PERCENTILES = (50, 95, 99)
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _bucket_index(us):
+    """Return the bucket of an integer number of microseconds."""
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKET_BITS - 1
+    index = (shift + 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+    return index if index < BUCKET_COUNT else BUCKET_COUNT - 1
+
+
+def _bucket_upper(index):
+    """Return the largest number of microseconds held by a bucket."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return (((index % SUB_BUCKETS) + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram(object):
+    """Fixed-memory log-linear histogram of durations."""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Add one duration (in seconds)."""
+        us = int(seconds * 1e6)
+        if us < 0:
+            us = 0
+        self.counts[_bucket_index(us)] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Return the p-th percentile in seconds (0.0 if empty)."""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_upper(index) / 1e6, self.max)
+        return self.max
+
+    def reset(self):
+        """Forget all recorded durations."""
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.max = 0.0
+
+
+class LatencyMonitor(object):
+    """Per-stage and end-to-end latency histograms for the pipeline."""
+
+    def __init__(self, stages=STAGES, report_interval=5.0, clock=time.perf_counter):
+        self.stages = tuple(stages)
+        self.report_interval = report_interval
+        self.histograms = dict((name, Histogram())
+                               for name in self.stages + TOTALS)
+
+        self._clock = clock
+        self._thread = None
+        self._start = None
+        self._last = None
+        self._clash = False
+        self._next_report = clock() + report_interval
+
+    def begin(self):
+        """Start a new trace on the calling thread."""
+        self._thread = threading.get_ident()
+        self._start = self._last = self._clock()
+        self._clash = False
+
+    def stamp(self, stage):
+        """Record the time since the previous stamp as stage's duration."""
+        if self._start is None or threading.get_ident() != self._thread:
+            return
+        now = self._clock()
+        self.histograms[stage].record(now - self._last)
+        self._last = now
+
+    def clash(self):
+        """Mark the current trace as the response to a detected clash."""
+        self._clash = True
+
+    def finish(self):
+        """Record the current trace's total and end it."""
+        if self._start is None:
+            return
+        total = self._last - self._start
+        self.histograms["total"].record(total)
+        if self._clash:
+            self.histograms["clash"].record(total)
+        self._start = None
+
+    def record(self, name, seconds):
+        """Record a duration measured outside the traces, e.g. "sound"."""
+        self.histograms[name].record(seconds)
+
+    def snapshot(self):
+        """Return {name: {"count", "p50", "p95", "p99", "max"}}, times in ms."""
+        result = {}
+        for name, histogram in self.histograms.items():
+            stats = {"count": histogram.count, "max": histogram.max * 1e3}
+            for p in PERCENTILES:
+                stats["p%d" % p] = histogram.percentile(p) * 1e3
+            result[name] = stats
+        return result
+
+    def summary(self):
+        """Return a one line p50/p95/p99/max summary (ms) of every stage."""
+        fields = []
+        for name in self.stages + TOTALS:
+            histogram = self.histograms[name]
+            if histogram.count == 0:
+                continue
+            fields.append("{0} {1:.2f}/{2:.2f}/{3:.2f}/{4:.2f}".format(
+                name,
+                histogram.percentile(50) * 1e3,
+                histogram.percentile(95) * 1e3,
+                histogram.percentile(99) * 1e3,
+                histogram.max * 1e3))
+        return "latency ms p50/p95/p99/max | " + " | ".join(fields)
+
+    def maybe_report(self):
+        """Print summary() if report_interval seconds have passed."""
+        now = self._clock()
+        if now >= self._next_report:
+            self._next_report = now + self.report_interval
+            print(self.summary())
+
+    def reset(self):
+        """Clear every histogram."""
+        for histogram in self.histograms.values():
+            histogram.reset()
@@ -0,0 +1,396 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber
+--------------------------------------------------------------------------
+
+Single entry point for the lightsaber, configured by lightsaber.json.
+
+    python3 lightsaber.py [--config lightsaber.json]
+
+lightsaber_lights.py, lightsaber_lights1.py and lightsaber_lights2.py each
+carried their own copy of the button, IMU and LED code and did all of their
+hardware setup at import time.  Here the features are selected in the
+config file instead:
+
+    "features": {
+        "button": true,     - GPIO button on buttonPin (press / hold)
+        "imu": true,        - MPU6050 samples at sampleRate
+        "flash": true,      - White flash on a detected clash (needs imu)
+        "audio": false,     - Hum on audioSink (audio/engine.py)
+        "gestures": false,  - Stab / twirl / thrust recognition (needs imu;
+                              imu/gesture.py), shown on the blade and
+                              played from the sound font
+        "governor": true    - Lower sample, render and keepalive rates
+                              while the blade is off or still (governor.py)
+    }
+
+powerBudget optionally caps the estimated LED current in mA; brighter
+frames (e.g. clash flashes) are dimmed uniformly to fit (see power.py).
+
+ditherRate optionally enables temporal dithering (dither.py): frames are
+scaled by brightness (0.0 - 1.0) in 16 bits and, while any channel falls
+between two 8-bit levels, sent at ditherRate frames per second, so a
+dimmed blade and slow fades do not band.
+
+motionPin optionally names the GPIO wired to the MPU6050 INT pin; the
+sensor's motion interrupt then wakes the governor immediately.  The
+governor's CPU use and wakeups per mode are printed on exit.
+
+audioSink is "alsa" (or "alsa:DEVICE") on the board, or "wav:PATH" /
+"pipe:COMMAND" for testing (see audio/sinks.py).  soundFont optionally
+names a directory of WAV files (clash*.wav, ignition.wav, ...) that are
+played on clashes and on ignition / retraction (audio/mixer.py); their
+trigger-to-output latency is printed on exit ("sound", latency.py).
+
+"outputs" optionally lists segments of the blade frame to send to several
+OPC servers and channels (see fanout.py) instead of opcAddress.
+
+Everything hardware related is imported lazily, only for the enabled
+features.  The independent initialisation steps (I2C wake-up of the
+MPU6050, GPIO setup, OPC connect, audio device) run concurrently in a thread pool, and
+then the asyncio Runtime (runtime.py) takes over.
+
+Startup is measured and reported on the console:
+
+    startup: interpreter 180 ms | imports 95 ms | init 310 ms (i2c 120,
+    gpio 290, opc 15) | first frame 520 ms | first lit frame 540 ms
+
+"first lit frame" is the first frame with any LED on, measured from
+process start; set "autoIgnite" to ignite without a button press when
+measuring cold start.
+
+--------------------------------------------------------------------------
+"""
+import time
+
+_START = time.perf_counter()
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "lightsaber.json")
+IMU_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "imu")
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "audio")
+
+DEFAULT_CONFIG = {
+    "ledCount": 60,
+    "opcAddress": "localhost:7890",
+    "buttonPin": "P2_4",
+    "features": {
+        "button": True,
+        "imu": True,
+        "flash": True,
+        "audio": False,
+        "gestures": False,
+        "governor": True,
+    },
+    "effect": "steady",
+    "palette": None,
+    "sampleRate": 60,
+    "renderRate": 60,
+    "autoIgnite": False,
+    "telemetry": None,
+    "outputs": None,
+    "audioSink": "alsa",
+    "soundFont": None,
+    "motionPin": None,
+    "powerBudget": None,
+    "ditherRate": None,
+    "brightness": 1.0,
+}
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def load_config(path=CONFIG_FILE):
+    """Return DEFAULT_CONFIG updated with the settings in path."""
+    with open(path) as f:
+        settings = json.load(f)
+    unknown = set(settings) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError("Unknown settings in {0}: {1}".format(
+            path, ", ".join(sorted(unknown))))
+
+    config = dict(DEFAULT_CONFIG)
+    config.update(settings)
+    config["features"] = dict(DEFAULT_CONFIG["features"],
+                              **settings.get("features", {}))
+    for output in config["outputs"] or ():
+        if output["start"] + output["count"] > config["ledCount"]:
+            raise ValueError("Output {0} is past ledCount ({1})".format(
+                output, config["ledCount"]))
+    return config
+
+
+def interpreter_startup():
+    """Return seconds from process creation to now, or None if unknown.
+
+    Uses the process start time from /proc, so it includes interpreter
+    startup before this module was loaded.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        start = int(fields[19]) / float(os.sysconf("SC_CLK_TCK"))
+        return max(0.0, uptime - start)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def _init_i2c(motion_interrupt=False):
+    """Open the I2C bus and wake the MPU6050; return the resilient sensor.
+
+    A failure here is not fatal: the sensor keeps re-initialising the bus
+    and the blade runs without motion until it answers.
+    """
+    import hal
+    sys.path.append(IMU_DIR)
+    import mpu6050
+    from acquisition import ResilientSensor, TIMEOUT, set_adapter_timeout
+    bus = None
+    try:
+        bus = hal.open_i2c()
+        set_adapter_timeout(bus, TIMEOUT)
+        mpu6050.init_mpu6050(bus)
+        if motion_interrupt:
+            mpu6050.enable_motion_interrupt()
+    except OSError as error:
+        print("Warning: MPU6050 not responding ({0}); retrying in the "
+              "background.".format(error))
+        if bus is not None:
+            try:
+                bus.close()
+            except OSError:
+                pass
+        mpu6050.bus = None
+    return ResilientSensor(hal.open_i2c, on_init=mpu6050.enable_motion_interrupt
+                           if motion_interrupt else None)
+
+
+async def _run_until_interrupted(runtime):
+    """Run runtime until Ctrl-C or SIGTERM, letting run() clean up."""
+    loop = asyncio.get_running_loop()
+
+    def interrupt():
+        print("Exiting program...")
+        runtime.stop()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass                        # Not the main thread, or Windows
+    await runtime.run()
+
+
+def _init_gpio(pin):
+    """Open the GPIO backend and set the button pin up as a pulled-up input."""
+    import hal
+    GPIO = hal.open_gpio()
+    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    return GPIO
+
+
+def _init_audio(sink, font_directory=None):
+    """Open the audio sink and sound font and start the audio engine thread."""
+    sys.path.append(AUDIO_DIR)
+    from engine import AudioEngine, SAMPLE_RATE, BLOCK_SIZE
+    from sinks import open_sink
+    font = None
+    if font_directory:
+        from soundfont import SoundFont
+        font = SoundFont(font_directory)
+    audio = AudioEngine(open_sink(sink, SAMPLE_RATE, BLOCK_SIZE), font=font)
+    audio.start()
+    return audio
+
+
+def _init_opc(address, outputs=None):
+    """Create the OPC client (or fan-out) and try to connect."""
+    if outputs:
+        from fanout import FanOut
+        client = FanOut.from_config(outputs)
+    else:
+        import hal
+        client = hal.open_pixels(address)
+    if not client.can_connect():
+        print("Warning: Could not connect to OPC server.")
+    return client
+
+
+class _StartupProbe(object):
+    """Wraps the OPC client to time the first frame and first lit frame."""
+
+    def __init__(self, client, timings):
+        self._client = client
+        self._timings = timings
+        self._pending = True
+
+    def put_frame(self, frame, channel=0):
+        result = self._client.put_frame(frame, channel)
+        if self._pending:
+            now = time.perf_counter() - _START
+            self._timings.setdefault("first frame", now)
+            if any(memoryview(frame).cast("B")):
+                self._timings["first lit frame"] = now
+                self._pending = False
+                print(format_startup(self._timings))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def format_startup(timings):
+    """Format the startup timings (seconds) as one line in milliseconds."""
+    fields = []
+    for name in ("interpreter", "imports", "init"):
+        if timings.get(name) is not None:
+            field = "{0} {1:.0f} ms".format(name, timings[name] * 1e3)
+            if name == "init" and timings.get("steps"):
+                field += " (" + ", ".join(
+                    "{0} {1:.0f}".format(step, seconds * 1e3)
+                    for step, seconds in sorted(timings["steps"].items())) + ")"
+            fields.append(field)
+    for name in ("first frame", "first lit frame"):
+        if name in timings:
+            fields.append("{0} {1:.0f} ms".format(name, timings[name] * 1e3))
+    return "startup: " + " | ".join(fields)
+
+
+def main(config):
+    """Initialise the enabled features and run the lightsaber."""
+    features = config["features"]
+    timings = {"interpreter": interpreter_startup()}
+    if timings["interpreter"] is not None:
+        timings["interpreter"] -= time.perf_counter() - _START
+
+    start = time.perf_counter()
+    from runtime import BladeRenderer, Runtime, ON
+    from palette import Palette
+    timings["imports"] = time.perf_counter() - start
+
+    # Independent hardware setup, run concurrently
+    start = time.perf_counter()
+    steps = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        futures = {"opc": pool.submit(
+            _timed, lambda: _init_opc(config["opcAddress"], config["outputs"]))}
+        if features["imu"]:
+            futures["i2c"] = pool.submit(
+                _timed, lambda: _init_i2c(bool(config["motionPin"])))
+        if features["button"]:
+            futures["gpio"] = pool.submit(
+                _timed, lambda: _init_gpio(config["buttonPin"]))
+        if features["audio"]:
+            futures["audio"] = pool.submit(
+                _timed, lambda: _init_audio(config["audioSink"],
+                                            config["soundFont"]))
+        results = {}
+        for name, future in futures.items():
+            results[name], steps[name] = future.result()
+    timings["init"] = time.perf_counter() - start
+    timings["steps"] = steps
+
+    telemetry = None
+    if config["telemetry"]:
+        from telemetry import Telemetry
+        telemetry = Telemetry(config["telemetry"])
+        telemetry.start()
+
+    palette = Palette.from_config(name=config["palette"])
+    renderer = BladeRenderer(config["ledCount"], palette, config["effect"],
+                             clash_flash=features["flash"] and features["imu"])
+    client = results["opc"]
+    if config["powerBudget"]:
+        from power import PowerLimiter, LimitedClient
+        client = LimitedClient(client, PowerLimiter(config["powerBudget"]))
+    dither = None
+    if config["ditherRate"]:
+        from dither import TemporalDither
+        dither = TemporalDither(config["ledCount"], config["brightness"])
+    gpio = results.get("gpio")
+    sensor = results.get("i2c")
+    gestures = None
+    if features["gestures"] and sensor:
+        from gesture import GestureRecognizer
+        gestures = GestureRecognizer(config["sampleRate"])
+        if results.get("audio") is not None:
+            def play_gesture(gesture):
+                # Like renderer.gesture(): only while lit
+                if renderer.state == ON and not renderer.degraded:
+                    results["audio"].play(gesture.kind)
+            gestures.subscribe(play_gesture)
+    latency = None
+    if results.get("audio") is not None and results["audio"].mixer is not None:
+        from latency import LatencyMonitor
+        latency = LatencyMonitor()
+        results["audio"].mixer.latency = latency
+    governor = None
+    if features["governor"]:
+        from governor import IdleGovernor
+        governor = IdleGovernor(config["sampleRate"], config["renderRate"])
+    runtime = Runtime(renderer, _StartupProbe(client, timings), gpio=gpio,
+                      button_pin=config["buttonPin"],
+                      sensor=sensor,
+                      sample_rate=config["sampleRate"],
+                      render_rate=config["renderRate"], telemetry=telemetry,
+                      audio=results.get("audio"), gestures=gestures,
+                      governor=governor, motion_pin=config["motionPin"],
+                      dither=dither, dither_rate=config["ditherRate"])
+    if config["autoIgnite"]:
+        renderer.press(time.monotonic())        # The event loop's clock
+
+    print("Ready! Use the button to control the lightsaber.")
+    try:
+        asyncio.run(_run_until_interrupted(runtime))
+    except KeyboardInterrupt:
+        print("Exiting program...")
+    finally:
+        if telemetry is not None:
+            telemetry.stop()
+        if governor is not None:
+            print(governor.summary())
+        if latency is not None:
+            print(latency.summary())
+        if sensor is not None:
+            print(sensor.summary())
+            sensor.close()
+        if results.get("audio") is not None:
+            results["audio"].stop()
+        if gpio is not None:
+            gpio.cleanup()
+        client.put_pixels([(0, 0, 0)] * config["ledCount"])  # Turn off all LEDs
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the lightsaber")
+    parser.add_argument("--config", default=CONFIG_FILE,
+                        help="Settings file (default: lightsaber.json)")
+    args = parser.parse_args()
+
+    main(load_config(args.config))
@@ -1,6 +1,8 @@
 import time
 import Adafruit_BBIO.GPIO as GPIO
 from opc import Client
+from palette import Palette
+from telemetry import Telemetry
 import smbus2
 import math
 
@@ -27,6 +29,8 @@ BUTTON_PIN = "P2_4"
 OPC_SERVER_ADDRESS = "localhost:7890"
 LED_COUNT = 60
 ACTIVATION_DELAY = 0.01  # Faster ignition and deactivation
+TELEMETRY_SINK = "/tmp/lightsaber_telemetry.bin"  # Decode with telemetry.py
+TRANSITION_DELAY = 1 / 60.0  # Time between color transition frames
 GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
 # Initialize I2C bus
@@ -37,6 +41,10 @@ led_on = False
 button_pressed = False  # Tracks if the button is currently being pressed
 current_color = (255, 0, 0)  # Default color (red)
 
+# Blade colors, with the color change fades precomputed
+palette = Palette.from_config()
+palette.precompute(LED_COUNT)
+
 # Initialize MPU6050
 def init_mpu6050():
     bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_1, 0)  # Wake up MPU6050
@@ -63,9 +71,12 @@ def get_sensor_data():
     gyro_z = read_raw_data(GYRO_ZOUT_H)
 
     # Convert raw data to "g" and degrees per second
-    accel_x_scaled = abs((accel_x / 16384.0)) # Scale for accelerometer
-    accel_y_scaled = abs((accel_y / 16384.0))
-    accel_z_scaled = abs((accel_z / 16384.0))
+    accel_x_signed = accel_x / 16384.0 # Scale for accelerometer
+    accel_y_signed = accel_y / 16384.0
+    accel_z_signed = accel_z / 16384.0
+    accel_x_scaled = abs(accel_x_signed)
+    accel_y_scaled = abs(accel_y_signed)
+    accel_z_scaled = abs(accel_z_signed)
 
     gyro_x_scaled = (gyro_x / 131.0) -3  # Scale for gyroscope
     gyro_y_scaled = (gyro_y / 131.0) +0.2
@@ -101,6 +112,9 @@ def get_sensor_data():
         "accel_x": accel_x_scaled,
         "accel_y": accel_y_scaled,
         "accel_z": accel_z_scaled,
+        "accel_x_signed": accel_x_signed,  # Direction kept, e.g. for gesture.py
+        "accel_y_signed": accel_y_signed,
+        "accel_z_signed": accel_z_signed,
         "gyro_x": gyro_x_scaled,
         "gyro_y": gyro_y_scaled,
         "gyro_z": gyro_z_scaled,
@@ -201,46 +215,37 @@ def button_handler(channel):
     if not led_on:
         activate_lights()
     else:
-        # Change color continuously while the lights are on
-        current_color = get_next_color(current_color)
-        opc_client.put_pixels([current_color] * LED_COUNT)
+        # Fade to the next color while the lights are on
+        next_color = get_next_color(current_color)
+        for frame in palette.transition_frames(current_color, next_color, LED_COUNT):
+            opc_client.put_frame(frame)
+            time.sleep(TRANSITION_DELAY)
+        current_color = next_color
         print(f"Color changed to: {current_color}")
 
     button_pressed = False  # Allow the next button press
 
 def get_next_color(current_color):
-    """Cycle to the next color in the predefined list."""
-    COLOR_LIST = [
-        (255, 0, 0),   # Red
-        (255, 100, 0), # Orange
-        (255, 160, 0), # Yellow
-        (0, 255, 0),   # Green
-        (0, 255, 255), # Cyan
-        (0, 0, 255),   # Blue
-        (255, 0, 255), # Magenta
-        (255, 255, 255), # White
-    ]
-    index = COLOR_LIST.index(current_color)
-    return COLOR_LIST[(index + 1) % len(COLOR_LIST)]
+    """Cycle to the next color in the palette (see palettes.json)."""
+    return palette.next_color(current_color)
 
 # GPIO setup for button
 GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.add_event_detect(BUTTON_PIN, GPIO.FALLING, callback=button_handler, bouncetime=300)
 
+# Sensor telemetry, flushed and summarised in the background
+telemetry = Telemetry(TELEMETRY_SINK)
+telemetry.start()
+
 # Main loop
 print("Ready! Use the button to control the lightsaber.")
 try:
     while True:
         data = get_sensor_data()
-        print(
-            f"Accel: X={data['accel_x']:.2f}, Y={data['accel_y']:.2f}, Z={data['accel_z']:.2f} | "
-            f"Gyro: X={data['gyro_x']:.2f}, Y={data['gyro_y']:.2f}, Z={data['gyro_z']:.2f} | "
-            f"Totals: Accel={data['tot_accel']:.2f}, Gyro={data['tot_gyro']:.2f}, Comb={data['comb_accel_gyro']:.2f} | "
-            f"Difference: {data['difference']:.2f}, Peripherals: Volume={data['speaker_vol']:.2f} | "
-            f"Contact={'True' if data['difference'] >= 1 else 'False'}, Flash={'True' if data['flash'] else 'False'}"
-        )
+        telemetry.sample(data)  # Summarised every few seconds
         time.sleep(1/30)  # Wait to achieve 60 Hz updates
 except KeyboardInterrupt:
     print("Exiting program...")
+    telemetry.stop()
     GPIO.cleanup()
     opc_client.put_pixels([(0, 0, 0)] * LED_COUNT)  # Turn off all LEDs
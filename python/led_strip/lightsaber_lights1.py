@@ -1,20 +1,34 @@
+import collections
 import time
 import Adafruit_BBIO.GPIO as GPIO
 from opc import Client
+from palette import Palette
+import os
 import sys
 sys.path.append('/var/lib/cloud9/ENGI301/lightsaber/python/imu/')
+import mpu6050
 from mpu6050 import get_sensor_data
+from latency import LatencyMonitor
+from telemetry import Telemetry
+from profiling import Profiler
 
 # Configuration
 BUTTON_PIN = "P2_1"
 OPC_SERVER_ADDRESS = "localhost:7890"
 LED_COUNT = 60
 ACTIVATION_DELAY = 0.01  # Faster ignition and deactivation
+TELEMETRY_SINK = "/tmp/lightsaber_telemetry.bin"  # Decode with telemetry.py
+PROFILE_TRACE = os.environ.get("LIGHTSABER_PROFILE")  # Chrome trace JSON path
 
 # Global state variables
 led_on = False
 button_pressed = False  # Tracks if the button is currently being pressed
 current_color = (255, 0, 0)  # Default color (red)
+fade_frames = collections.deque()  # Color change frames left for the main loop
+
+# Blade colors, with the color change fades precomputed
+palette = Palette.from_config()
+palette.precompute(LED_COUNT)
 
 # OPC client setup
 opc_client = Client(OPC_SERVER_ADDRESS)
@@ -87,7 +101,7 @@ def deactivate_lights():
 
 def button_handler(channel):
     """Handle button press and hold actions."""
-    global current_color, button_pressed
+    global current_color, button_pressed, fade_frames
 
     if button_pressed:
         return  # Ignore additional presses until the current one is processed
@@ -104,39 +118,62 @@ def button_handler(channel):
     if not led_on:
         activate_lights()
     else:
-        # Change color continuously while the lights are on
-        current_color = get_next_color(current_color)
-        opc_client.put_pixels([current_color] * LED_COUNT)
+        # Fade to the next color while the lights are on; the main loop
+        # sends the fade frames, one per update, so they do not interleave
+        # with frames of the old color
+        next_color = get_next_color(current_color)
+        fade_frames = collections.deque(
+            palette.transition_frames(current_color, next_color, LED_COUNT))
+        current_color = next_color
         print(f"Color changed to: {current_color}")
 
     button_pressed = False  # Allow the next button press
 
 def get_next_color(current_color):
-    """Cycle to the next color in the predefined list."""
-    COLOR_LIST = [
-        (255, 0, 0),   # Red
-        (255, 100, 0), # Orange
-        (255, 160, 0), # Yellow
-        (0, 255, 0),   # Green
-        (0, 255, 255), # Cyan
-        (0, 0, 255),   # Blue
-        (255, 0, 255), # Magenta
-        (255, 255, 255), # White
-    ]
-    index = COLOR_LIST.index(current_color)
-    return COLOR_LIST[(index + 1) % len(COLOR_LIST)]
+    """Cycle to the next color in the palette (see palettes.json)."""
+    return palette.next_color(current_color)
     
 def update_lights_based_on_flash(flash_active):
     """
     Update the lightsaber's LEDs to display white if flash is active.
     """
     global current_color
+    start = profiler.begin()
     if flash_active:
-        opc_client.put_pixels([(255, 255, 255)] * LED_COUNT)  # Set all LEDs to white
-        print("Lightsaber flash mode: WHITE")
+        pixels = [(255, 255, 255)] * LED_COUNT  # Set all LEDs to white
+        profiler.end("led.build_frame", start)
+        latency.stamp("render")
+        opc_client.put_pixels(pixels)
+        telemetry.lights((255, 255, 255), flash=True)
+    elif fade_frames:
+        try:
+            frame = fade_frames.popleft()  # Next frame of a color change
+        except IndexError:
+            frame = bytes(current_color) * LED_COUNT
+        profiler.end("led.build_frame", start)
+        latency.stamp("render")
+        opc_client.put_frame(frame)
+        telemetry.lights(tuple(frame[:3]))
     else:
-        opc_client.put_pixels([current_color] * LED_COUNT)  # Reset to current color
-        print(f"Lightsaber normal mode: {current_color}")
+        pixels = [current_color] * LED_COUNT  # Reset to current color
+        profiler.end("led.build_frame", start)
+        latency.stamp("render")
+        opc_client.put_pixels(pixels)
+        telemetry.lights(current_color)
+
+# Sample and light telemetry, flushed and summarised in the background
+telemetry = Telemetry(TELEMETRY_SINK)
+telemetry.start()
+
+# Motion-to-photon latency, summarised every few seconds
+latency = LatencyMonitor()
+mpu6050.latency = latency
+opc_client.latency = latency
+
+# Per-stage spans, only recorded when LIGHTSABER_PROFILE is set
+profiler = Profiler(enabled=PROFILE_TRACE is not None)
+mpu6050.profiler = profiler
+opc_client.profiler = profiler
 
 # GPIO setup for button
 GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -144,18 +181,29 @@ GPIO.add_event_detect(BUTTON_PIN, GPIO.FALLING, callback=button_handler, bouncet
 
 # Main loop
 print("Ready! Use the button to control the lightsaber.")
+previous_flash = False
 try:
     while True:
         # Step 1: Retrieve IMU data to check for flash
         # from mpu6050 import get_sensor_data  # Import the function from mpu6050.py
         data = get_sensor_data()  # Fetch the latest IMU data, including 'flash'
+        telemetry.sample(data)
+        if data['flash'] and not previous_flash:
+            latency.clash()  # This frame is the response to a new clash
+        previous_flash = data['flash']
 
         # Step 2: Update lights based on the flash status
         update_lights_based_on_flash(data['flash'])
+        latency.finish()
+        latency.maybe_report()
 
         # Maintain the desired refresh rate
         time.sleep(1 / 60.0)  # 60 Hz updates
 except KeyboardInterrupt:
     print("Exiting program...")
+    telemetry.stop()
+    if PROFILE_TRACE is not None:
+        profiler.export_chrome_trace(PROFILE_TRACE)
+        print(f"Profile written to {PROFILE_TRACE}")
     GPIO.cleanup()
     opc_client.put_pixels([(0, 0, 0)] * LED_COUNT)  # Turn off all LEDs
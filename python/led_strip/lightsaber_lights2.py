@@ -41,8 +41,8 @@ lightsaber project. The code will:
 
 Notes:
 - ACTIVATION_DELAY will alter how fast the LEDs ignite and deactivate
-- COLOR_LIST contains RGB values of the colors that the blade will cycle
-through
+- palettes.json contains RGB values of the colors that the blade will cycle
+through; color changes fade through precomputed frames
 - LEDs were indexed based on two strips connected in sequence running in
 opposite directions based on physical implementation. The blade will turn
 on and off directionally to mimic lightsaber function.
@@ -53,18 +53,24 @@ on and off directionally to mimic lightsaber function.
 import time
 import Adafruit_BBIO.GPIO as GPIO
 from opc import Client
+from palette import Palette
 
 # Configuration
 BUTTON_PIN = "P2_4"
 OPC_SERVER_ADDRESS = "localhost:7890"
 LED_COUNT = 60
 ACTIVATION_DELAY = 0.01  # Faster ignition and deactivation
+TRANSITION_DELAY = 1 / 60.0  # Time between color transition frames
 
 # Global state variables
 led_on = False
 button_pressed = False  # Tracks if the button is currently being pressed
 current_color = (255, 0, 0)  # Default color (red)
 
+# Blade colors, with the color change fades precomputed
+palette = Palette.from_config()
+palette.precompute(LED_COUNT)
+
 # OPC client setup
 opc_client = Client(OPC_SERVER_ADDRESS)
 if not opc_client.can_connect():
@@ -153,27 +159,19 @@ def button_handler(channel):
     if not led_on:
         activate_lights()
     else:
-        # Change color continuously while the lights are on
-        current_color = get_next_color(current_color)
-        opc_client.put_pixels([current_color] * LED_COUNT)
+        # Fade to the next color while the lights are on
+        next_color = get_next_color(current_color)
+        for frame in palette.transition_frames(current_color, next_color, LED_COUNT):
+            opc_client.put_frame(frame)
+            time.sleep(TRANSITION_DELAY)
+        current_color = next_color
         print(f"Color changed to: {current_color}")
 
     button_pressed = False  # Allow the next button press
 
 def get_next_color(current_color):
-    """Cycle to the next color in the predefined list."""
-    COLOR_LIST = [
-        (255, 0, 0),   # Red
-        (255, 100, 0), # Orange
-        (255, 160, 0), # Yellow
-        (0, 255, 0),   # Green
-        (0, 255, 255), # Cyan
-        (0, 0, 255),   # Blue
-        (255, 0, 255), # Magenta
-        (255, 255, 255), # White
-    ]
-    index = COLOR_LIST.index(current_color)
-    return COLOR_LIST[(index + 1) % len(COLOR_LIST)]
+    """Cycle to the next color in the palette (see palettes.json)."""
+    return palette.next_color(current_color)
 
 # GPIO setup for button
 GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
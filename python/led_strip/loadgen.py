@@ -0,0 +1,293 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Load Generator
+--------------------------------------------------------------------------
+
+Finds how many blades and LEDs one controller and one OPC server can
+sustain at a target frame rate.
+
+Each simulated saber is a separate process running the real per-frame
+path at the target rate:
+
+    mpu6050.get_sensor_data()   - from a VirtualMPU6050 (hal.py) playing a
+                                  swinging trace with clashes, offset per
+                                  saber so they do not move in lockstep
+    BladeRenderer.sample() / render()
+                                - with the flicker effect, so every frame
+                                  changes and is sent
+    opc.Client.put_frame()      - its own connection, on channel index + 1
+
+All sabers send to one local OPCServer (opc_server.py) in its own process,
+which counts the frames it receives per channel.
+
+Per run (N sabers of L LEDs at F fps for D seconds) it reports:
+
+    fps         - Mean achieved frames per second per saber (min in brackets)
+    dropped     - Frames not delivered: deadlines missed because the
+                  previous frame was late, failed sends, and frames sent
+                  but not received by the server, as a share of N * F * D
+    cpu         - Mean CPU per saber, as a share of one core; server CPU
+    latency     - Sensor read start -> put_frame() returned, p50/p95/p99/max
+                  in ms over every frame of every saber
+
+A run sustains the load when the achieved rate is at least SUSTAIN_FPS of
+the target and at most SUSTAIN_DROPPED of frames are dropped.  The capacity
+table lists, per LED count and rate, the most sabers that were sustained.
+
+    python3 loadgen.py --sabers 1,2,4,8,16 --leds 60,300 --fps 60,120
+    python3 loadgen.py --output capacity.json
+
+Software API:
+
+  run_load(sabers, led_count, fps, duration, address=None)
+    - One run; returns the result dictionary.  Starts its own OPC
+      server unless address is given.
+  capacity(results)
+    - {(led_count, fps): most sabers sustained}
+
+--------------------------------------------------------------------------
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import hal
+from latency import Histogram
+from opc import Client
+from opc_server import OPCServer
+from runtime import BladeRenderer
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+IMU_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "imu")
+
+SABER_COUNTS = (1, 2, 4, 8)
+LED_COUNTS = (60, 300)
+FRAME_RATES = (60, 120)
+DURATION = 5.0
+MAX_SABERS = 255                    # One OPC channel per saber
+STARTUP_TIME = 1.0                  # Seconds allowed for the sabers to connect
+
+SUSTAIN_FPS = 0.95                  # Share of the target rate to sustain
+SUSTAIN_DROPPED = 0.01              # Share of frames that may be dropped
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _serve(connection):
+    counts = {}
+
+    def on_frame(channel, frame):
+        counts[channel] = counts.get(channel, 0) + 1
+
+    server = OPCServer("localhost:0", on_frame=on_frame).start()
+    connection.send(server.address)
+    connection.recv()                   # Run starts
+    cpu = time.process_time()
+    connection.recv()                   # Run ends
+    cpu = time.process_time() - cpu
+    server.stop()
+    connection.send((counts, cpu))
+
+
+def _saber(index, address, led_count, fps, duration, start_at, results):
+    """One saber's frame loop; puts its result on the results queue."""
+    sys.path.append(IMU_DIR)
+    import mpu6050
+
+    begin = [None]
+    clock = lambda: time.monotonic() - begin[0] if begin[0] is not None else 0.0
+    clashes = [t + 0.1 * index for t in range(1, int(duration) + 1, 3)]
+    motion = hal.swing_motion(clashes, period=1.5 + 0.1 * (index % 7))
+    mpu6050.prev_tot_accel = None
+    mpu6050.flash_counter = 0
+    mpu6050.init_mpu6050(hal.VirtualMPU6050(motion, clock))
+
+    renderer = BladeRenderer(led_count, effect="flicker")
+    client = Client(address)
+    client.can_connect()
+    channel = index + 1
+    histogram = Histogram()
+    frames = missed = failed = 0
+    period = 1.0 / fps
+
+    time.sleep(max(0.0, start_at - time.time()))
+    begin[0] = time.monotonic()
+    renderer.press(0.0)
+    cpu = time.process_time()
+    deadline = 0.0
+    while deadline < duration:
+        start = time.perf_counter()
+        now = clock()
+        renderer.sample(mpu6050.get_sensor_data(), now)
+        frame, _ = renderer.render(now)
+        if not client.put_frame(frame, channel):
+            failed += 1
+        histogram.record(time.perf_counter() - start)
+        frames += 1
+
+        deadline += period
+        delay = deadline - clock()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late = int(-delay / period)     # Whole frames that were skipped
+            missed += late
+            deadline += late * period
+    elapsed = clock()
+    cpu = time.process_time() - cpu
+    client.disconnect()
+    results.put({"index": index, "frames": frames, "missed": missed,
+                 "failed": failed, "elapsed": elapsed, "cpu": cpu,
+                 "counts": histogram.counts, "max": histogram.max})
+
+
+def run_load(sabers, led_count, fps, duration=DURATION, address=None):
+    """Run sabers simulated sabers for duration seconds; return the results."""
+    if not 1 <= sabers <= MAX_SABERS:
+        raise ValueError("sabers must be 1 - {0}".format(MAX_SABERS))
+
+    server = None
+    if address is None:
+        server, child = multiprocessing.Pipe()
+        server_process = multiprocessing.Process(target=_serve, args=(child,),
+                                                 name="loadgen-opc-server")
+        server_process.daemon = True
+        server_process.start()
+        address = server.recv()
+
+    results = multiprocessing.Queue()
+    start_at = time.time() + STARTUP_TIME + 0.02 * sabers
+    processes = [multiprocessing.Process(
+        target=_saber, args=(i, address, led_count, fps, duration, start_at, results),
+        name="loadgen-saber-{0}".format(i)) for i in range(sabers)]
+    for process in processes:
+        process.daemon = True
+        process.start()
+    if server is not None:
+        time.sleep(max(0.0, start_at - time.time()))
+        server.send("start")
+
+    saber_results = [results.get(timeout=duration + STARTUP_TIME + 30.0)
+                     for _ in processes]
+    for process in processes:
+        process.join()
+
+    received, server_cpu = None, None
+    if server is not None:
+        time.sleep(0.2)                 # Let the server drain its sockets
+        server.send("stop")
+        received, server_cpu = server.recv()
+        server_process.join()
+
+    histogram = Histogram()
+    for saber in saber_results:
+        histogram.counts = [a + b for a, b in zip(histogram.counts, saber["counts"])]
+        histogram.count += saber["frames"]
+        histogram.max = max(histogram.max, saber["max"])
+
+    lost = 0
+    if received is not None:
+        lost = sum(max(0, saber["frames"] - saber["failed"] -
+                       received.get(saber["index"] + 1, 0))
+                   for saber in saber_results)
+    dropped = sum(saber["missed"] + saber["failed"] for saber in saber_results) + lost
+    rates = [saber["frames"] / saber["elapsed"] for saber in saber_results]
+    expected = sabers * fps * duration
+
+    return {
+        "sabers": sabers,
+        "leds": led_count,
+        "target_fps": fps,
+        "fps": sum(rates) / len(rates),
+        "min_fps": min(rates),
+        "dropped": dropped,
+        "dropped_share": dropped / expected,
+        "cpu_per_saber": sum(saber["cpu"] / saber["elapsed"]
+                             for saber in saber_results) / sabers,
+        "server_cpu": server_cpu / duration if server_cpu is not None else None,
+        "latency_ms": dict(("p%d" % p, histogram.percentile(p) * 1e3)
+                           for p in (50, 95, 99)),
+        "latency_max_ms": histogram.max * 1e3,
+    }
+
+
+def sustained(result):
+    return result["fps"] >= SUSTAIN_FPS * result["target_fps"] and \
+        result["dropped_share"] <= SUSTAIN_DROPPED
+
+
+def capacity(results):
+    """Return {(led_count, fps): most sabers sustained (0 if none)}."""
+    table = {}
+    for result in results:
+        key = (result["leds"], result["target_fps"])
+        table.setdefault(key, 0)
+        if sustained(result):
+            table[key] = max(table[key], result["sabers"])
+    return table
+
+
+def print_result(result):
+    latency = result["latency_ms"]
+    server_cpu = result["server_cpu"]
+    print("{0:>6} {1:>6} {2:>5} {3:>7.1f} ({4:5.1f}) {5:>8.2%} {6:>7.1%} {7:>7} "
+          "{8:6.2f}/{9:6.2f}/{10:6.2f}/{11:6.2f}  {12}".format(
+              result["sabers"], result["leds"], result["target_fps"],
+              result["fps"], result["min_fps"], result["dropped_share"],
+              result["cpu_per_saber"],
+              "-" if server_cpu is None else "{0:.1%}".format(server_cpu),
+              latency["p50"], latency["p95"], latency["p99"],
+              result["latency_max_ms"], "ok" if sustained(result) else "SATURATED"))
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    def integers(text):
+        return [int(value) for value in text.split(",")]
+
+    parser = argparse.ArgumentParser(description="Lightsaber OPC load generator")
+    parser.add_argument("--sabers", type=integers, default=list(SABER_COUNTS))
+    parser.add_argument("--leds", type=integers, default=list(LED_COUNTS))
+    parser.add_argument("--fps", type=integers, default=list(FRAME_RATES))
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--address", help="Use a running OPC server instead of a "
+                                          "local stand-in (no receive counts)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    print("{0:>6} {1:>6} {2:>5} {3:>15} {4:>8} {5:>7} {6:>7} {7:>27}".format(
+        "sabers", "LEDs", "fps", "achieved (min)", "dropped", "cpu", "server",
+        "latency ms p50/p95/p99/max"))
+    results = []
+    for fps in args.fps:
+        for led_count in args.leds:
+            for sabers in args.sabers:
+                result = run_load(sabers, led_count, fps, args.duration, args.address)
+                print_result(result)
+                results.append(result)
+                if not sustained(result):
+                    break               # More sabers will not do better
+
+    table = capacity(results)
+    print("\nCapacity (most sabers sustained)")
+    for (led_count, fps), sabers in sorted(table.items()):
+        print("  {0:>5} LEDs at {1:>3} fps: {2}".format(led_count, fps, sabers))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results,
+                       "capacity": [{"leds": led_count, "fps": fps, "sabers": sabers}
+                                    for (led_count, fps), sabers in sorted(table.items())]},
+                      f, indent="\t")
@@ -0,0 +1,300 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Multi-Process Pipeline
+--------------------------------------------------------------------------
+
+Optional mode that runs IMU acquisition and rendering in separate
+processes, for multi-core development and simulation hosts (on the
+single-core PocketBeagle use runtime.py instead).
+
+    imu process   --samples ring-->   render process   --frames ring-->   parent
+    (sensor)                          (BladeRenderer)                     (opc.Client)
+
+Samples and frames go through shm_ring.SharedRing buffers in shared
+memory, with sequence stamps instead of pickled queues: the IMU process
+publishes every sample, the render process consumes all new samples and
+publishes one frame per render tick, and the parent sends the newest frame.
+Only rare control messages (button presses) use a multiprocessing.Queue.
+
+Sample slots hold a timestamp, the eleven get_sensor_data() values in
+telemetry.SAMPLE_FIELDS order and the flash flag (SAMPLE struct).
+
+Sensors are named so they can be created inside the IMU process:
+
+    "mpu6050"    - the real sensor (imu/mpu6050.py)
+    "synthetic"  - swinging motion with a clash every few seconds, for
+                   hosts without an IMU
+
+Software API:
+
+  MultiProcessPipeline(client, led_count=60, sensor="synthetic",
+                       sample_rate=100, render_rate=60, effect="steady")
+    start(), stop()
+    press(), hold()             - Button events for the renderer
+    run(duration=None)          - Send frames until stopped / duration
+    stats()                     - Frame and sample counters
+
+Running this file drives a synthetic blade against an OPC server.
+
+--------------------------------------------------------------------------
+"""
+
+import math
+import multiprocessing
+import os
+import queue
+import struct
+import sys
+import time
+
+from shm_ring import SharedRing
+from telemetry import SAMPLE_FIELDS
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+SAMPLE = struct.Struct("<d11fB7x")
+
+SAMPLE_SLOTS = 64
+FRAME_SLOTS = 4
+
+SYNTHETIC_CLASH_PERIOD = 3.0
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def make_sensor(name):
+    """Return a get_sensor_data()-like callable for a sensor name."""
+    if name == "mpu6050":
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "..", "imu"))
+        import mpu6050
+        mpu6050.init_mpu6050()
+        return mpu6050.get_sensor_data
+
+    if name == "synthetic":
+        start = time.monotonic()
+        last_clash = [0]
+
+        def synthetic():
+            t = time.monotonic() - start
+            swing = abs(math.sin(t * 2.0))
+            clash = int(t / SYNTHETIC_CLASH_PERIOD)
+            difference = 1.5 if clash != last_clash[0] else 0.0
+            last_clash[0] = clash
+            data = dict((field, 0.0) for field in SAMPLE_FIELDS)
+            data.update(accel_z=1.0, gyro_x=swing * 200.0, tot_gyro=swing * 200.0,
+                        comb_accel_gyro=swing * 2.0,
+                        speaker_vol=min(swing * 20.0, 100.0),
+                        difference=difference, flash=difference >= 1)
+            return data
+        return synthetic
+
+    raise ValueError("Unknown sensor {0!r}".format(name))
+
+
+def pack_sample(out, data, timestamp):
+    SAMPLE.pack_into(out, 0, timestamp,
+                     *([data[field] for field in SAMPLE_FIELDS] +
+                       [1 if data["flash"] else 0]))
+
+
+def unpack_sample(buffer):
+    values = SAMPLE.unpack_from(buffer, 0)
+    data = dict(zip(SAMPLE_FIELDS, values[1:12]))
+    data["flash"] = bool(values[12])
+    return data, values[0]
+
+
+def _imu_process(ring_name, stop, sensor_name, sample_rate):
+    ring = SharedRing(SAMPLE.size, SAMPLE_SLOTS, ring_name, create=False)
+    sensor = make_sensor(sensor_name)
+    out = bytearray(SAMPLE.size)
+    period = 1.0 / sample_rate
+    deadline = time.monotonic()
+    try:
+        while not stop.is_set():
+            data = sensor()
+            pack_sample(out, data, time.monotonic())
+            ring.write(out)
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline -= delay
+    finally:
+        ring.close()
+
+
+def _render_process(sample_name, frame_name, control, stop, led_count,
+                    render_rate, effect):
+    from runtime import BladeRenderer
+
+    samples = SharedRing(SAMPLE.size, SAMPLE_SLOTS, sample_name, create=False)
+    frames = SharedRing(led_count * 3, FRAME_SLOTS, frame_name, create=False)
+    renderer = BladeRenderer(led_count, effect=effect)
+    sample = bytearray(SAMPLE.size)
+    period = 1.0 / render_rate
+    deadline = time.monotonic()
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            while True:
+                try:
+                    kind = control.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "press":
+                    renderer.press(now)
+                elif kind == "hold":
+                    renderer.hold(now)
+            while samples.read_next(sample) is not None:
+                data, timestamp = unpack_sample(sample)
+                renderer.sample(data, timestamp)
+
+            frame, changed = renderer.render(now)
+            frames.write(memoryview(frame).cast("B"))
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline -= delay
+    finally:
+        samples.close()
+        frames.close()
+
+
+class MultiProcessPipeline(object):
+    """IMU and render processes joined by shared memory rings."""
+
+    def __init__(self, client, led_count=60, sensor="synthetic", sample_rate=100,
+                 render_rate=60, effect="steady"):
+        self.client = client
+        self.led_count = led_count
+        self.sensor = sensor
+        self.sample_rate = sample_rate
+        self.render_rate = render_rate
+        self.effect = effect
+
+        self.frames_sent = 0
+        self.frames_repeated = 0
+
+        self._samples = None
+        self._frames = None
+        self._control = None
+        self._stop = None
+        self._processes = []
+
+    def start(self):
+        """Create the rings and start the IMU and render processes."""
+        self._samples = SharedRing(SAMPLE.size, SAMPLE_SLOTS)
+        self._frames = SharedRing(self.led_count * 3, FRAME_SLOTS)
+        self._control = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._processes = [
+            multiprocessing.Process(
+                target=_imu_process, name="lightsaber-imu",
+                args=(self._samples.name, self._stop, self.sensor,
+                      self.sample_rate)),
+            multiprocessing.Process(
+                target=_render_process, name="lightsaber-render",
+                args=(self._samples.name, self._frames.name, self._control,
+                      self._stop, self.led_count, self.render_rate,
+                      self.effect)),
+        ]
+        for process in self._processes:
+            process.daemon = True
+            process.start()
+
+    def stop(self):
+        """Stop the processes and free the shared memory."""
+        if self._stop is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        for ring in (self._samples, self._frames):
+            ring.close()
+            ring.unlink()
+        self._samples = self._frames = None
+        self._stop = None
+
+    def press(self):
+        self._control.put("press")
+
+    def hold(self):
+        self._control.put("hold")
+
+    def run(self, duration=None):
+        """Send the newest frame at the render rate until duration passes."""
+        frame = bytearray(self.led_count * 3)
+        last_index = None
+        period = 1.0 / self.render_rate
+        start = deadline = time.monotonic()
+        while duration is None or time.monotonic() - start < duration:
+            index = self._frames.read_latest(frame)
+            if index is not None:
+                if index == last_index:
+                    self.frames_repeated += 1
+                else:
+                    self.client.put_frame(frame)
+                    self.frames_sent += 1
+                    last_index = index
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline -= delay
+
+    def stats(self):
+        """Return counters for the frames and samples moved so far."""
+        return {
+            "samples_published": self._samples.head if self._samples else 0,
+            "frames_published": self._frames.head if self._frames else 0,
+            "frames_sent": self.frames_sent,
+            "frames_repeated": self.frames_repeated,
+        }
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    from opc import Client
+
+    parser = argparse.ArgumentParser(description="Multi-process lightsaber pipeline")
+    parser.add_argument("--address", default="localhost:7890")
+    parser.add_argument("--sensor", default="synthetic", choices=("synthetic", "mpu6050"))
+    parser.add_argument("--leds", type=int, default=60)
+    parser.add_argument("--effect", default="flicker")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    client = Client(args.address)
+    if not client.can_connect():
+        print("WARNING: could not connect to %s" % args.address)
+
+    pipeline = MultiProcessPipeline(client, args.leds, args.sensor,
+                                    effect=args.effect)
+    pipeline.start()
+    try:
+        pipeline.press()            # Ignite
+        pipeline.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats = pipeline.stats()
+        pipeline.stop()
+        client.put_pixels([(0, 0, 0)] * args.leds)
+    print(stats)
@@ -40,13 +40,67 @@ import sys
 SET_PIXEL_COLOURS = 0  # "Set pixel colours" command (see openpixelcontrol.org)
 
 
+def parse_address(address):
+    """Split an address string into (transport, target).
+
+    'host:port' or 'tcp://host:port'  ->  ('tcp', (host, port))
+    'udp://host:port'                 ->  ('udp', (host, port))
+    'unix:/path/to/socket'            ->  ('unix', '/path/to/socket')
+
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    transport = 'tcp'
+    for prefix in ('tcp://', 'udp://'):
+        if address.startswith(prefix):
+            transport = prefix[:3]
+            address = address[len(prefix):]
+    host, port = address.rsplit(':', 1)
+    return transport, (host, int(port))
+
+
+def open_socket(transport, target, timeout=1):
+    """Return a socket connected to target over transport (see parse_address).
+
+    UDP sockets are non-blocking, so a full send buffer drops the frame
+    instead of delaying the next one.
+
+    """
+    if transport == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    elif transport == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(target)
+    except socket.error:
+        sock.close()
+        raise
+    if transport == 'udp':
+        sock.setblocking(False)
+    return sock
+
+
 class Client(object):
-    def __init__(self, server_ip_port, long_connection=True, verbose=False):
+    def __init__(self, server_ip_port, long_connection=True, verbose=False,
+                 compress=False):
         """Create an OPC client object which sends pixels to an OPC server.
 
         server_ip_port should be an ip:port or hostname:port as a single string.
         For example: '127.0.0.1:7890' or 'localhost:7890'
 
+        The transport is chosen by the address (see parse_address):
+        * 'host:port' or 'tcp://host:port' - TCP, as in the original protocol
+        * 'unix:/run/opc.sock' - Unix domain stream socket, for a server on the
+          same board (no TCP/IP stack in the path)
+        * 'udp://host:port' - one message per datagram.  Sends never block:
+          a frame that does not fit in the socket buffer is dropped (counted
+          in dropped_frames), so a stale frame never delays a fresh one.
+          UDP has no connection, so can_connect() is always True; with
+          compress=True a lost delta frame is skipped until the next keyframe.
+
         There are two connection modes:
         * In long connection mode, we try to maintain a single long-lived
           connection to the server.  If that connection is lost we will try to
@@ -62,16 +116,32 @@ class Client(object):
 
         If verbose is True, the client will print debugging info to the console.
 
+        If compress is True, frames are sent as run-length or delta encoded
+        system-exclusive messages (see compression.py).  Only use this with a
+        server that decodes them, such as opc_server.py.
+
         """
         self.verbose = verbose
 
         self._long_connection = long_connection
 
-        self._ip, self._port = server_ip_port.split(':')
-        self._port = int(self._port)
+        self._transport, self._target = parse_address(server_ip_port)
 
         self._socket = None  # will be None when we're not connected
 
+        self.dropped_frames = 0  # UDP frames dropped because the buffer was full
+
+        # Optional latency.LatencyMonitor, stamped after encoding and sending
+        self.latency = None
+
+        # Optional profiling.Profiler, with spans for encoding and sending
+        self.profiler = None
+
+        self._encoder = None
+        if compress:
+            from compression import FrameEncoder
+            self._encoder = FrameEncoder()
+
     def _debug(self, m):
         if self.verbose:
             print('    %s' % str(m))
@@ -88,9 +158,9 @@ class Client(object):
 
         try:
             self._debug('_ensure_connected: trying to connect...')
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.settimeout(1)
-            self._socket.connect((self._ip, self._port))
+            self._socket = open_socket(self._transport, self._target)
+            if self._encoder is not None:
+                self._encoder.reset()  # New connection, start with a keyframe
             self._debug('_ensure_connected:    ...success')
             return True
         except socket.error:
@@ -142,15 +212,10 @@ class Client(object):
         LED at a time (unless it's the first one).
 
         """
-        self._debug('put_pixels: connecting')
-        is_connected = self._ensure_connected()
-        if not is_connected:
-            self._debug('put_pixels: not connected.  ignoring these pixels.')
-            return False
+        if self.profiler is not None:
+            start = self.profiler.begin()
 
         # build OPC message
-        command = SET_PIXEL_COLOURS
-        header = struct.pack('>BBH', channel, SET_PIXEL_COLOURS, len(pixels)*3)
         pieces = [struct.pack(
                       'BBB',
                       min(255, max(0, int(r))),
@@ -158,20 +223,66 @@ class Client(object):
                       min(255, max(0, int(b)))
                   ) for r, g, b in pixels]
         if bytes is str:
-            message = header + ''.join(pieces)
+            data = ''.join(pieces)
         else:
-            message = header + b''.join(pieces)
+            data = b''.join(pieces)
+
+        if self.profiler is not None:
+            self.profiler.end('opc.encode', start)
 
-        self._debug('put_pixels: sending pixels to server')
+        return self._send_pixel_data(data, channel, 'put_pixels')
+
+    def put_frame(self, frame, channel=0):
+        """Send an already encoded frame to the OPC server on the given channel.
+
+        frame: Any bytes-like object holding packed 8-bit r, g, b values,
+            three bytes per LED.  For example a bytes, bytearray, memoryview
+            or a C-contiguous numpy uint8 array of shape (led_count, 3).
+
+        This skips the per-pixel clamping and packing done by put_pixels, so
+        it is the cheap path for renderers that already produce whole frames.
+
+        Return values and connection handling are the same as put_pixels.
+
+        """
+        return self._send_pixel_data(frame, channel, 'put_frame')
+
+    def _send_pixel_data(self, data, channel, caller):
+        self._debug('%s: connecting' % caller)
+        is_connected = self._ensure_connected()
+        if not is_connected:
+            self._debug('%s: not connected.  ignoring these pixels.' % caller)
+            return False
+
+        data = memoryview(data).cast('B')
+        if self._encoder is not None:
+            message = self._encoder.encode(channel, data)
+        else:
+            header = struct.pack('>BBH', channel, SET_PIXEL_COLOURS, len(data))
+            message = header + data
+        if self.latency is not None:
+            self.latency.stamp('encode')
+
+        self._debug('%s: sending pixels to server' % caller)
+        if self.profiler is not None:
+            start = self.profiler.begin()
         try:
             self._socket.send(message)
+        except BlockingIOError:
+            self._debug('%s: send buffer full.  dropping these pixels.' % caller)
+            self.dropped_frames += 1
+            return False
         except socket.error:
-            self._debug('put_pixels: connection lost.  could not send pixels.')
+            self._debug('%s: connection lost.  could not send pixels.' % caller)
             self._socket = None
             return False
+        if self.profiler is not None:
+            self.profiler.end('opc.send', start)
+        if self.latency is not None:
+            self.latency.stamp('send')
 
         if not self._long_connection:
-            self._debug('put_pixels: disconnecting')
+            self._debug('%s: disconnecting' % caller)
             self.disconnect()
 
         return True
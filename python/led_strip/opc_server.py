@@ -0,0 +1,246 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber OPC Stand-in Server
+--------------------------------------------------------------------------
+
+Minimal Open Pixel Control server in Python, standing in for the opc-server
+binary off the board: it accepts clients, decodes their messages and keeps
+the newest frame per channel instead of driving LEDs.  Used as the local
+sink for benchmarks and for checking what clients put on the wire.
+
+It also decodes the compressed sysex frames of compression.py (clients
+created with opc.Client(..., compress=True)), with one FrameDecoder per
+connection; these count as frames like plain ones.
+
+    python3 opc_server.py [--address localhost:7890]
+
+prints frames per second and throughput once a second.  The address takes
+the same forms as opc.Client's: "host:port" (TCP), "unix:/run/opc.sock"
+or "udp://host:port".
+
+Each stream connection is served by its own thread; the counters and
+frames they share are updated under one lock.  Messages are parsed
+from a per-connection buffer, so frames split across (or packed into)
+segments are handled.  Over UDP every datagram holds whole messages, and
+compressed frames are decoded per sender.
+
+Software API:
+
+  OPCServer(address="localhost:7890", on_frame=None)
+    start(), stop()     - Serve in background threads
+    address             - Bound address (port 0 picks a free port)
+    frames, bytes_received, messages
+    dropped             - Compressed frames that could not be decoded
+    last_frame(channel=0)
+    on_frame(channel, frame)
+                        - Optional callback for every decoded frame
+
+--------------------------------------------------------------------------
+"""
+
+import os
+import socket
+import struct
+import threading
+
+from compression import FrameDecoder
+from opc import parse_address
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+HEADER = struct.Struct(">BBH")
+
+SET_PIXEL_COLOURS = 0
+SYSTEM_EXCLUSIVE = 255
+
+RECEIVE_SIZE = 65536
+UDP_POLL_INTERVAL = 0.2
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class OPCServer(object):
+    """Threaded OPC server that records the frames it receives."""
+
+    def __init__(self, address="localhost:7890", on_frame=None):
+        self.transport, target = parse_address(address)
+        self.on_frame = on_frame
+
+        self.frames = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self.dropped = 0
+
+        if self.transport == "unix":
+            if os.path.exists(target):
+                os.unlink(target)
+            self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._listener.bind(target)
+            self.address = "unix:" + target
+        else:
+            kind = socket.SOCK_DGRAM if self.transport == "udp" else socket.SOCK_STREAM
+            self._listener = socket.socket(socket.AF_INET, kind)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind(target)
+            self.address = "{0}{1}:{2}".format(
+                "udp://" if self.transport == "udp" else "", target[0],
+                self._listener.getsockname()[1])
+        if self.transport == "udp":
+            self._listener.settimeout(UDP_POLL_INTERVAL)  # To notice stop()
+        else:
+            self._listener.listen(8)
+        self._path = target if self.transport == "unix" else None
+
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._connections = []
+        self._running = False
+
+    def start(self):
+        """Accept and serve clients in background threads."""
+        self._running = True
+        run = self._receive if self.transport == "udp" else self._accept
+        thread = threading.Thread(target=run, name="opc-server")
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Close the listener and every connection."""
+        self._running = False
+        try:
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        if self._path is not None and os.path.exists(self._path):
+            os.unlink(self._path)
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+    def last_frame(self, channel=0):
+        """Return the newest frame received on channel (bytes), or None."""
+        with self._lock:
+            return self._frames.get(channel)
+
+    def _accept(self):
+        while self._running:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            self._connections.append(connection)
+            thread = threading.Thread(target=self._serve, args=(connection,),
+                                      name="opc-server-client")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _receive(self):
+        decoders = {}
+        while self._running:
+            try:
+                data, sender = self._listener.recvfrom(RECEIVE_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            with self._lock:
+                self.bytes_received += len(data)
+            if sender not in decoders:
+                decoders[sender] = FrameDecoder()
+            self.parse(data, decoders[sender])
+
+    def _serve(self, connection):
+        pending = bytearray()
+        decoder = FrameDecoder()
+        try:
+            while self._running:
+                try:
+                    data = connection.recv(RECEIVE_SIZE)
+                except OSError:
+                    return
+                if not data:
+                    return
+                with self._lock:
+                    self.bytes_received += len(data)
+                pending += data
+                offset = self.parse(pending, decoder)
+                del pending[:offset]
+        finally:
+            if connection in self._connections:
+                self._connections.remove(connection)
+            connection.close()
+
+    def parse(self, buffer, decoder=None):
+        """Handle every complete message in buffer; return bytes consumed."""
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            channel, command, length = HEADER.unpack_from(buffer, offset)
+            end = offset + HEADER.size + length
+            if end > len(buffer):
+                break
+            with self._lock:
+                self.messages += 1
+            self.handle(channel, command, bytes(buffer[offset + HEADER.size:end]),
+                        decoder)
+            offset = end
+        return offset
+
+    def handle(self, channel, command, data, decoder=None):
+        """Handle one message; unknown commands are ignored, as in OPC."""
+        if command == SET_PIXEL_COLOURS:
+            self._store(channel, data)
+        elif command == SYSTEM_EXCLUSIVE and decoder is not None:
+            dropped = decoder.dropped
+            frame = decoder.decode(channel, data)
+            if frame is not None:
+                self._store(channel, frame)
+            if decoder.dropped != dropped:
+                with self._lock:
+                    self.dropped += decoder.dropped - dropped
+
+    def _store(self, channel, frame):
+        with self._lock:
+            self._frames[channel] = frame
+            self.frames += 1
+        if self.on_frame is not None:
+            self.on_frame(channel, frame)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="OPC stand-in server")
+    parser.add_argument("--address", default="localhost:7890")
+    args = parser.parse_args()
+
+    server = OPCServer(args.address).start()
+    print("Listening on {0}".format(server.address))
+    frames, received = 0, 0
+    try:
+        while True:
+            time.sleep(1.0)
+            print("{0:6d} frames/s {1:8.1f} kB/s".format(
+                server.frames - frames, (server.bytes_received - received) / 1e3))
+            frames, received = server.frames, server.bytes_received
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
@@ -0,0 +1,253 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Color Palette
+--------------------------------------------------------------------------
+
+Indexed blade color palette with cached, perceptually smooth transitions.
+
+Colors are held in a list plus a dictionary from color (and from name) to
+index, so finding the next color is a dictionary lookup instead of a
+list.index() search.  A color that is not in the palette does not raise;
+it snaps to the perceptually nearest entry.
+
+Transitions are interpolated in the OKLab color space (a perceptual space,
+so a red -> green fade does not dip through a muddy dark brown) and cached
+per (from, to) pair, both as color ramps and as encoded whole-blade frames
+ready for opc.Client.put_frame().  A color change then only streams the
+precomputed frames.
+
+Palettes are loaded from a JSON file (palettes.json next to this file):
+
+    {
+        "default": "classic",
+        "palettes": {
+            "classic": [
+                {"name": "Red", "color": [255, 0, 0]},
+                ...
+            ]
+        }
+    }
+
+Software API:
+
+  Palette(colors, names=None, steps=TRANSITION_STEPS)
+
+    index_of(color_or_name)
+      - Index of a color or name; unknown colors snap to the nearest entry
+
+    next_index(index), next_color(color)
+      - The following entry, wrapping around
+
+    ramp(from_color, to_color)
+      - List of "steps" colors, excluding from_color, ending on to_color
+
+    transition_frames(from_color, to_color, led_count)
+      - The ramp as encoded frames (bytes of led_count * 3)
+
+    ramp16(from_color, to_color)
+      - The ramp in 8.8 fixed point (0 - FIXED_WHITE), for the 16-bit
+        frames of a dithered blade (dither.py); not rounded to 8 bits
+
+  Palette.from_config(path=PALETTE_FILE, name=None)
+    - Load a palette by name (or the file's default palette)
+
+--------------------------------------------------------------------------
+"""
+
+import json
+import os
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+PALETTE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "palettes.json")
+
+TRANSITION_STEPS = 12               # Frames per color change (0.2 s at 60 Hz)
+FIXED_WHITE = 0xFF00                # 255 in 8.8 fixed point (dither.py)
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def _to_linear(c):
+    c = c / 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def _from_linear(c, scale=255):
+    c = 12.92 * c if c <= 0.0031308 else 1.055 * max(c, 0.0) ** (1 / 2.4) - 0.055
+    return min(scale, max(0, int(round(c * scale))))
+
+
+def rgb_to_oklab(color):
+    """Convert an 8-bit sRGB (r, g, b) tuple to an OKLab (L, a, b) tuple."""
+    r, g, b = [_to_linear(c) for c in color]
+    l = 0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b
+    m = 0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b
+    s = 0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b
+    l, m, s = [v ** (1 / 3.0) for v in (l, m, s)]
+    return (0.2104542553 * l + 0.7936177850 * m - 0.0040720468 * s,
+            1.9779984951 * l - 2.4285922050 * m + 0.4505937099 * s,
+            0.0259040371 * l + 0.7827717662 * m - 0.8086757660 * s)
+
+
+def oklab_to_rgb(lab, scale=255):
+    """Convert an OKLab (L, a, b) tuple to an 8-bit sRGB (r, g, b) tuple.
+
+    scale=FIXED_WHITE returns 8.8 fixed point channels instead.
+    """
+    L, a, b = lab
+    l = (L + 0.3963377774 * a + 0.2158037573 * b) ** 3
+    m = (L - 0.1055613458 * a - 0.0638541728 * b) ** 3
+    s = (L - 0.0894841775 * a - 1.2914855480 * b) ** 3
+    return (_from_linear(4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s, scale),
+            _from_linear(-1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s, scale),
+            _from_linear(-0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s, scale))
+
+
+def oklab_ramp(from_color, to_color, steps, scale=255):
+    """Return steps colors from from_color (excluded) to to_color (included).
+
+    With scale=FIXED_WHITE the colors are 8.8 fixed point (see ramp16()).
+    """
+    start = rgb_to_oklab(from_color)
+    end = rgb_to_oklab(to_color)
+    ramp = []
+    for i in range(1, steps + 1):
+        t = i / float(steps)
+        ramp.append(oklab_to_rgb(tuple(s + (e - s) * t for s, e in zip(start, end)),
+                                 scale))
+    ramp[-1] = tuple(c * scale // 255 for c in to_color)
+    return ramp
+
+
+class Palette(object):
+    """Indexed list of blade colors with cached transitions."""
+
+    def __init__(self, colors, names=None, steps=TRANSITION_STEPS):
+        if not colors:
+            raise ValueError("A palette needs at least one color")
+        if names is not None and len(names) != len(colors):
+            raise ValueError("Got {0} names for {1} colors".format(
+                len(names), len(colors)))
+
+        self.colors = [tuple(int(c) for c in color) for color in colors]
+        self.names = list(names) if names is not None else [None] * len(colors)
+        self.steps = steps
+
+        self._index = {}
+        for i, color in enumerate(self.colors):
+            self._index.setdefault(color, i)
+        for i, name in enumerate(self.names):
+            if name is not None:
+                self._index.setdefault(name.lower(), i)
+
+        self._lab = [rgb_to_oklab(color) for color in self.colors]
+        self._ramps = {}
+        self._ramps16 = {}
+        self._frames = {}
+
+    @classmethod
+    def from_config(cls, path=PALETTE_FILE, name=None, steps=TRANSITION_STEPS):
+        """Load the named palette (or the file's default) from a JSON file."""
+        with open(path) as f:
+            config = json.load(f)
+        if name is None:
+            name = config["default"]
+        try:
+            entries = config["palettes"][name]
+        except KeyError:
+            raise ValueError("No palette named {0!r} in {1}".format(name, path))
+        return cls([entry["color"] for entry in entries],
+                   [entry.get("name") for entry in entries], steps)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __getitem__(self, index):
+        return self.colors[index % len(self.colors)]
+
+    def index_of(self, color):
+        """Return the index of a color or color name.
+
+        Colors that are not in the palette return the index of the nearest
+        entry in OKLab space.
+        """
+        if isinstance(color, str):
+            try:
+                return self._index[color.lower()]
+            except KeyError:
+                raise ValueError("No color named {0!r} in the palette".format(color))
+
+        color = tuple(color)
+        index = self._index.get(color)
+        if index is None:
+            lab = rgb_to_oklab(color)
+            distances = [sum((p - q) ** 2 for p, q in zip(lab, entry))
+                         for entry in self._lab]
+            index = distances.index(min(distances))
+        return index
+
+    def next_index(self, index):
+        """Return the index after index, wrapping around."""
+        return (index + 1) % len(self.colors)
+
+    def next_color(self, color):
+        """Return the color after color (or after its nearest entry)."""
+        return self.colors[self.next_index(self.index_of(color))]
+
+    def ramp(self, from_color, to_color):
+        """Return the cached transition ramp between two colors.
+
+        Pairs of palette entries are cached; colors outside the palette are
+        interpolated on each call.
+        """
+        key = (tuple(from_color), tuple(to_color))
+        ramp = self._ramps.get(key)
+        if ramp is None:
+            ramp = oklab_ramp(key[0], key[1], self.steps)
+            if key[0] in self._index and key[1] in self._index:
+                self._ramps[key] = ramp
+        return ramp
+
+    def ramp16(self, from_color, to_color):
+        """Return the transition ramp in 8.8 fixed point, cached like ramp()."""
+        key = (tuple(from_color), tuple(to_color))
+        ramp = self._ramps16.get(key)
+        if ramp is None:
+            ramp = oklab_ramp(key[0], key[1], self.steps, FIXED_WHITE)
+            if key[0] in self._index and key[1] in self._index:
+                self._ramps16[key] = ramp
+        return ramp
+
+    def transition_frames(self, from_color, to_color, led_count):
+        """Return the transition as a list of encoded whole-blade frames."""
+        key = (tuple(from_color), tuple(to_color), led_count)
+        frames = self._frames.get(key)
+        if frames is None:
+            frames = [bytes(color) * led_count
+                      for color in self.ramp(from_color, to_color)]
+            if key[0] in self._index and key[1] in self._index:
+                self._frames[key] = frames
+        return frames
+
+    def precompute(self, led_count):
+        """Build the frames for every adjacent transition up front."""
+        for i, color in enumerate(self.colors):
+            self.transition_frames(color, self[self.next_index(i)], led_count)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    palette = Palette.from_config()
+    print("Palette ({0} colors, {1} transition steps)".format(
+        len(palette), palette.steps))
+    for i, color in enumerate(palette.colors):
+        following = palette[palette.next_index(i)]
+        print("  {0:<8} {1} -> {2}".format(
+            palette.names[i] or "", color, palette.ramp(color, following)[:3]))
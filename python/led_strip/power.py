@@ -0,0 +1,160 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Power Limiter
+--------------------------------------------------------------------------
+
+Output stage that keeps the LED current under a budget, so a full-white
+clash flash on a long blade cannot brown out the battery.
+
+The current of a WS2812-type strip is close to linear in the channel
+values, so it is estimated from the sum of all bytes of the encoded frame:
+
+    current = led_count * IDLE_MA + channel_sum / 255 * CHANNEL_MA
+
+sum() over a bytes frame (or one NumPy sum()) is a single pass in C.  If
+the estimate is over budget_ma, the frame is scaled uniformly by the
+largest of LEVELS brightness steps that fits, using a 256-byte linear
+lookup table per step; tables are built on first use and cached, so a
+limited frame costs one bytes.translate() (or one NumPy take()).
+
+The estimate is for the frame as sent.  When the opc-server applies its
+own gamma table ("enableLookupTable" in config.json) the real current is
+lower, so the limit is conservative.
+
+Software API:
+
+  PowerLimiter(budget_ma, ma_per_channel=20.0, idle_ma_per_led=1.0)
+    estimate(frame)     - Estimated mA of an encoded frame
+    apply(frame)        - The frame, scaled down if over budget
+    limited, frames, last_scale, peak_ma
+
+  LimitedClient(client, limiter)
+    - opc.Client stand-in (put_frame(), put_pixels(), ...) that limits
+      every frame before sending it
+
+--------------------------------------------------------------------------
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+CHANNEL_MA = 20.0                   # mA of one channel at 255 (WS2812B)
+IDLE_MA = 1.0                       # mA of one LED that is off
+LEVELS = 256                        # Brightness steps of the limiter
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class PowerLimiter(object):
+    """Scales frames uniformly to keep the estimated current under budget."""
+
+    def __init__(self, budget_ma, ma_per_channel=CHANNEL_MA, idle_ma_per_led=IDLE_MA):
+        if budget_ma <= 0:
+            raise ValueError("budget_ma must be positive, got {0}".format(budget_ma))
+        self.budget_ma = float(budget_ma)
+        self.ma_per_channel = ma_per_channel
+        self.idle_ma_per_led = idle_ma_per_led
+
+        self.frames = 0
+        self.limited = 0
+        self.last_scale = 1.0
+        self.peak_ma = 0.0
+
+        self._tables = {}               # level: 256-byte table
+        self._np_tables = {}
+
+    def _table(self, level):
+        table = self._tables.get(level)
+        if table is None:
+            # Rounded down, so a scaled frame is never over budget
+            table = self._tables[level] = bytes(v * level // LEVELS for v in range(256))
+        return table
+
+    def _channel_sum(self, frame):
+        if np is not None and isinstance(frame, np.ndarray):
+            return int(frame.sum(dtype=np.uint64)), frame.size // 3
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = memoryview(frame).cast("B")
+        return sum(frame), len(frame) // 3
+
+    def estimate(self, frame):
+        """Return the estimated current (mA) of an encoded frame."""
+        channel_sum, led_count = self._channel_sum(frame)
+        return led_count * self.idle_ma_per_led + \
+            channel_sum * self.ma_per_channel / 255.0
+
+    def apply(self, frame):
+        """Return frame, or a uniformly dimmed copy if it is over budget."""
+        channel_sum, led_count = self._channel_sum(frame)
+        idle = led_count * self.idle_ma_per_led
+        active = channel_sum * self.ma_per_channel / 255.0
+        self.frames += 1
+        self.peak_ma = max(self.peak_ma, idle + active)
+        if idle + active <= self.budget_ma:
+            self.last_scale = 1.0
+            return frame
+
+        level = int(LEVELS * max(0.0, self.budget_ma - idle) / active)
+        self.limited += 1
+        self.last_scale = level / float(LEVELS)
+
+        if np is not None and isinstance(frame, np.ndarray):
+            table = self._np_tables.get(level)
+            if table is None:
+                table = self._np_tables[level] = np.frombuffer(
+                    self._table(level), dtype=np.uint8)
+            return table.take(frame)
+        if not isinstance(frame, (bytes, bytearray)):
+            frame = bytes(memoryview(frame).cast("B"))
+        return frame.translate(self._table(level))
+
+
+class LimitedClient(object):
+    """Wraps an opc.Client-like output so every frame goes through a limiter."""
+
+    def __init__(self, client, limiter):
+        self._client = client
+        self.limiter = limiter
+
+    def put_frame(self, frame, channel=0):
+        return self._client.put_frame(self.limiter.apply(frame), channel)
+
+    def put_pixels(self, pixels, channel=0):
+        frame = bytes(min(255, max(0, int(c))) for pixel in pixels for c in pixel)
+        return self.put_frame(frame, channel)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Power limiter cost and effect")
+    parser.add_argument("--budget", type=float, default=1500.0, help="mA")
+    parser.add_argument("--leds", type=int, default=60)
+    args = parser.parse_args()
+
+    limiter = PowerLimiter(args.budget)
+    white = bytes((255, 255, 255)) * args.leds
+    red = bytes((255, 0, 0)) * args.leds
+    for name, frame in (("red", red), ("white", white)):
+        start = time.perf_counter()
+        for _ in range(1000):
+            out = limiter.apply(frame)
+        elapsed = (time.perf_counter() - start) / 1000
+        print("{0:>5}: {1:7.0f} mA -> {2:7.0f} mA (scale {3:.2f}), {4:.1f} us per frame"
+              .format(name, limiter.estimate(frame), limiter.estimate(out),
+                      limiter.last_scale, elapsed * 1e6))
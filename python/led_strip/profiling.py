@@ -0,0 +1,164 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Profiling
+--------------------------------------------------------------------------
+
+Lightweight span instrumentation with Chrome trace-event export.
+
+A span is a named interval on one thread, e.g. one read_raw_data() call or
+one socket send.  Spans go into a bounded ring buffer (the oldest spans are
+overwritten), and can be exported as Chrome trace-event JSON to inspect
+jitter and stalls in a timeline viewer (chrome://tracing or
+https://ui.perfetto.dev).
+
+Instrumented code holds an optional profiler hook, like the latency hooks:
+
+    mpu6050.profiler = profiler       # read_raw_data, get_sensor_data math
+    opc_client.profiler = profiler    # struct.pack encoding, socket send
+
+and marks spans with:
+
+    start = profiler.begin()
+    ...
+    profiler.end("name", start)
+
+With the hook left as None the cost is one "is not None" test; with a
+disabled profiler, begin() returns None and end() returns immediately.
+
+Software API:
+
+  Profiler(capacity=65536, enabled=True)
+    enable(), disable(), enabled
+    begin()                     - Start time, or None when disabled
+    end(name, start)            - Record a span begun with begin()
+    span(name)                  - Context manager around a block
+    spans()                     - List of (name, start, duration, thread id)
+    export_chrome_trace(path)   - Write trace-event JSON
+    clear()
+
+--------------------------------------------------------------------------
+"""
+
+import json
+import os
+import threading
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+DEFAULT_CAPACITY = 65536
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class _NullSpan(object):
+    """Context manager that does nothing, used when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = self._profiler.begin()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler.end(self._name, self._start)
+        return False
+
+
+class Profiler(object):
+    """Bounded ring buffer of timed spans."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, enabled=True,
+                 clock=time.perf_counter):
+        self.capacity = capacity
+        self.enabled = enabled
+
+        self._clock = clock
+        self._names = [None] * capacity
+        self._starts = [0.0] * capacity
+        self._durations = [0.0] * capacity
+        self._threads = [0] * capacity
+        self._count = 0
+        self._thread_names = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def begin(self):
+        """Return the start time of a span, or None when disabled."""
+        if not self.enabled:
+            return None
+        return self._clock()
+
+    def end(self, name, start):
+        """Record the span name from start (a begin() value) until now."""
+        if start is None:
+            return
+        now = self._clock()
+        thread = threading.get_ident()
+        if thread not in self._thread_names:
+            self._thread_names[thread] = threading.current_thread().name
+
+        # The slot claim is not locked; a race between threads can at worst
+        # overwrite one span, which is acceptable for a profiler
+        i = self._count % self.capacity
+        self._count += 1
+        self._names[i] = name
+        self._starts[i] = start
+        self._durations[i] = now - start
+        self._threads[i] = thread
+
+    def span(self, name):
+        """Return a context manager recording a span around a block."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def spans(self):
+        """Return the recorded spans, oldest first."""
+        count = min(self._count, self.capacity)
+        first = self._count - count
+        result = []
+        for n in range(first, self._count):
+            i = n % self.capacity
+            result.append((self._names[i], self._starts[i],
+                           self._durations[i], self._threads[i]))
+        return result
+
+    def clear(self):
+        self._count = 0
+
+    def export_chrome_trace(self, path):
+        """Write the spans as Chrome trace-event JSON ("X" events, in us)."""
+        pid = os.getpid()
+        events = []
+        for thread, name in self._thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                           "tid": thread, "args": {"name": name}})
+        for name, start, duration, thread in self.spans():
+            events.append({"name": name, "ph": "X", "pid": pid, "tid": thread,
+                           "ts": start * 1e6, "dur": duration * 1e6})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
@@ -0,0 +1,605 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Runtime
+--------------------------------------------------------------------------
+
+Single asyncio runtime for the button, IMU, render and output stages.
+
+The original scripts share the globals led_on, current_color and
+button_pressed between the GPIO callback thread (which also runs blocking
+ignition loops) and the main thread polling the IMU.  Here each stage is an
+asyncio task that owns its own state and talks to the others through
+queues:
+
+    button task  --ButtonEvent-->  render task  --frame-->  output task
+    imu task     --Sample------->
+                 --Gesture------>
+
+- button task: GPIO edge callbacks are handed to the event loop with
+  call_soon_threadsafe(); press / hold is decided by polling the pin
+  through the executor until it is released or HOLD_TIME passes
+- imu task: calls get_sensor_data() through the executor at sample_rate,
+  and feeds the optional gesture recognizer (imu/gesture.py)
+- render task: the only owner of the blade state (BladeRenderer); renders
+  at render_rate and forwards a frame when it changed, or every
+  keepalive_interval seconds
+- dither task (optional): while the frame has fractional channels,
+  sends the next temporally dithered frame (dither.py) at dither_rate
+- output task: sends the newest frame with opc.Client.put_frame() through
+  the executor; frames that were superseded before being sent are dropped
+
+Blocking I2C, GPIO and socket calls run in a small thread pool so that no
+stage stalls another, and each stage runs at its own rate.  With an idle
+governor (governor.py) those rates drop while the blade is off or still;
+a button edge, motion or an edge on motion_pin (the MPU6050's motion
+interrupt) wakes every stage at once if the governor was idle (while it
+is active, the stages already run at full rate).
+
+BladeRenderer holds all blade behaviour (ignition, retraction, color
+fades, clash flash, blaster marks, idle effect) and is a plain synchronous
+object driven by (event, time) calls, so it can also be stepped without
+asyncio.  A clash flashes white around the impact point estimated from the
+IMU (geometry.py), or the whole blade when flash_width is None.
+
+A sensor that returns None instead of a sample (acquisition.py, while the
+I2C bus recovers) puts the renderer into a degraded no-motion mode: the
+idle effect keeps running, but there are no clash flashes or gestures,
+and the hum drops to its idle level, until samples come back.
+
+Software API:
+
+  BladeRenderer(led_count, palette=None, effect="steady",
+                ignition_time=0.3, flash_time=0.1, clash_flash=True,
+                flash_width=0.3, precise=False)
+    press(now), hold(now), sample(data, now)
+                        - data None: the sensor failed (degraded mode)
+    clash(now, position), blast(now, position)
+                        - Localized flash / blaster mark (0.0 hilt - 1.0 tip)
+    gesture(kind, now)  - Stab flashes the tip, thrust the whole blade
+    render(now)         - Return (frame, changed)
+    is_on, color, degraded
+    frame16             - With precise: the last frame in 8.8 fixed point
+                          during ignition, retraction and color fades
+
+  Runtime(renderer, client, gpio=None, button_pin=None, sensor=None,
+          sample_rate=60, render_rate=60, telemetry=None, audio=None,
+          gestures=None, governor=None, motion_pin=None, dither=None,
+          dither_rate=240, executor=None)
+    - audio: optional audio engine (audio/engine.py), fed speaker_vol
+      from every IMU sample and the blade on / off state
+    - gestures: optional gesture.GestureRecognizer fed every IMU sample;
+      its gestures are passed to renderer.gesture()
+    - governor: optional governor.IdleGovernor setting the sample, render
+      and keepalive rates; motion_pin is a GPIO input wired to the MPU6050
+      INT pin (mpu6050.enable_motion_interrupt())
+    - dither: optional dither.TemporalDither; rendered frames are scaled
+      by its brightness in 16 bits and sent dithered at dither_rate.
+      Ignition, retraction and color fades reach it at 16 bits
+      (BladeRenderer.frame16)
+    - executor: runs the blocking calls (default: a thread pool of
+      workers threads); headless.py runs them inline
+    run()               - Coroutine running all stages until stop()
+    stop()
+
+The lightsaber itself is started with lightsaber.py, which builds a
+Runtime from lightsaber.json.
+
+--------------------------------------------------------------------------
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+from effects import EffectEngine
+from geometry import BladeGeometry, ImpactEstimator
+from palette import Palette
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+BUTTON_PIN = "P2_4"
+LED_COUNT = 60
+
+HOLD_TIME = 1.0                     # Seconds held to turn the blade off
+BUTTON_POLL_INTERVAL = 0.02
+IGNITION_TIME = 0.3                 # Same speed as ACTIVATION_DELAY * 30
+FLASH_TIME = 0.1
+FLASH_WIDTH = 0.3                   # Half-width of a clash flash, blade lengths
+CLASH_TIME = 0.25                   # A localized clash flash fades over this
+STAB_POSITION = 0.95
+THRUST_TIME = 0.3
+BLAST_WIDTH = 0.06
+BLAST_TIME = 0.6
+BLAST_COLOR = (255, 200, 120)
+WHITE = (255, 255, 255)
+KEEPALIVE_INTERVAL = 1.0            # Resend an unchanged frame this often
+
+OFF = "off"
+IGNITING = "igniting"
+ON = "on"
+RETRACTING = "retracting"
+
+ButtonEvent = collections.namedtuple("ButtonEvent", "kind time")
+Sample = collections.namedtuple("Sample", "data time")
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def put_latest(queue, item):
+    """Put item on a bounded asyncio queue, dropping the oldest if full."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+class BladeRenderer(object):
+    """Blade state machine; turns button and IMU input into frames.
+
+    The LEDs are two strips of led_count / 2 in sequence, the second one
+    mounted in reverse, so the blade grows from both ends of the index
+    range toward the middle (see map_reverse_led in the scripts).
+    """
+
+    def __init__(self, led_count=LED_COUNT, palette=None, effect="steady",
+                 ignition_time=IGNITION_TIME, flash_time=FLASH_TIME,
+                 clash_flash=True, flash_width=FLASH_WIDTH, precise=False):
+        self.led_count = led_count
+        self.half = led_count // 2
+        self.palette = palette if palette is not None else Palette.from_config()
+        self.palette.precompute(led_count)
+        self.ignition_time = ignition_time
+        self.flash_time = flash_time
+        self.clash_flash = clash_flash
+        self.flash_width = flash_width
+        self.precise = precise
+        self.frame16 = None
+        self.geometry = BladeGeometry(led_count)
+        self._impact = ImpactEstimator()
+        self._marks = []
+
+        self.state = OFF
+        self.degraded = False
+        self.color = self.palette[0]
+        self.engine = EffectEngine(led_count, self.color, effect)
+
+        self._state_start = 0.0
+        self._flash_until = None
+        self._transition = None
+        self._transition16 = None
+        self._transition_index = 0
+        self._last_key = None
+
+        self._black = bytes(3)
+        self._white = bytes((255, 255, 255)) * led_count
+
+    @property
+    def is_on(self):
+        return self.state != OFF
+
+    # -----------------------------------------------------
+    # Input
+    # -----------------------------------------------------
+
+    def press(self, now):
+        """Short press: ignite, or fade to the next color when on."""
+        if self.state == OFF:
+            self._set_state(IGNITING, now)
+        elif self.state == ON:
+            next_color = self.palette.next_color(self.color)
+            self._transition = self.palette.transition_frames(
+                self.color, next_color, self.led_count)
+            self._transition16 = self.palette.ramp16(self.color, next_color)
+            self._transition_index = 0
+            self.color = next_color
+            self.engine.set_color(next_color)
+
+    def hold(self, now):
+        """Long press: retract the blade."""
+        if self.state in (IGNITING, ON):
+            self._set_state(RETRACTING, now)
+
+    def sample(self, data, now):
+        """Handle an IMU sample; a flash while lit flashes white."""
+        if data is None:
+            if not self.degraded:
+                self.degraded = True
+                self._flash_until = None
+                self._marks = []
+            return
+        self.degraded = False
+        position = self._impact.update(data)
+        if not (self.clash_flash and data.get("flash") and self.state == ON):
+            return
+        if self.flash_width is None:
+            self._flash_until = now + self.flash_time
+        elif position is not None:
+            self.clash(now, position)
+
+    def clash(self, now, position):
+        """Flash white around position (0.0 hilt - 1.0 tip)."""
+        self._marks.append(self.geometry.mark(
+            position, self.flash_width, WHITE, now, CLASH_TIME))
+
+    def blast(self, now, position, color=BLAST_COLOR):
+        """Leave a fading blaster mark at position."""
+        self._marks.append(self.geometry.mark(
+            position, BLAST_WIDTH, color, now, BLAST_TIME))
+
+    def gesture(self, kind, now):
+        """Show a recognized gesture (gesture.Gesture kind) while lit."""
+        if self.state != ON or self.degraded:
+            return
+        if kind == "stab":
+            self.clash(now, STAB_POSITION)
+        elif kind == "thrust":
+            self._marks.append(self.geometry.mark(0.5, 1.0, WHITE, now, THRUST_TIME))
+
+    def _set_state(self, state, now):
+        self.state = state
+        self._state_start = now
+        self._transition = None
+        self._flash_until = None
+        self._marks = []
+
+    # -----------------------------------------------------
+    # Rendering
+    # -----------------------------------------------------
+
+    def _partial(self, lit):
+        """Frame with lit LEDs on at each end of the index range."""
+        on = bytes(self.color)
+        dark = self.half - lit
+        tail = self.led_count - 2 * self.half
+        return (on * lit + self._black * dark + self._black * tail +
+                self._black * dark + on * lit)
+
+    def _partial16(self, lit):
+        """8.8 fixed point frame with lit (fractional) LEDs on at each end."""
+        full = int(lit)
+        color = [c * 256 for c in self.color]
+        on = color * full
+        dark = self.half - full
+        if dark > 0:
+            edge = [int(c * (lit - full)) for c in color]
+            dark = [0, 0, 0] * (dark - 1)
+            return on + edge + dark + [0, 0, 0] * (self.led_count - 2 * self.half) + \
+                dark + edge + on
+        return on + [0, 0, 0] * (self.led_count - 2 * self.half) + on
+
+    def render(self, now):
+        """Return (frame, changed) for time now.
+
+        changed is False when the frame is the same as the previous call's,
+        so callers can skip resending static frames.  With precise, frame16
+        is then the same frame in 8.8 fixed point during ignition,
+        retraction and color fades, where the 8-bit frame is rounded (the
+        leading LED ramps up instead of switching on); None otherwise.
+        """
+        elapsed = now - self._state_start
+        self.frame16 = None
+
+        if self.state == IGNITING:
+            lit = min(self.half, int(self.half * elapsed / self.ignition_time) + 1)
+            if self.precise:
+                self.frame16 = self._partial16(min(
+                    self.half, self.half * elapsed / self.ignition_time + 1))
+            if lit >= self.half:
+                self._set_state(ON, now)
+            return self._keyed(("partial", lit, self.color), self._partial, lit)
+
+        if self.state == RETRACTING:
+            lit = self.half - int(self.half * elapsed / self.ignition_time)
+            if self.precise:
+                self.frame16 = self._partial16(max(
+                    0.0, self.half - self.half * elapsed / self.ignition_time))
+            if lit <= 0:
+                self._set_state(OFF, now)
+                lit = 0
+            return self._keyed(("partial", lit, self.color), self._partial, lit)
+
+        if self.state == OFF:
+            return self._keyed(("partial", 0, None), self._partial, 0)
+
+        if self._flash_until is not None:
+            if now < self._flash_until:
+                return self._keyed(("white",), lambda: self._white)
+            self._flash_until = None
+
+        if self._marks:
+            self._marks = [mark for mark in self._marks if mark.active(now)]
+            if self._marks:
+                frame, _ = self._lit(now)
+                self.frame16 = None
+                self._last_key = None
+                return self.geometry.apply(frame, self._marks, now), True
+
+        return self._lit(now)
+
+    def _lit(self, now):
+        """(frame, changed) of the lit blade: color transition or effect."""
+        if self._transition is not None:
+            frame = self._transition[self._transition_index]
+            if self.precise:
+                self.frame16 = list(self._transition16[self._transition_index]) * \
+                    self.led_count
+            self._transition_index += 1
+            if self._transition_index >= len(self._transition):
+                self._transition = None
+            self._last_key = None
+            return frame, True
+
+        if self.engine.effect == "steady":
+            return self._keyed(("steady", self.color), self.engine.render, now)
+        self._last_key = None
+        return self.engine.render(now), True
+
+    def _keyed(self, key, build, *args):
+        changed = key != self._last_key
+        self._last_key = key
+        return build(*args), changed
+
+
+class Runtime(object):
+    """Runs the input, sensor, render and output stages as asyncio tasks."""
+
+    def __init__(self, renderer, client, gpio=None, button_pin=BUTTON_PIN,
+                 sensor=None, sample_rate=60, render_rate=60,
+                 keepalive_interval=KEEPALIVE_INTERVAL, telemetry=None,
+                 workers=3, audio=None, gestures=None, governor=None,
+                 motion_pin=None, dither=None, dither_rate=240, executor=None):
+        self.renderer = renderer
+        self.client = client
+        self.gpio = gpio
+        self.button_pin = button_pin
+        self.sensor = sensor
+        self.sample_rate = sample_rate
+        self.render_rate = render_rate
+        self.keepalive_interval = keepalive_interval
+        self.telemetry = telemetry
+        self.audio = audio
+        self.gestures = gestures
+        self.governor = governor
+        self.motion_pin = motion_pin
+        self.dither = dither
+        self.dither_rate = dither_rate
+        if dither is not None:
+            renderer.precise = True
+        if gestures is not None:
+            gestures.subscribe(self._on_gesture)
+
+        self._executor = executor if executor is not None else \
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="lightsaber-io")
+        self._loop = None
+        self._stopping = None
+        self._edges = None
+        self._buttons = None
+        self._samples = None
+        self._gesture_events = None
+        self._frames = None
+        self._wakeups = []
+
+    async def run(self):
+        """Run every stage until stop() is called."""
+        self._loop = asyncio.get_event_loop()
+        self._stopping = asyncio.Event()
+        self._edges = asyncio.Queue()
+        self._buttons = asyncio.Queue()
+        self._samples = asyncio.Queue(maxsize=8)
+        self._gesture_events = asyncio.Queue(maxsize=8)
+        self._frames = asyncio.Queue(maxsize=1)
+
+        tasks = [self._render_task(), self._output_task()]
+        if self.dither is not None:
+            tasks.append(self._dither_task())
+        if self.gpio is not None:
+            tasks.append(self._button_task())
+        if self.sensor is not None:
+            tasks.append(self._imu_task())
+        if self.governor is not None and self.gpio is not None and \
+                self.motion_pin is not None:
+            tasks.append(self._motion_task())
+        tasks = [asyncio.ensure_future(task) for task in tasks]
+
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._io(self.client.put_frame, bytes(3 * self.renderer.led_count))
+            self._executor.shutdown(wait=True)
+
+    def stop(self):
+        """Ask run() to finish; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def _io(self, function, *args):
+        return self._loop.run_in_executor(self._executor, function, *args)
+
+    def _on_gesture(self, gesture):
+        if self._gesture_events is not None:
+            put_latest(self._gesture_events, gesture)
+
+    def _wake(self):
+        """Activity: tell the governor; wake the stages if it was idle."""
+        if self.governor.wake(self._loop.time()):
+            self._wake_stages()
+
+    def _wake_stages(self):
+        """Cut every stage's current sleep short."""
+        for event in self._wakeups:
+            event.set()
+
+    async def _every(self, interval, step):
+        """Call the coroutine step every interval seconds without drift.
+
+        interval may be a function, asked again after every step.  With a
+        governor the sleep ends early when _wake_stages() is called.
+        """
+        wake = None
+        if self.governor is not None:
+            wake = asyncio.Event()
+            self._wakeups.append(wake)
+        deadline = self._loop.time()
+        while True:
+            await step()
+            if wake is not None:
+                self.governor.tick()
+            deadline += interval() if callable(interval) else interval
+            delay = deadline - self._loop.time()
+            if delay < 0:
+                deadline -= delay           # Running late; do not catch up
+                delay = 0
+            if wake is None:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), delay)
+            except asyncio.TimeoutError:
+                continue
+            wake.clear()
+            deadline = self._loop.time()
+
+    # -----------------------------------------------------
+    # Stages
+    # -----------------------------------------------------
+
+    async def _button_task(self):
+        gpio = self.gpio
+        pin = self.button_pin
+
+        def on_edge(channel):
+            self._loop.call_soon_threadsafe(self._edges.put_nowait, time.monotonic())
+            if self.governor is not None:
+                self._loop.call_soon_threadsafe(self._wake)
+
+        await self._io(gpio.setup, pin, gpio.IN, gpio.PUD_UP)
+        await self._io(gpio.add_event_detect, pin, gpio.FALLING, on_edge, 300)
+
+        while True:
+            await self._edges.get()
+            start = self._loop.time()
+            kind = "press"
+            while await self._io(gpio.input, pin) == gpio.LOW:
+                if self._loop.time() - start >= HOLD_TIME:
+                    kind = "hold"
+                    break
+                await asyncio.sleep(BUTTON_POLL_INTERVAL)
+            self._buttons.put_nowait(ButtonEvent(kind, self._loop.time()))
+
+            # Drop edges from bounces or the rest of a hold
+            while not self._edges.empty():
+                self._edges.get_nowait()
+
+    async def _motion_task(self):
+        gpio = self.gpio
+
+        def on_motion(channel):
+            self._loop.call_soon_threadsafe(self._wake)
+
+        await self._io(gpio.setup, self.motion_pin, gpio.IN)
+        await self._io(gpio.add_event_detect, self.motion_pin, gpio.RISING, on_motion)
+        await self._stopping.wait()
+
+    async def _imu_task(self):
+        interval = 1.0 / self.sample_rate
+        if self.governor is not None:
+            interval = self.governor.sample_interval
+
+        async def step():
+            data = await self._io(self.sensor)
+            now = self._loop.time()
+            if data is None:
+                # Sensor failed; the renderer runs without motion meanwhile
+                if self.audio is not None:
+                    self.audio.set_speaker_vol(0)
+                put_latest(self._samples, Sample(None, now))
+                return
+            if self.telemetry is not None:
+                self.telemetry.sample(data)
+            if self.audio is not None:
+                self.audio.update(data)
+            if self.governor is not None and self.governor.sample(data, now):
+                self._wake_stages()
+            if self.gestures is not None:
+                self.gestures.update(data, now)
+            put_latest(self._samples, Sample(data, now))
+        await self._every(interval, step)
+
+    async def _render_task(self):
+        renderer = self.renderer
+        governor = self.governor
+        last_sent = [None]
+        interval = 1.0 / self.render_rate
+        if governor is not None:
+            interval = governor.render_interval
+
+        async def step():
+            while not self._buttons.empty():
+                event = self._buttons.get_nowait()
+                if event.kind == "press":
+                    renderer.press(event.time)
+                else:
+                    renderer.hold(event.time)
+            while not self._samples.empty():
+                sample = self._samples.get_nowait()
+                renderer.sample(sample.data, sample.time)
+            while not self._gesture_events.empty():
+                gesture = self._gesture_events.get_nowait()
+                renderer.gesture(gesture.kind, gesture.time)
+
+            now = self._loop.time()
+            frame, changed = renderer.render(now)
+            if self.audio is not None:
+                self.audio.set_on(renderer.is_on)
+            keepalive = self.keepalive_interval
+            if governor is not None:
+                governor.rendered(renderer.is_on, changed, now)
+                keepalive = governor.keepalive_interval()
+            stale = last_sent[0] is None or now - last_sent[0] >= keepalive
+            if self.dither is not None:
+                if renderer.frame16 is not None:
+                    self.dither.set_frame16(renderer.frame16)
+                    changed = True
+                elif changed:
+                    self.dither.set_frame(frame)
+            if changed or stale:
+                if self.dither is not None:
+                    frame = self.dither.render()
+                else:
+                    # Copy, since effect frames are reused by the engine
+                    frame = bytes(memoryview(frame).cast("B"))
+                put_latest(self._frames, frame)
+                last_sent[0] = now
+
+        await self._every(interval, step)
+
+    async def _dither_task(self):
+        dither = self.dither
+        render_interval = 1.0 / self.render_rate
+        if self.governor is not None:
+            render_interval = self.governor.render_interval
+
+        def interval():
+            # Full rate only while the frame has fractional channels
+            if dither.dithering:
+                return 1.0 / self.dither_rate
+            return render_interval() if callable(render_interval) else render_interval
+
+        async def step():
+            if dither.dithering:
+                put_latest(self._frames, dither.render())
+        await self._every(interval, step)
+
+    async def _output_task(self):
+        while True:
+            frame = await self._frames.get()
+            if self.governor is not None:
+                self.governor.tick()
+            await self._io(self.client.put_frame, frame)
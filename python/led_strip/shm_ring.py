@@ -0,0 +1,149 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Shared Memory Rings
+--------------------------------------------------------------------------
+
+Single-writer ring buffers of fixed-size slots in
+multiprocessing.shared_memory, used to hand IMU samples and LED frames
+between processes without pickling.
+
+Layout of the shared block:
+
+    Q            head: number of slots ever published
+    slots * (
+        Q        stamp: 0 while the slot is being written, then index + 1
+        slot_size payload
+    )
+
+The writer clears a slot's stamp, writes the payload, sets the stamp to
+the slot's index + 1 and then advances head.  Readers check the stamp
+before and after copying a slot; a changed or unexpected stamp means the
+writer lapped them mid-copy and the read is retried (latest) or counted as
+an overrun (stream).  Copies go into caller-provided buffers, so a handoff
+is one memcpy with no allocation.
+
+Note: CPython gives no memory barriers across processes, so the stamps
+detect torn reads rather than preventing them with hard guarantees; in
+practice on a single writer this is reliable for LED frames and samples.
+
+Requires Python 3.8+ (multiprocessing.shared_memory).  Rings are meant to
+be created by one process and attached by its multiprocessing children,
+which share its resource tracker; the creator calls unlink().
+
+Software API:
+
+  SharedRing(slot_size, slots=8, name=None, create=True)
+    name                  - Pass to other processes to attach
+    write(data)           - Publish a slot (bytes-like of slot_size)
+    read_latest(out)      - Copy the newest slot into out; return its index
+                            or None if nothing has been written
+    read_next(out)        - Copy the next unread slot into out (per reader
+                            position); return its index or None
+    overruns              - Slots this reader missed because it fell behind
+    close(), unlink()
+
+--------------------------------------------------------------------------
+"""
+
+import struct
+from multiprocessing import shared_memory
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+COUNTER = struct.Struct("<Q")
+
+READ_RETRIES = 4
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+class SharedRing(object):
+    """Fixed-slot ring buffer in shared memory with sequence stamps."""
+
+    def __init__(self, slot_size, slots=8, name=None, create=True):
+        self.slot_size = slot_size
+        self.slots = slots
+        self.overruns = 0
+
+        self._stride = COUNTER.size + slot_size
+        size = COUNTER.size + slots * self._stride
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        self._next = 0              # This reader's next index
+        self._owner = create
+
+    def _slot(self, index):
+        return COUNTER.size + (index % self.slots) * self._stride
+
+    @property
+    def head(self):
+        return COUNTER.unpack_from(self._buf, 0)[0]
+
+    def write(self, data):
+        """Publish data as the next slot (single writer only)."""
+        index = self.head
+        offset = self._slot(index)
+        payload = offset + COUNTER.size
+        COUNTER.pack_into(self._buf, offset, 0)
+        self._buf[payload:payload + self.slot_size] = data
+        COUNTER.pack_into(self._buf, offset, index + 1)
+        COUNTER.pack_into(self._buf, 0, index + 1)
+        return index
+
+    def _copy(self, index, out):
+        offset = self._slot(index)
+        payload = offset + COUNTER.size
+        if COUNTER.unpack_from(self._buf, offset)[0] != index + 1:
+            return False
+        out[:self.slot_size] = self._buf[payload:payload + self.slot_size]
+        return COUNTER.unpack_from(self._buf, offset)[0] == index + 1
+
+    def read_latest(self, out):
+        """Copy the newest slot into out; return its index (or None)."""
+        for _ in range(READ_RETRIES):
+            head = self.head
+            if head == 0:
+                return None
+            if self._copy(head - 1, out):
+                self._next = head
+                return head - 1
+        return None
+
+    def read_next(self, out):
+        """Copy this reader's next unread slot into out.
+
+        Returns the slot index, or None if there is nothing new.  If the
+        writer got more than a ring ahead, the missed slots are added to
+        overruns and reading resumes at the oldest slot still held.
+        """
+        while True:
+            head = self.head
+            if self._next >= head:
+                return None
+            if head - self._next > self.slots:
+                self.overruns += head - self.slots - self._next
+                self._next = head - self.slots
+            index = self._next
+            self._next += 1
+            if self._copy(index, out):
+                return index
+            self.overruns += 1
+
+    def close(self):
+        """Detach from the shared block."""
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """Free the shared block (creator only, after every close())."""
+        if self._owner:
+            self._shm.unlink()
+
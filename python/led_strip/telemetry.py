@@ -0,0 +1,376 @@
+"""
+--------------------------------------------------------------------------
+Lightsaber Telemetry
+--------------------------------------------------------------------------
+
+Rate-limited binary telemetry, replacing per-loop print() calls.
+
+Formatting and printing a line on every loop iteration costs more than the
+loop itself on the PocketBeagle's serial console.  Instead, hot paths pack
+a fixed-size binary record into a preallocated ring buffer (one
+struct.pack_into, no allocation, no I/O).  A background thread:
+
+- flushes new records to a sink: a file path, or "unix:/path" for a Unix
+  domain stream socket
+- prints a human readable summary line at most every summary_interval
+  seconds
+
+If the ring buffer is full the newest records are dropped and counted;
+writers never block on I/O.
+
+Record layout (RECORD, little endian, 56 bytes):
+
+    d    time.time() timestamp
+    B    kind (KIND_SAMPLE, KIND_LIGHTS, KIND_EVENT)
+    B    flags (FLAG_CONTACT, FLAG_FLASH)
+    H    code (event code, 0 otherwise)
+    11f  values
+         sample: accel x/y/z (signed), gyro x/y/z, tot_accel, tot_gyro,
+                 comb_accel_gyro, speaker_vol, difference
+         lights: r, g, b
+         event:  event specific
+
+Streams start with FILE_HEADER ("LSTL", version, record size).
+
+Software API:
+
+  Telemetry(sink=None, capacity=4096, flush_interval=0.5,
+            summary_interval=5.0, summary=print)
+    start(), stop()
+    sample(data)             - Record a get_sensor_data() dictionary
+    lights(color, flash)     - Record the color sent to the blade
+    event(code, *values)     - Record a numbered event
+    dropped                  - Number of records dropped (buffer full)
+
+  read_records(path)
+    - Yield decoded records (as dictionaries) from a telemetry file;
+      samples have the same accel_* / accel_*_signed / gyro_* ... fields
+      as get_sensor_data()
+
+Command line:
+
+    python3 telemetry.py decode FILE [--csv]
+    python3 telemetry.py summary FILE
+
+--------------------------------------------------------------------------
+"""
+
+import socket
+import struct
+import threading
+import time
+
+# ------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------
+
+MAGIC = b"LSTL"
+VERSION = 2                         # 2: signed accel x/y/z
+
+RECORD = struct.Struct("<dBBH11f")
+FILE_HEADER = struct.Struct("<4sBBH")
+
+KIND_SAMPLE = 1
+KIND_LIGHTS = 2
+KIND_EVENT = 3
+KIND_NAMES = {KIND_SAMPLE: "sample", KIND_LIGHTS: "lights", KIND_EVENT: "event"}
+
+FLAG_CONTACT = 0x01
+FLAG_FLASH = 0x02
+
+SAMPLE_FIELDS = ("accel_x_signed", "accel_y_signed", "accel_z_signed",
+                 "gyro_x", "gyro_y", "gyro_z", "tot_accel", "tot_gyro",
+                 "comb_accel_gyro", "speaker_vol", "difference")
+ACCEL_FIELDS = ("accel_x", "accel_y", "accel_z")    # abs() of the signed axes
+
+# ------------------------------------------------------------------------
+# Functions / Classes
+# ------------------------------------------------------------------------
+
+def open_sink(sink):
+    """Open a sink ("unix:/path" or a file path) and write the stream header.
+
+    Returns an object with write() and close(), or None if sink is None.
+    """
+    if sink is None:
+        return None
+    header = FILE_HEADER.pack(MAGIC, VERSION, 0, RECORD.size)
+    if sink.startswith("unix:"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(sink[len("unix:"):])
+        stream = sock.makefile("wb")
+        sock.close()
+    else:
+        stream = open(sink, "wb")
+    stream.write(header)
+    return stream
+
+
+class Telemetry(object):
+    """Preallocated telemetry ring buffer with a background flush thread."""
+
+    def __init__(self, sink=None, capacity=4096, flush_interval=0.5,
+                 summary_interval=5.0, summary=print):
+        self.sink = sink
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.summary_interval = summary_interval
+        self.dropped = 0
+
+        self._summary = summary
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._view = memoryview(self._buffer)
+        self._head = 0              # Records written (by the hot paths)
+        self._tail = 0              # Records flushed (by the thread)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stream = None
+        self._reset_window()
+
+    # -----------------------------------------------------
+    # Hot path
+    # -----------------------------------------------------
+
+    def _write(self, kind, flags, code, values):
+        with self._lock:
+            head = self._head
+            if head - self._tail >= self.capacity:
+                self.dropped += 1
+                return
+            RECORD.pack_into(self._buffer, (head % self.capacity) * RECORD.size,
+                             time.time(), kind, flags, code, *values)
+            self._head = head + 1
+
+    def sample(self, data):
+        """Record an IMU sample (a dictionary from get_sensor_data())."""
+        difference = data["difference"]
+        flags = (FLAG_CONTACT if difference >= 1 else 0) | \
+                (FLAG_FLASH if data["flash"] else 0)
+        self._write(KIND_SAMPLE, flags, 0, (
+            data["accel_x_signed"], data["accel_y_signed"], data["accel_z_signed"],
+            data["gyro_x"], data["gyro_y"], data["gyro_z"],
+            data["tot_accel"], data["tot_gyro"], data["comb_accel_gyro"],
+            data["speaker_vol"], difference))
+
+    def lights(self, color, flash=False):
+        """Record the color sent to the blade."""
+        self._write(KIND_LIGHTS, FLAG_FLASH if flash else 0, 0,
+                    (color[0], color[1], color[2]) + (0.0,) * 8)
+
+    def event(self, code, *values):
+        """Record a numbered event with up to 11 values."""
+        values = tuple(values[:11]) + (0.0,) * (11 - len(values[:11]))
+        self._write(KIND_EVENT, 0, code, values)
+
+    # -----------------------------------------------------
+    # Background thread
+    # -----------------------------------------------------
+
+    def start(self):
+        """Open the sink and start the flush thread."""
+        if self._thread is not None:
+            return
+        self._stream = open_sink(self.sink)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Flush what is left, stop the thread and close the sink."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _run(self):
+        next_summary = time.monotonic() + self.summary_interval
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            now = time.monotonic()
+            if now >= next_summary:
+                next_summary = now + self.summary_interval
+                if self._summary is not None:
+                    self._summary(self._summary_line())
+                self._reset_window()
+        self.flush()
+
+    def flush(self):
+        """Write pending records to the sink and add them to the summary."""
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return
+        size = RECORD.size
+        start = (tail % self.capacity) * size
+        end = (head % self.capacity) * size
+        if end > start:
+            chunks = [self._view[start:end]]
+        else:
+            chunks = [self._view[start:], self._view[:end]]
+
+        for chunk in chunks:
+            for record in RECORD.iter_unpack(chunk):
+                self._summarise(record)
+            if self._stream is not None:
+                try:
+                    self._stream.write(chunk)
+                except (OSError, ValueError):
+                    self._stream = None
+        if self._stream is not None:
+            try:
+                self._stream.flush()
+            except (OSError, ValueError):
+                self._stream = None
+        self._tail = head
+
+    # -----------------------------------------------------
+    # Summaries
+    # -----------------------------------------------------
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_records = 0
+        self._window_dropped = self.dropped
+        self._window_contacts = 0
+        self._window_flash_frames = 0
+        self._window_max_difference = 0.0
+        self._window_max_comb = 0.0
+        self._last_sample = None
+        self._last_color = None
+
+    def _summarise(self, record):
+        self._window_records += 1
+        kind, flags = record[1], record[2]
+        if kind == KIND_SAMPLE:
+            self._last_sample = record
+            if flags & FLAG_CONTACT:
+                self._window_contacts += 1
+            self._window_max_difference = max(self._window_max_difference,
+                                              record[14])
+            self._window_max_comb = max(self._window_max_comb, record[12])
+        elif kind == KIND_LIGHTS:
+            self._last_color = record[4:7]
+            if flags & FLAG_FLASH:
+                self._window_flash_frames += 1
+
+    def _summary_line(self):
+        elapsed = max(time.monotonic() - self._window_start, 1e-6)
+        fields = ["telemetry",
+                  "{0:.1f} rec/s".format(self._window_records / elapsed),
+                  "dropped {0}".format(self.dropped - self._window_dropped)]
+        if self._last_sample is not None:
+            s = self._last_sample
+            fields.append("accel {0:.2f} gyro {1:.2f} vol {2:.0f}".format(
+                s[10], s[11], s[13]))
+            fields.append("max comb {0:.2f} max diff {1:.2f} contacts {2}".format(
+                self._window_max_comb, self._window_max_difference,
+                self._window_contacts))
+        if self._last_color is not None:
+            fields.append("color ({0:.0f}, {1:.0f}, {2:.0f}) flash frames {3}".format(
+                self._last_color[0], self._last_color[1], self._last_color[2],
+                self._window_flash_frames))
+        return " | ".join(fields)
+
+
+def decode_record(record):
+    """Turn a RECORD tuple into a dictionary."""
+    timestamp, kind, flags, code = record[:4]
+    values = record[4:]
+    result = {"time": timestamp, "kind": KIND_NAMES.get(kind, kind),
+              "contact": bool(flags & FLAG_CONTACT),
+              "flash": bool(flags & FLAG_FLASH)}
+    if kind == KIND_SAMPLE:
+        result.update(zip(SAMPLE_FIELDS, values))
+        result.update((field, abs(value)) for field, value in zip(ACCEL_FIELDS, values))
+    elif kind == KIND_LIGHTS:
+        result.update(zip(("r", "g", "b"), values[:3]))
+    else:
+        result["code"] = code
+        result["values"] = values
+    return result
+
+
+def read_records(path):
+    """Yield the decoded records of a telemetry file."""
+    with open(path, "rb") as f:
+        magic, version, _, size = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("{0} is not a telemetry file".format(path))
+        if version != VERSION or size != RECORD.size:
+            raise ValueError("Unsupported telemetry version {0} / record size {1}"
+                             .format(version, size))
+        while True:
+            chunk = f.read(size * 1024)
+            chunk = chunk[:len(chunk) - len(chunk) % size]
+            if not chunk:
+                break
+            for record in RECORD.iter_unpack(chunk):
+                yield decode_record(record)
+
+
+# ------------------------------------------------------------------------
+# Main script
+# ------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import csv
+    import sys
+
+    parser = argparse.ArgumentParser(description="Decode lightsaber telemetry")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    decode = commands.add_parser("decode", help="Print every record")
+    decode.add_argument("path")
+    decode.add_argument("--csv", action="store_true", help="Write CSV")
+
+    summary = commands.add_parser("summary", help="Print totals for a file")
+    summary.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "decode":
+        if args.csv:
+            columns = ("time", "kind", "contact", "flash") + SAMPLE_FIELDS + \
+                      ACCEL_FIELDS + ("r", "g", "b", "code", "values")
+            writer = csv.DictWriter(sys.stdout, columns)
+            writer.writeheader()
+            for record in read_records(args.path):
+                writer.writerow(record)
+        else:
+            for record in read_records(args.path):
+                if record["kind"] == "sample":
+                    print("{time:.3f} sample accel ({accel_x_signed:.2f}, "
+                          "{accel_y_signed:.2f}, {accel_z_signed:.2f}) gyro ({gyro_x:.2f}, {gyro_y:.2f}, "
+                          "{gyro_z:.2f}) comb {comb_accel_gyro:.2f} vol "
+                          "{speaker_vol:.0f} diff {difference:.2f} contact "
+                          "{contact} flash {flash}".format(**record))
+                elif record["kind"] == "lights":
+                    print("{time:.3f} lights ({r:.0f}, {g:.0f}, {b:.0f}) "
+                          "flash {flash}".format(**record))
+                else:
+                    print("{0:.3f} event {1} {2}".format(
+                        record["time"], record["code"], record["values"]))
+
+    elif args.command == "summary":
+        counts = {}
+        first = last = None
+        contacts = flashes = 0
+        for record in read_records(args.path):
+            counts[record["kind"]] = counts.get(record["kind"], 0) + 1
+            first = record["time"] if first is None else first
+            last = record["time"]
+            contacts += record["kind"] == "sample" and record["contact"]
+            flashes += record["kind"] == "lights" and record["flash"]
+        duration = (last - first) if first is not None else 0.0
+        print("{0}: {1:.1f} s, {2}, {3} contacts, {4} flash frames".format(
+            args.path, duration,
+            ", ".join("{0} {1}".format(v, k) for k, v in sorted(counts.items())),
+            contacts, flashes))